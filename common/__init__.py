@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""各采集/分析脚本共用的公共模块"""
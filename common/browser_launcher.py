@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+采集脚本共用的浏览器启动器
+
+首次使用时在有界面的浏览器中手动登录一次，把登录态(cookies/localStorage)导出为
+Playwright storage_state 文件：
+    python -m common.browser_launcher login [登录页URL]
+之后各采集脚本通过 open_browser() 导入该文件，以无头模式、无 slow_mo 启动轻量的
+Chromium headless shell，适合在Linux服务器上运行。
+
+通过环境变量配置：
+    DOUDIAN_HEADLESS       是否无头运行，默认1；设为0时使用有界面的持久化用户目录
+    DOUDIAN_PROFILE_DIR    有界面模式/登录时使用的用户数据目录
+    DOUDIAN_STORAGE_STATE  登录态文件路径
+    DOUDIAN_BROWSER_CHANNEL  浏览器渠道（如chrome），默认使用Playwright自带的Chromium
+    DOUDIAN_CHROME_PATH    自定义浏览器可执行文件路径
+"""
+
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BROWSER_DIR = os.path.join(PROJECT_DIR, '.browser')
+
+DEFAULT_PROFILE_DIR = os.environ.get('DOUDIAN_PROFILE_DIR', os.path.join(BROWSER_DIR, 'profile'))
+DEFAULT_STORAGE_STATE = os.environ.get('DOUDIAN_STORAGE_STATE', os.path.join(BROWSER_DIR, 'storage_state.json'))
+DEFAULT_HEADLESS = os.environ.get('DOUDIAN_HEADLESS', '1') != '0'
+BROWSER_CHANNEL = os.environ.get('DOUDIAN_BROWSER_CHANNEL') or None
+CHROME_PATH = os.environ.get('DOUDIAN_CHROME_PATH') or None
+
+DEFAULT_LOGIN_URL = "https://fxg.jinritemai.com/"
+
+# 隐藏自动化特征，避免被页面识别为机器人
+BROWSER_ARGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--disable-features=IsolateOrigins,site-per-process",
+]
+VIEWPORT = {'width': 1280, 'height': 800}
+
+
+def _launch_options(headless):
+    """构造 launch/launch_persistent_context 共用的参数"""
+    options = {'headless': headless, 'args': BROWSER_ARGS}
+    if CHROME_PATH:
+        options['executable_path'] = CHROME_PATH
+    elif BROWSER_CHANNEL:
+        options['channel'] = BROWSER_CHANNEL
+    # 未指定渠道时，无头模式由Playwright自动使用体积更小的chromium-headless-shell
+    # （可通过 playwright install --only-shell chromium 单独安装）
+    return options
+
+
+async def launch_context(playwright, headless=None, storage_state=None, profile_dir=None):
+    """启动浏览器并返回上下文
+
+    无头模式下用普通上下文导入登录态文件，不依赖用户数据目录；
+    有界面模式下使用持久化的用户数据目录，便于手动登录和调试。
+    """
+    headless = DEFAULT_HEADLESS if headless is None else headless
+    storage_state = storage_state or DEFAULT_STORAGE_STATE
+    profile_dir = profile_dir or DEFAULT_PROFILE_DIR
+
+    started_at = time.perf_counter()
+    if headless:
+        if not os.path.exists(storage_state):
+            print(f"⚠️  未找到登录态文件 {storage_state}，请先运行: python -m common.browser_launcher login")
+        browser = await playwright.chromium.launch(**_launch_options(True))
+        context = await browser.new_context(
+            storage_state=storage_state if os.path.exists(storage_state) else None,
+            viewport=VIEWPORT
+        )
+    else:
+        os.makedirs(profile_dir, exist_ok=True)
+        context = await playwright.chromium.launch_persistent_context(
+            user_data_dir=profile_dir,
+            viewport=VIEWPORT,
+            **_launch_options(False)
+        )
+    mode = "无头" if headless else "有界面"
+    print(f"🚀 浏览器启动完成（{mode}模式），耗时 {(time.perf_counter() - started_at) * 1000:.0f}ms")
+    return context
+
+
+async def export_storage_state(context, path=None):
+    """把当前上下文的登录态导出到文件"""
+    path = path or DEFAULT_STORAGE_STATE
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    await context.storage_state(path=path)
+    print(f"💾 登录态已导出到 {path}")
+
+
+async def close_context(context, storage_state=None):
+    """关闭上下文；传入storage_state时先回写登录态，保持cookies最新"""
+    browser = context.browser
+    if storage_state:
+        try:
+            await context.storage_state(path=storage_state)
+        except Exception as e:
+            print(f"⚠️  回写登录态失败: {e}")
+    await context.close()
+    # 普通上下文关闭后浏览器进程仍在，需要单独关闭（持久化上下文的browser为None）
+    if browser is not None:
+        await browser.close()
+
+
+async def get_page(context):
+    """返回上下文中的第一个页面，没有时新建"""
+    if context.pages:
+        return context.pages[0]
+    return await context.new_page()
+
+
+async def timed_goto(page, url, **kwargs):
+    """打开页面并记录加载耗时"""
+    started_at = time.perf_counter()
+    response = await page.goto(url, **kwargs)
+    status = response.status if response else '-'
+    print(f"⏱️  页面加载完成 [{status}] {(time.perf_counter() - started_at) * 1000:.0f}ms: {url[:100]}")
+    return response
+
+
+@asynccontextmanager
+async def open_browser(headless=None, storage_state=None, profile_dir=None):
+    """启动Playwright和浏览器，退出时自动关闭：
+
+        async with open_browser() as context:
+            page = await get_page(context)
+            await timed_goto(page, url)
+    """
+    headless = DEFAULT_HEADLESS if headless is None else headless
+    storage_state = storage_state or DEFAULT_STORAGE_STATE
+    async with async_playwright() as p:
+        context = await launch_context(p, headless, storage_state, profile_dir)
+        try:
+            yield context
+        finally:
+            # 只在无头模式且已有登录态文件时回写，避免有界面调试时覆盖登录态
+            refresh = headless and os.path.exists(storage_state)
+            await close_context(context, storage_state if refresh else None)
+
+
+async def login(url=DEFAULT_LOGIN_URL):
+    """打开有界面的浏览器供手动登录，登录完成后导出登录态"""
+    async with async_playwright() as p:
+        context = await launch_context(p, headless=False)
+        page = await get_page(context)
+        await timed_goto(page, url)
+        print("🔑 请在浏览器中完成登录（抖店/千川/罗盘等需要的站点都可以依次登录）")
+        await asyncio.get_running_loop().run_in_executor(None, input, "✅ 登录完成后按回车导出登录态...")
+        await export_storage_state(context)
+        await context.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'login':
+        asyncio.run(login(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_LOGIN_URL))
+    else:
+        print("用法: python -m common.browser_launcher login [登录页URL]")
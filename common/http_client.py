@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+直连HTTP客户端
+
+回放捕获到的接口请求时，page.request.post 每次都要经过浏览器进程转发。本模块从
+Playwright上下文中一次性导出cookies，之后用带连接池的异步HTTP客户端直接发请求：
+长连接复用、可用时启用HTTP/2、按主机限制并发连接数。长时间的批量采集因此不再依赖
+浏览器，浏览器可以提前关闭。
+
+依赖 httpx（pip install httpx；启用HTTP/2还需 pip install h2），未安装时
+HTTP_CLIENT_AVAILABLE 为False，调用方应退回 page.request。
+
+单独运行本模块时启动一个本地模拟服务器，验证cookies/请求头透传和连接复用：
+    python -m common.http_client
+"""
+
+import asyncio
+import importlib.util
+import json
+import os
+from urllib.parse import urlsplit
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+HTTP_CLIENT_AVAILABLE = httpx is not None
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+# 连接池总连接数和每个主机的最大并发连接数，可通过环境变量调整
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', '20'))
+DEFAULT_MAX_PER_HOST = int(os.environ.get('HTTP_MAX_PER_HOST', '6'))
+DEFAULT_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', '30'))
+
+# 不能从捕获的请求中原样转发的请求头：由客户端根据连接和请求体重新生成，cookie改由cookie jar管理
+_SKIPPED_HEADERS = {'host', 'content-length', 'connection', 'accept-encoding', 'cookie', 'transfer-encoding'}
+
+
+def replayable_headers(headers):
+    """过滤捕获到的请求头，去掉HTTP/2伪首部和需要客户端重新生成的首部"""
+    return {
+        name: value for name, value in (headers or {}).items()
+        if not name.startswith(':') and name.lower() not in _SKIPPED_HEADERS
+    }
+
+
+class ApiResponse:
+    """与Playwright APIResponse用法一致的响应对象：status属性，json()/text()为协程"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status = response.status_code
+        self.url = str(response.url)
+        self.headers = dict(response.headers)
+        self.http_version = response.http_version
+
+    async def json(self):
+        return self._response.json()
+
+    async def text(self):
+        return self._response.text
+
+
+class ApiClient:
+    """带连接池的异步HTTP客户端，post()的参数与 page.request.post 保持一致，可直接替换"""
+
+    def __init__(self, cookies=None, headers=None, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_per_host=DEFAULT_MAX_PER_HOST, http2=None, timeout=DEFAULT_TIMEOUT):
+        if not HTTP_CLIENT_AVAILABLE:
+            raise RuntimeError("未安装httpx，无法使用直连HTTP模式：pip install httpx h2")
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self.max_per_host = max_per_host
+        # 每个主机一个信号量，限制同时打开的连接数
+        self._host_limits = {}
+        self.client = httpx.AsyncClient(
+            cookies=cookies,
+            headers=replayable_headers(headers),
+            http2=self.http2,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            follow_redirects=True,
+        )
+
+    @classmethod
+    async def from_context(cls, context, headers=None, **kwargs):
+        """从Playwright浏览器上下文导出cookies创建客户端"""
+        cookies = httpx.Cookies()
+        for cookie in await context.cookies():
+            cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie.get('path', '/'))
+        client = cls(cookies=cookies, headers=headers, **kwargs)
+        print(f"🔗 已从浏览器导出 {len(cookies.jar)} 个cookie，启用直连HTTP模式"
+              f"（HTTP/2: {'开启' if client.http2 else '未安装h2，使用HTTP/1.1'}，每主机最多 {client.max_per_host} 个连接）")
+        return client
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return limit
+
+    async def request(self, method, url, data=None, headers=None, params=None):
+        """发送请求，data为字符串/字节时作为原始请求体发送"""
+        async with self._host_limit(url):
+            response = await self.client.request(
+                method, url, content=data, params=params, headers=replayable_headers(headers)
+            )
+        return ApiResponse(response)
+
+    async def get(self, url, headers=None, params=None):
+        return await self.request('GET', url, headers=headers, params=params)
+
+    async def post(self, url, data=None, headers=None):
+        return await self.request('POST', url, data=data, headers=headers)
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+# ---------------- 本地模拟服务器自检 ----------------
+
+def _start_mock_server():
+    """启动一个记录连接数和请求头的本地HTTP/1.1服务器，返回 (server, 统计信息)"""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    stats = {'connections': set(), 'requests': 0, 'cookies': set(), 'custom_headers': set()}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # 响应头和响应体分两次写出，关闭Nagle避免与延迟ACK叠加出40ms的等待
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            with lock:
+                stats['connections'].add(self.client_address)
+                stats['requests'] += 1
+                stats['cookies'].add(self.headers.get('Cookie'))
+                stats['custom_headers'].add(self.headers.get('X-Secsdk-Csrf-Token'))
+            payload = json.dumps({'data': {'list': [{'product_id': f"{body.get('shop_id')}-{body.get('page')}"}]}})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+async def _self_check(requests=200):
+    server, stats = _start_mock_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}/business_chance_center/peer_shop_top_sale_goods_info"
+    captured_headers = {
+        ':authority': 'fxg.jinritemai.com', 'content-type': 'application/json',
+        'x-secsdk-csrf-token': 'token-1', 'content-length': '10', 'cookie': 'stale=1',
+    }
+    cookies = httpx.Cookies()
+    cookies.set('sessionid', 'abc', domain='127.0.0.1')
+    loop = asyncio.get_running_loop()
+    try:
+        async with ApiClient(cookies=cookies, headers=captured_headers, max_per_host=4, http2=False) as client:
+            started_at = loop.time()
+            responses = await asyncio.gather(*(
+                client.post(url, data=json.dumps({'shop_id': i % 7, 'page': i}), headers=captured_headers)
+                for i in range(requests)
+            ))
+            elapsed = loop.time() - started_at
+    finally:
+        server.shutdown()
+
+    assert all(response.status == 200 for response in responses)
+    assert (await responses[5].json())['data']['list'][0]['product_id'] == '5-5'
+    assert stats['requests'] == requests
+    assert stats['cookies'] == {'sessionid=abc'}, stats['cookies']
+    assert stats['custom_headers'] == {'token-1'}
+    assert len(stats['connections']) <= 4, stats['connections']
+    print(f"✅ {requests} 个请求全部成功，共使用 {len(stats['connections'])} 个TCP连接，"
+          f"耗时 {elapsed * 1000:.0f}ms（平均 {elapsed / requests * 1000:.2f}ms/请求）")
+    print("✅ cookies和捕获的请求头已透传，伪首部/content-length/旧cookie已过滤")
+
+
+if __name__ == '__main__':
+    if not HTTP_CLIENT_AVAILABLE:
+        print("❌ 未安装httpx：pip install httpx h2")
+    else:
+        asyncio.run(_self_check())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+区间字符串解析
+
+抖店接口把金额、增长率、曝光人数等指标以展示用的区间字符串返回，例如：
+    '¥52 - ¥62'、'¥42'、'¥500-¥750'、'100%-200%'、'-10%--15%'、'1000-2500'、'1万-2.5万'、'-'
+本模块把它们统一解析为数值 (low, high, mid)，供入库、排序和筛选使用。
+"""
+
+import re
+from functools import lru_cache
+
+# 区间分隔符：紧跟在数字、%、万/亿之后的 "-"（前后可有空格），区分于负号
+_SEPARATOR = re.compile(r'(?<=[\d%万亿])\s*-\s*')
+# 单个数值：可选负号、可选货币符号、数字、可选中文单位
+_NUMBER = re.compile(r'(-?)\s*¥?\s*(\d+(?:\.\d+)?)\s*(万|亿)?')
+_UNITS = {'万': 10000, '亿': 100000000}
+
+
+@lru_cache(maxsize=4096)
+def parse_bounds(text):
+    """按书写顺序返回区间中的数值元组，无法解析时返回空元组"""
+    if not text or not isinstance(text, str):
+        return ()
+    bounds = []
+    for part in _SEPARATOR.split(text.strip(), maxsplit=1):
+        match = _NUMBER.search(part)
+        if not match:
+            return ()
+        sign, number, unit = match.groups()
+        value = float(number) * _UNITS.get(unit, 1)
+        bounds.append(-value if sign else value)
+    return tuple(bounds)
+
+
+def parse_range(text):
+    """解析区间字符串，返回 (low, high, mid)，无法解析时返回 (None, None, None)"""
+    bounds = parse_bounds(text)
+    if not bounds:
+        return None, None, None
+    low, high = min(bounds), max(bounds)
+    return low, high, (low + high) / 2
+
+
+def growth_score(text):
+    """根据增长率区间计算排序优先级分数
+
+    以区间书写时的第一个数划分档位：正区间和跨0的区间取下限（如 '-10%-20%' 取 -10），
+    负区间取离0较近的上限（如 '-10%--15%' 取 -10）。
+    >=100% 为3，>=50% 为2，>=20% 为1，>=-15% 为0，其余为-1；无数据为0。
+    """
+    low, high, _ = parse_range(text)
+    if low is None:
+        return 0
+    value = high if high < 0 else low
+    if value >= 100:
+        return 3
+    elif value >= 50:
+        return 2
+    elif value >= 20:
+        return 1
+    elif value >= -15:
+        return 0
+    return -1
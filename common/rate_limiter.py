@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求限速与统计工具
+
+- TokenBucket: 令牌桶限速器，控制每秒发出的请求数
+- AdaptiveBackoff: 根据限流/服务端错误/空数据自适应调整令牌桶速率并退避
+- LatencyStats: 记录请求耗时，输出吞吐量和延迟分位数
+"""
+
+import asyncio
+import math
+import time
+
+
+class TokenBucket:
+    """异步令牌桶限速器"""
+
+    def __init__(self, rate, capacity=None):
+        # rate: 每秒补充的令牌数；capacity: 桶容量（允许的突发请求数）
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        """按流逝的时间补充令牌"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def set_rate(self, rate):
+        """调整令牌补充速率（先按旧速率结算已流逝的时间）"""
+        self._refill()
+        self.rate = float(rate)
+
+    async def acquire(self):
+        """获取一个令牌，令牌不足时等待"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveBackoff:
+    """自适应退避：遇到限流时乘性降速，连续成功后加性恢复"""
+
+    def __init__(self, bucket, min_rate=0.2, max_rate=None, base_delay=1.0, max_delay=30.0):
+        self.bucket = bucket
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else bucket.rate
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.consecutive_failures = 0
+        # 退避截止时间，所有并发任务共享
+        self.paused_until = 0.0
+
+    def on_success(self):
+        """请求成功：重置失败计数，逐步恢复速率"""
+        self.consecutive_failures = 0
+        if self.bucket.rate < self.max_rate:
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.max_rate * 0.1))
+
+    def on_throttle(self):
+        """遇到429/5xx或空数据：速率减半并设置指数退避时间，返回本次退避秒数"""
+        now = time.monotonic()
+        # 退避期内其它在途请求的失败属于同一次限流，不再重复降速
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.consecutive_failures += 1
+        self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+        delay = min(self.max_delay, self.base_delay * (2 ** (self.consecutive_failures - 1)))
+        self.paused_until = now + delay
+        return delay
+
+    async def wait(self):
+        """如果处于退避期，等待退避结束"""
+        remaining = self.paused_until - time.monotonic()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+
+
+class LatencyStats:
+    """记录请求耗时并计算吞吐量与延迟分位数"""
+
+    def __init__(self):
+        self.latencies = []
+        self.started_at = time.monotonic()
+
+    def record(self, seconds):
+        self.latencies.append(seconds)
+
+    def percentile(self, p):
+        """最近秩法计算分位数（秒）"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = max(0, min(len(ordered) - 1, math.ceil(p / 100.0 * len(ordered)) - 1))
+        return ordered[index]
+
+    def throughput_per_minute(self, count):
+        """按运行时长计算每分钟完成数"""
+        elapsed = time.monotonic() - self.started_at
+        return count * 60.0 / elapsed if elapsed > 0 else 0.0
+
+    def summary(self, count, unit="个"):
+        """生成统计摘要文本"""
+        return (
+            f"⚡ 吞吐量: {self.throughput_per_minute(count):.1f} {unit}/分钟 | "
+            f"延迟 p50={self.percentile(50) * 1000:.0f}ms "
+            f"p90={self.percentile(90) * 1000:.0f}ms "
+            f"p99={self.percentile(99) * 1000:.0f}ms "
+            f"(共 {len(self.latencies)} 次请求)"
+        )
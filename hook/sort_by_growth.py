@@ -1,6 +1,11 @@
 import json
 from datetime import datetime
 import os
+import sys
+
+# 复用项目根目录common下的区间解析函数
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.range_parser import parse_range
 
 print("当前工作目录:", os.getcwd())
 print("文件是否存在:", os.path.exists('raw_response_20251026_141657.json'))
@@ -26,45 +31,12 @@ except Exception as e:
 
 # 增长率排序的关键函数
 def growth_rate_key(growth_str):
-    if growth_str == '-':
-        return (-1, 0)  # 没有增长率数据排在最后
-    
-    # 检查是否为负增长
-    is_negative = growth_str.startswith('-')
-    
-    # 处理范围值
-    if '-' in growth_str and (is_negative and growth_str.count('-') > 1 or not is_negative):
-        # 提取数字部分
-        try:
-            # 对于负增长，格式可能是 "-10%--15%"
-            if is_negative:
-                # 去掉开头的负号和最后的百分号，然后分割
-                parts = growth_str[1:-1].split('--')
-                low = float(parts[0])
-                high = float(parts[1])
-                # 负增长取较低的负值（更负）作为排序依据
-                avg = (low + high) / 2
-                return (-2, avg)  # 负增长排在没有数据之前
-            else:
-                # 对于正增长，格式是 "100%-200%"
-                parts = growth_str[:-1].split('-')
-                low = float(parts[0])
-                high = float(parts[1])
-                # 正增长取较高的值作为排序依据
-                avg = (low + high) / 2
-                return (1, -avg)  # 注意这里用负值，因为Python的sort是升序
-        except:
-            return (-1, 0)
-    else:
-        # 单个值的情况
-        try:
-            value = float(growth_str.replace('%', ''))
-            if value < 0:
-                return (-2, value)  # 负增长
-            else:
-                return (1, -value)  # 正增长，用负值实现降序
-        except:
-            return (-1, 0)
+    low, high, mid = parse_range(growth_str)
+    if mid is None:
+        return (-1, 0)  # 没有增长率数据排在正增长之后
+    if mid < 0:
+        return (-2, mid)  # 负增长排在最后，降幅越小越靠前
+    return (1, -mid)  # 注意这里用负值，因为Python的sort是升序
 
 # 按增长率排序
 products_sorted = sorted(products, key=lambda x: growth_rate_key(x['pay_amount_growth_rate']), reverse=True)
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '竞品分析脚本')
+
+# 在子进程中把pandas标记为不可导入，模拟未安装pandas的环境
+WITHOUT_PANDAS = """
+import sys
+sys.modules['pandas'] = None
+sys.path.insert(0, {script_dir!r})
+import product_db, analysis_cli
+product_db.connect({db_path!r}).close()
+sys.exit(analysis_cli.main({argv!r}))
+"""
+
+
+def run_without_pandas(tmp_path, argv):
+    db_path = str(tmp_path / 'product_data.db')
+    code = WITHOUT_PANDAS.format(script_dir=SCRIPT_DIR, db_path=db_path, argv=['--db', db_path] + argv)
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=str(tmp_path))
+
+
+def test_queries_do_not_need_pandas(tmp_path):
+    for argv in (['top'], ['shops', '--format', 'json'], ['export', '--format', 'csv']):
+        result = run_without_pandas(tmp_path, argv)
+        assert result.returncode == 0, result.stderr
+
+
+def test_trends_still_reports_missing_pandas(tmp_path):
+    result = run_without_pandas(tmp_path, ['trends'])
+    assert result.returncode != 0
+    assert 'pandas' in result.stderr
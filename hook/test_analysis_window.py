@@ -0,0 +1,58 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '竞品分析脚本'))
+import analyze_data
+import product_db
+
+
+def create_database(tmp_path):
+    db_path = str(tmp_path / 'product_data.db')
+    conn = product_db.connect(db_path)
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute("INSERT INTO shops (shop_id, shop_name) VALUES ('s1', '店铺1')")
+    conn.execute(
+        "INSERT INTO products (product_id, product_name, shop_id, query_dims, pay_amount_growth_rate, "
+        "growth_low, growth_high, growth_mid, captured_at, last_seen_at) "
+        "VALUES ('p1', '产品1', 's1', '', '10%', 10, 10, 10, ?, ?)",
+        (now, now)
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def test_days_come_from_date_filter(tmp_path):
+    db_path = create_database(tmp_path)
+    for days in (1, 7, 0.5):
+        with analyze_data.AnalysisContext(db_path, cache_dir='', date_filter=analyze_data.get_date_filter(days)) as context:
+            assert context.days == days
+
+
+def test_texts_follow_days_and_top_n(tmp_path, monkeypatch, capsys):
+    db_path = create_database(tmp_path)
+    monkeypatch.setattr(analyze_data, 'SCRIPT_DIR', str(tmp_path))
+    with analyze_data.AnalysisContext(db_path, cache_dir='', date_filter=analyze_data.get_date_filter(7)) as context:
+        analyze_data.analyze_top_growth_products(top_n=3, context=context)
+        analyze_data.generate_markdown_report(context, top_n=3)
+    output = capsys.readouterr().out
+    assert '最近7天增长速度率最高的前3个产品' in output
+    [report_file] = tmp_path.glob('产品分析报告_*.txt')
+    report = report_file.read_text(encoding='utf-8')
+    assert '最近7天采集的数据' in report and '根据对最近7天产品数据的分析' in report
+    assert '平台增长率TOP3产品' in report and '跨店铺同款产品TOP3' in report
+    assert '最近1天' not in report and 'TOP5' not in report
+
+
+def test_results_are_not_shared_between_callers(tmp_path):
+    db_path = create_database(tmp_path)
+    with analyze_data.AnalysisContext(db_path, cache_dir='', date_filter=analyze_data.get_date_filter(1)) as context:
+        first = context.top_growth_products(5)
+        first[0]['pic'] = 'report_assets/thumbnails/x.jpg'
+        first[0]['qr_code'] = 'report_assets/qr/x.png'
+        shops = context.top_growth_by_shop(5)
+        shops['s1']['products'].clear()
+        second = context.top_growth_products(5)
+        assert second[0]['pic'] is None and second[0]['qr_code'] == ''
+        assert len(context.top_growth_by_shop(5)['s1']['products']) == 1
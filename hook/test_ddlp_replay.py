@@ -0,0 +1,108 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '罗盘数据分析'))
+pytest.importorskip('aiosqlite')
+pytest.importorskip('playwright.async_api')
+import ddlp
+
+TEMPLATE = {'url': 'https://example.com/list?page_no=1', 'method': 'GET', 'headers': {}, 'post_data': None}
+
+
+def card(product_id):
+    return {'cell_info': {'product': {'product_id_value': {'value': {'value_str': product_id}}}}}
+
+
+def page(*product_ids):
+    return {'data': {'list': [card(product_id) for product_id in product_ids]}}
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.status = 200
+        self._data = data
+
+    async def json(self):
+        if isinstance(self._data, Exception):
+            raise self._data
+        return self._data
+
+
+def fake_client(responses):
+    """按顺序返回responses中的响应数据，用完后返回空页"""
+    class FakeClient:
+        requested = []
+
+        @classmethod
+        async def from_context(cls, context, headers=None):
+            return cls()
+
+        async def request(self, method, url, data=None, headers=None):
+            self.requested.append(url)
+            index = len(self.requested) - 1
+            return FakeResponse(responses[index] if index < len(responses) else {'data': {'list': []}})
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc_info):
+            pass
+
+    return FakeClient
+
+
+@pytest.fixture
+def replay(monkeypatch, tmp_path):
+    """用给定的首屏商品和回放响应运行 collect_card_list，返回 (回放商品数, 请求数, 入库的商品ID, 文件中的商品ID)"""
+    saved = []
+
+    async def save_products_to_db(products_data):
+        saved.extend(ddlp.card_product_id(product) for product in products_data)
+
+    output_file = str(tmp_path / 'ddlp.txt')
+    monkeypatch.setattr(ddlp, 'HTTP_CLIENT_AVAILABLE', True)
+    monkeypatch.setattr(ddlp, 'OUTPUT_FILE', output_file)
+    monkeypatch.setattr(ddlp, 'save_products_to_db', save_products_to_db)
+    monkeypatch.setattr(ddlp, 'card_list_template', TEMPLATE)
+    monkeypatch.setattr(ddlp, 'captured_products', [])
+
+    def run(first_page, responses):
+        client = fake_client(responses)
+        monkeypatch.setattr(ddlp, 'ApiClient', client)
+
+        async def main():
+            await ddlp.process_product_card_data(first_page)
+            return await ddlp.collect_card_list(None)
+
+        replayed = asyncio.run(main())
+        with open(output_file, encoding='utf-8') as f:
+            written = [ddlp.card_product_id(product) for product in json.loads(f'[{f.read()}]')]
+        return replayed, len(client.requested), saved, written
+
+    return run
+
+
+def test_file_holds_all_pages(replay):
+    replayed, requests, saved, written = replay(page('p1', 'p2'), [page('p3', 'p4'), page('p5')])
+    assert replayed == 3
+    assert requests == 3
+    assert saved == written == ['p1', 'p2', 'p3', 'p4', 'p5']
+
+
+def test_replay_stops_on_repeated_page(replay):
+    # 接口忽略页码参数，每页都返回第一页
+    replayed, requests, saved, written = replay(page('p1', 'p2'), [page('p1', 'p2')] * 5)
+    assert replayed == 0
+    assert requests == 1
+    assert saved == written == ['p1', 'p2']
+
+
+def test_replay_stops_on_bad_page_and_keeps_earlier_pages(replay):
+    replayed, requests, saved, written = replay(page('p1'), [page('p2'), ValueError('not json'), page('p3')])
+    assert replayed == 1
+    assert requests == 2
+    assert saved == written == ['p1', 'p2']
@@ -0,0 +1,58 @@
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '竞品分析脚本'))
+import generate_html_report
+
+
+def render(top_products=(), **kwargs):
+    out = io.StringIO()
+    generate_html_report.render_html_report(
+        out, top_products, {}, [], '2026-03-31 08:00:00', '20260331', **kwargs
+    )
+    return out.getvalue()
+
+
+def test_report_shows_analysis_window():
+    html = render(days=7)
+    assert html.count('最近7天') == 3
+    assert '最近1天' not in html
+    assert '最近0.5天' in render(days=0.5)
+
+
+def test_tables_have_static_first_page():
+    products = [
+        {
+            'shop_name': '店铺', 'name': f'<产品{i}>', 'growth_rate': '10%', 'pic': 'javascript:alert(1)',
+            'qr_code': None, 'id': f'p{i}', 'growth_value': 10,
+        }
+        for i in range(generate_html_report.STATIC_ROW_COUNT + 5)
+    ]
+    html = render(top_products=products)
+    tbody = html[html.index('<tbody>'):html.index('</tbody>')]
+    assert tbody.count('<tr') == generate_html_report.STATIC_ROW_COUNT
+    assert '&lt;产品0&gt;' in tbody and 'javascript:' not in tbody
+    assert f'仅显示前 {generate_html_report.STATIC_ROW_COUNT} / {len(products)} 行' in html
+
+
+def test_table_rows_are_written_in_chunks():
+    class Output(io.StringIO):
+        writes = 0
+
+        def write(self, text):
+            self.writes += 1
+            return super().write(text)
+
+    count = generate_html_report.JSON_CHUNK_ROWS * 2 + 1
+    rows = ((i, '</script>', 1, 2, '3', '4%', '店铺', i, 0.04) for i in range(count))
+    out = Output()
+    generate_html_report.write_data_table(out, generate_html_report.CLUSTER_COLUMNS, rows)
+    html = out.getvalue()
+    # 表头、三批行数据、表尾
+    assert out.writes == 5
+    data = html[html.index('class="table-data">') + len('class="table-data">'):html.index('</script>')]
+    payload = json.loads(data)
+    assert len(payload['rows']) == count
+    assert payload['rows'][0][:2] == [0, '</script>']
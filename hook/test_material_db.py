@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import sys
+
+# 素材数据库模块在项目根目录的 素材统计脚本 下
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '素材统计脚本'))
+import material_db
+
+
+def material(material_id=None, name=None, roi=1.0):
+    dimensions = {}
+    if material_id is not None:
+        dimensions['roi2MaterialId'] = {'value': material_id}
+    if name is not None:
+        dimensions['roi2MaterialVideoName'] = {'valueStr': name}
+    return {'dimensions': dimensions, 'metrics': {'totalPrepayAndPayOrderRoi2': {'value': roi}}}
+
+
+def test_materials_are_keyed_by_id(tmp_path):
+    conn = material_db.connect(str(tmp_path / 'material_stats.db'))
+    rows = [
+        # 同名的不同视频
+        material('1', '同名视频', 1.0),
+        material('2', '同名视频', 2.0),
+        # 没有名称的素材
+        material('3', None, 3.0),
+        material('4', None, 4.0),
+        # 没有ID时按名称区分
+        material(None, '视频A', 5.0),
+        material(None, '视频B', 6.0),
+        # 既没有ID也没有名称时按维度区分
+        {'dimensions': {'roi2MaterialVideoVid': {'valueStr': 'v7'}}, 'metrics': {}},
+        {'dimensions': {'roi2MaterialVideoVid': {'valueStr': 'v8'}}, 'metrics': {}},
+    ]
+    saved = material_db.save_material_stats(conn, '100', rows, '2026-01-01 10:00:00', '2026-01-01')
+    stored = conn.execute("SELECT COUNT(*) FROM material_stats").fetchone()[0]
+    assert saved == stored == 8
+
+    # 同名的不同视频各有一个素材键，历史ROI不会合并
+    assert material_db.find_material_keys(conn, '同名视频') == ['id:1', 'id:2']
+    assert material_db.find_material_keys(conn, '3') == ['id:3']
+    assert material_db.find_material_keys(conn, 'name:视频A') == ['name:视频A']
+    history = material_db.roi_history(conn, 'id:1')
+    assert [roi for _, _, _, roi, _, _, _ in history] == [1.0]
+
+
+def test_roi_history_reads_key_index(tmp_path):
+    conn = material_db.connect(str(tmp_path / 'material_stats.db'))
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN " + material_db.ROI_HISTORY_SQL, {'material_key': 'id:1', 'plan_ad_id': None}
+    ).fetchall()
+    assert any('COVERING INDEX idx_material_stats_key_ts' in row[-1] for row in plan)
+
+
+def test_rewrite_of_same_capture_replaces_rows(tmp_path):
+    conn = material_db.connect(str(tmp_path / 'material_stats.db'))
+    ts = '2026-01-01 10:00:00'
+    material_db.save_material_stats(conn, '100', [material('1', 'A', 1.0)], ts, '2026-01-01')
+    # 同一次捕获中重复出现的素材只保留最后一条，返回的数量与实际保存的一致
+    saved = material_db.save_material_stats(conn, '100', [material('1', 'A', 2.0), material('1', 'A', 3.0)], ts, '2026-01-01')
+    assert saved == 1
+    assert conn.execute("SELECT roi FROM material_stats").fetchall() == [(3.0,)]
+
+
+def test_v1_database_is_migrated(tmp_path):
+    db_path = str(tmp_path / 'material_stats.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE material_stats (id INTEGER PRIMARY KEY AUTOINCREMENT, plan_ad_id TEXT NOT NULL, "
+        "material_name TEXT NOT NULL, ts TIMESTAMP NOT NULL, stat_date TEXT, cost REAL, gmv REAL, orders INTEGER, "
+        "roi REAL, show INTEGER, click INTEGER, ctr REAL, convert_rate REAL, dimensions TEXT, metrics TEXT)"
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX idx_material_stats_plan_material_ts ON material_stats(plan_ad_id, material_name, ts)"
+    )
+    conn.execute("INSERT INTO material_stats (plan_ad_id, material_name, ts) VALUES ('100', 'A', 't')")
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+
+    conn = material_db.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == material_db.SCHEMA_VERSION
+    assert conn.execute("SELECT material_key FROM material_stats").fetchall() == [('name:A',)]
+    # 旧的按名称唯一的索引已删除，同名的不同素材可以同时保存
+    material_db.save_material_stats(conn, '100', [material('1', 'A'), material('2', 'A')], 't', 'd')
+    assert conn.execute("SELECT COUNT(*) FROM material_stats").fetchone()[0] == 3
+
+
+def test_v2_name_index_is_replaced(tmp_path):
+    db_path = str(tmp_path / 'material_stats.db')
+    conn = material_db.connect(db_path)
+    conn.execute('DROP INDEX idx_material_stats_key_ts')
+    conn.execute('CREATE INDEX idx_material_stats_material_ts ON material_stats(material_name, ts)')
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+    conn.close()
+
+    conn = material_db.connect(db_path)
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(material_stats)")}
+    assert 'idx_material_stats_material_ts' not in indexes
+    assert 'idx_material_stats_key_ts' in indexes
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == material_db.SCHEMA_VERSION
@@ -0,0 +1,180 @@
+import base64
+import hashlib
+import os
+import sqlite3
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, '竞品分析脚本'))
+sys.path.insert(0, ROOT)
+import product_db
+from common.range_parser import growth_score, parse_range
+
+PNG = b'\x89PNG\r\n\x1a\nqr'
+QR_CODE = product_db.PNG_DATA_URI_PREFIX + base64.b64encode(PNG).decode('ascii')
+GROWTH_RATES = ['100%-200%', '50%-100%', '20%-50%', '-10%--15%', '-20%--30%', '-10%-20%', '-30%-60%', '', None]
+
+
+def create_legacy_database(tmp_path):
+    """重构前 jp.py 创建的表结构：二维码内联、区间只有字符串、没有快照指纹和查询维度"""
+    path = str(tmp_path / 'product_data.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id TEXT,
+            product_name TEXT,
+            product_pic TEXT,
+            price_range TEXT,
+            pay_amount TEXT,
+            pay_amount_growth_rate TEXT,
+            impressions_people_num TEXT,
+            shop_id TEXT,
+            captured_at TIMESTAMP,
+            qr_code TEXT
+        )
+    ''')
+    conn.executemany(
+        "INSERT INTO products (product_id, product_name, price_range, pay_amount, pay_amount_growth_rate, "
+        "impressions_people_num, shop_id, captured_at, qr_code) VALUES (?, ?, '10-20', '1万-2.5万', ?, '100-200', "
+        "'s1', '2026-03-01 08:00:00', ?)",
+        [(f'p{i}', f'产品{i}', rate, QR_CODE) for i, rate in enumerate(GROWTH_RATES)]
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def index_names(conn):
+    return {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_qr_codes_move_to_blobs(tmp_path):
+    path = create_legacy_database(tmp_path)
+    conn = product_db.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == product_db.SCHEMA_VERSION
+    # v1：二维码按内容哈希存入blobs表，相同图片只存一份
+    qr_hash = hashlib.sha256(PNG).hexdigest()
+    assert set(conn.execute("SELECT qr_code, qr_code_hash FROM products")) == {(None, qr_hash)}
+    assert conn.execute("SELECT hash, bytes FROM blobs").fetchall() == [(qr_hash, PNG)]
+    conn.close()
+
+    # 再次打开时不重复迁移
+    conn = product_db.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == 1
+    conn.close()
+
+
+def test_range_columns_are_backfilled(tmp_path):
+    conn = product_db.connect(create_legacy_database(tmp_path))
+    rows = conn.execute("SELECT pay_amount_growth_rate, growth_low, growth_high, growth_mid, growth_score FROM products")
+    for rate, low, high, mid, score in rows:
+        # v2：区间数值列；生成列的增长率分数与Python实现一致
+        assert (low, high, mid) == parse_range(rate)
+        assert score == growth_score(rate)
+    assert conn.execute("SELECT pay_amount_low, pay_amount_high FROM products LIMIT 1").fetchone() == (10000, 25000)
+    conn.close()
+
+
+def test_growth_score_takes_first_written_bound():
+    # 跨0的区间取书写时的第一个数（下限），与重构前的排序一致
+    assert growth_score('-10%-20%') == 0
+    assert growth_score('-30%-60%') == -1
+    assert growth_score('-10%--15%') == 0
+    assert growth_score('20%-50%') == 1
+
+
+def test_version_7_rebuilds_growth_columns(tmp_path):
+    """版本7的生成列对跨0的区间取上限，升级后按新表达式重新计算"""
+    path = str(tmp_path / 'product_data.db')
+    conn = product_db.connect(path)
+    conn.execute('DROP INDEX idx_products_last_seen_growth_dims')
+    conn.execute('ALTER TABLE products DROP COLUMN growth_score')
+    conn.execute('ALTER TABLE products DROP COLUMN growth_value')
+    old_value = "COALESCE(CASE WHEN growth_low >= 0 THEN growth_low ELSE growth_high END, 0)"
+    conn.execute(f"ALTER TABLE products ADD COLUMN growth_value REAL GENERATED ALWAYS AS ({old_value}) VIRTUAL")
+    conn.execute(
+        "ALTER TABLE products ADD COLUMN growth_score INTEGER GENERATED ALWAYS AS "
+        f"({product_db.GROWTH_SCORE_SQL.replace(product_db.GROWTH_VALUE_SQL, old_value)}) VIRTUAL"
+    )
+    conn.execute(
+        'CREATE INDEX idx_products_last_seen_growth_dims '
+        'ON products(last_seen_at, growth_score, growth_value, product_id, query_dims)'
+    )
+    conn.execute("INSERT INTO products (product_id, growth_low, growth_high) VALUES ('p1', -10, 20)")
+    conn.execute("PRAGMA user_version = 7")
+    conn.commit()
+    assert conn.execute("SELECT growth_value, growth_score FROM products").fetchone() == (20, 1)
+    conn.close()
+
+    conn = product_db.connect(path)
+    assert conn.execute("SELECT growth_value, growth_score FROM products").fetchone() == (-10, 0)
+    assert 'idx_products_last_seen_growth_dims' in index_names(conn)
+    conn.close()
+
+
+def test_snapshot_columns_are_backfilled(tmp_path):
+    conn = product_db.connect(create_legacy_database(tmp_path))
+    rows = conn.execute(
+        f"SELECT fingerprint, last_seen_at, captured_at, query_dims, {', '.join(product_db.FINGERPRINT_COLUMNS)} "
+        "FROM products"
+    ).fetchall()
+    assert len(rows) == len(GROWTH_RATES)
+    for fingerprint, last_seen_at, captured_at, query_dims, *values in rows:
+        # v3：快照指纹，旧记录以采集时间作为最后出现时间
+        assert fingerprint == product_db.snapshot_fingerprint(*values)
+        assert last_seen_at == captured_at
+        assert query_dims == ''
+    conn.close()
+
+
+def test_query_dims_index_replaces_shop_product_index(tmp_path):
+    path = create_legacy_database(tmp_path)
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE INDEX idx_products_shop_product ON products(shop_id, product_id, id)')
+    conn.close()
+
+    conn = product_db.connect(path)
+    # v4：最新快照索引增加了查询维度列
+    indexes = index_names(conn)
+    assert 'idx_products_shop_product_dims' in indexes and 'idx_products_shop_product' not in indexes
+    conn.close()
+
+
+def test_growth_index_replaces_last_seen_index(tmp_path):
+    path = create_legacy_database(tmp_path)
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE INDEX idx_products_last_seen_at ON products(captured_at)')
+    conn.close()
+
+    conn = product_db.connect(path)
+    # v5：单列的最后出现时间索引被增长率覆盖索引取代
+    indexes = index_names(conn)
+    assert 'idx_products_last_seen_growth_dims' in indexes and 'idx_products_last_seen_at' not in indexes
+    conn.close()
+
+
+def test_legacy_products_are_clustered(tmp_path):
+    conn = product_db.connect(create_legacy_database(tmp_path))
+    # v6：每个产品都分配了聚类
+    assert conn.execute("SELECT COUNT(*) FROM product_clusters").fetchone()[0] == len(GROWTH_RATES)
+    conn.close()
+
+
+def test_version_6_drops_growth_index_without_query_dims(tmp_path):
+    path = str(tmp_path / 'product_data.db')
+    conn = product_db.connect(path)
+    conn.execute('CREATE INDEX idx_products_last_seen_growth ON products(last_seen_at, growth_score, growth_value)')
+    conn.execute("PRAGMA user_version = 6")
+    conn.commit()
+    conn.close()
+
+    conn = product_db.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == product_db.SCHEMA_VERSION
+    assert 'idx_products_last_seen_growth' not in index_names(conn)
+    plan = ' '.join(row[-1] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT product_id FROM products "
+        "WHERE last_seen_at >= '2026-03-01' AND growth_score >= 0 AND +query_dims = ''"
+    ))
+    assert 'idx_products_last_seen_growth_dims' in plan
+    conn.close()
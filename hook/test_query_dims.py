@@ -0,0 +1,76 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '竞品分析脚本'))
+import analyze_data
+import product_db
+import report_site
+
+DAY_1 = '{"date_type": 1}'
+DAY_7 = '{"date_type": 7}'
+
+
+def create_database(tmp_path):
+    """两个店铺的两个产品，只有 jp.py 扫描出的1天和7天两个查询维度，两个维度下的增长率排名相反"""
+    db_path = str(tmp_path / 'product_data.db')
+    conn = product_db.connect(db_path)
+    today = datetime.date.today().isoformat()
+    conn.executemany("INSERT INTO shops (shop_id, shop_name) VALUES (?, ?)", [('s1', '店铺1'), ('s2', '店铺2')])
+    rows = [
+        ('p1', 's1', DAY_1, 200), ('p1', 's1', DAY_7, 10),
+        ('p2', 's2', DAY_1, 50), ('p2', 's2', DAY_7, 300),
+    ]
+    conn.executemany(
+        "INSERT INTO products (product_id, product_name, shop_id, query_dims, pay_amount_growth_rate, "
+        "growth_low, growth_high, growth_mid, pay_amount_mid, captured_at, last_seen_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 100, ?, ?)",
+        [
+            (product_id, f'产品{product_id}', shop_id, query_dims, f'{growth}%', growth, growth, growth,
+             f'{today} 08:00:00', f'{today} 09:00:00')
+            for product_id, shop_id, query_dims, growth in rows
+        ]
+    )
+    conn.executemany("INSERT INTO product_clusters (product_id, cluster_id) VALUES (?, 1)", [('p1',), ('p2',)])
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def ranking(db_path, query_dims):
+    with analyze_data.AnalysisContext(db_path, cache_dir='', date_filter='2000-01-01', query_dims=query_dims) as context:
+        top = [(product['id'], product['growth_rate']) for product in context.top_growth_products(5)]
+        by_shop = {
+            shop_id: [(product['id'], product['growth_rate']) for product in shop['products']]
+            for shop_id, shop in context.top_growth_by_shop(5).items()
+        }
+        clusters = context.top_clusters(5, min_shops=2)
+        return context.query_dims, top, by_shop, clusters
+
+
+def test_primary_query_dims_defaults_to_smallest_sweep_value(tmp_path):
+    db_path = create_database(tmp_path)
+    query_dims, top, by_shop, clusters = ranking(db_path, None)
+    assert query_dims == DAY_1
+    # 每个产品只取同一查询维度的快照，不会把7天的300%和1天的200%混在一起排名
+    assert top == [('p1', '200%'), ('p2', '50%')]
+    assert by_shop == {'s1': [('p1', '200%')], 's2': [('p2', '50%')]}
+    assert len(clusters) == 1 and clusters[0]['shop_count'] == 2
+
+
+def test_configured_query_dims(tmp_path):
+    db_path = create_database(tmp_path)
+    query_dims, top, by_shop, _ = ranking(db_path, DAY_7)
+    assert query_dims == DAY_7
+    assert top == [('p2', '300%'), ('p1', '10%')]
+    assert by_shop == {'s1': [('p1', '10%')], 's2': [('p2', '300%')]}
+
+
+def test_site_uses_primary_query_dims(tmp_path):
+    db_path = create_database(tmp_path)
+    conn = analyze_data.open_read_only(db_path)
+    today = datetime.date.today().isoformat()
+    day_stats, shop_stats = report_site.scan_inputs(conn, [today], analyze_data.primary_query_dims(conn, None))
+    conn.close()
+    assert day_stats[today][0] == 2
+    assert sorted(shop_stats) == ['s1', 's2']
@@ -0,0 +1,42 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '竞品分析脚本'))
+import product_db
+import report_site
+
+END_DAY = datetime.date(2026, 3, 31)
+
+
+def day(offset):
+    return (END_DAY - datetime.timedelta(days=offset)).isoformat()
+
+
+def create_database(tmp_path):
+    """店铺s1每天都在采集，店铺s2只在窗口中间有过一条快照"""
+    db_path = str(tmp_path / 'product_data.db')
+    conn = product_db.connect(db_path)
+    conn.executemany("INSERT INTO shops (shop_id, shop_name) VALUES (?, ?)", [('s1', '店铺1'), ('s2', '店铺2')])
+    conn.executemany(
+        "INSERT INTO products (product_id, product_name, shop_id, query_dims, pay_amount_growth_rate, "
+        "growth_low, growth_high, growth_mid, captured_at, last_seen_at) VALUES (?, ?, ?, '', '10%', 10, 10, 10, ?, ?)",
+        [
+            ('p1', '产品1', 's1', f'{day(5)} 08:00:00', f'{day(-1)} 08:00:00'),
+            ('p2', '产品2', 's2', f'{day(4)} 08:00:00', f'{day(3)} 08:00:00'),
+        ]
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def test_shop_page_unchanged_when_window_moves(tmp_path):
+    db_path = create_database(tmp_path)
+    site_dir = str(tmp_path / 'site')
+    build = lambda end_day: report_site.build_site(db_path, site_dir, days=7, workers=1, end_day=end_day)
+    assert build(day(1)) == (7, 0)  # 5个日报 + 2个店铺页
+    # 窗口后移一天：新增当天的日报，前一天的日报多了导航链接，仍在采集的店铺s1的页面多了一天，s2的页面不变
+    assert build(day(0)) == (3, 5)
+    with open(os.path.join(site_dir, report_site.shop_page('s2')), encoding='utf-8') as f:
+        assert f'{day(4)} 至 {day(3)}' in f.read()
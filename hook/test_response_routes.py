@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '竞品分析脚本'))
+import response_routes
+from response_routes import PRODUCTS, SHOP_LIST, _legacy_capture, _route_capture, match_route
+
+BASE = 'https://fxg.jinritemai.com'
+SHOP_LIST_URL = f'{BASE}/ffa/mshop/get_sub_peer_shop_list?_lid=123'
+PRODUCTS_URL = f'{BASE}/business_chance_center/peer_shop_top_sale_goods_info?shop_id=1'
+PRODUCTS_LIST = [{'product_id': '1'}]
+
+# 重构前的实现支持的其它响应结构
+EXTRA_SAMPLES = [
+    (SHOP_LIST_URL, {'peer_shop_list': [{'shop_id': '1'}]}),
+    (SHOP_LIST_URL, {'data': {'list': [{'shop_id': '1'}]}}),
+    (SHOP_LIST_URL, {'data': {'list': []}}),
+    (SHOP_LIST_URL, None),
+    (PRODUCTS_URL, {'data': PRODUCTS_LIST}),
+    (PRODUCTS_URL, {'data': {'product_list': PRODUCTS_LIST}}),
+    (PRODUCTS_URL, {'product_list': PRODUCTS_LIST}),
+    (PRODUCTS_URL, {'data': None}),
+    (f'{BASE}/ffa/static/js/peer_shop_list.js', None),
+]
+
+
+@pytest.mark.parametrize('url, data', response_routes.benchmark_samples() + EXTRA_SAMPLES)
+def test_route_table_matches_legacy_capture(url, data):
+    assert _route_capture(url, data) == _legacy_capture(url, data)
+
+
+def test_match_route():
+    assert match_route(SHOP_LIST_URL).name == SHOP_LIST
+    assert match_route(PRODUCTS_URL).name == PRODUCTS
+    assert match_route(f'{BASE}/ffa/static/js/chunk-1.js') is None
@@ -0,0 +1,40 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '素材统计脚本'))
+pytest.importorskip('playwright.async_api')
+import roi_sucai
+
+
+def template(body, url='https://example.com/uni-promotion/material/list-required?aavid=1'):
+    return {'url': url, 'method': 'POST', 'headers': {}, 'body': body, 'post_data': json.dumps(body)}
+
+
+def test_only_top_level_and_pager_fields_are_rewritten():
+    body = {
+        'filter': {'page': 7, 'limit': 3, 'p': 1},
+        'page_info': {'page': 1, 'pageSize': '10'},
+    }
+    assert roi_sucai.template_pagination(template(body)) == (1, 10)
+    _, post_data = roi_sucai.build_page_request(template(body), 3, 100)
+    assert json.loads(post_data) == {
+        'filter': {'page': 7, 'limit': 3, 'p': 1},
+        'page_info': {'page': 3, 'pageSize': '100'},
+    }
+
+
+def test_unknown_nested_fields_are_not_pager_fields():
+    body = {'adId': '5', 'filter': {'pageNo': 2, 'pageSize': 20}}
+    assert roi_sucai.template_pagination(template(body)) == (None, None)
+    _, post_data = roi_sucai.build_page_request(template(body), 3, 100)
+    assert json.loads(post_data) == body
+
+
+def test_query_string_pager_fields():
+    url = 'https://example.com/uni-promotion/material/list-required?p=9&page=1&pageSize=10'
+    assert roi_sucai.template_pagination(template(None, url)) == (1, 10)
+    new_url, _ = roi_sucai.build_page_request(template(None, url), 3, 100)
+    assert new_url.endswith('?p=9&page=3&pageSize=100')
@@ -0,0 +1,56 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '竞品分析脚本'))
+import product_db
+import trend_analysis
+
+TODAY = datetime.date(2026, 3, 31)
+
+
+def day(offset):
+    return (TODAY - datetime.timedelta(days=offset)).isoformat()
+
+
+def create_database(tmp_path, snapshots):
+    """snapshots为 (店铺ID, 产品ID, 支付金额, 采集于N天前, 最后出现于N天前)"""
+    conn = product_db.connect(str(tmp_path / 'product_data.db'))
+    conn.executemany(
+        "INSERT INTO products (shop_id, product_id, query_dims, pay_amount_mid, captured_at, last_seen_at) "
+        "VALUES (?, ?, '', ?, ?, ?)",
+        [
+            (shop_id, product_id, pay_amount, f'{day(captured)} 08:00:00', f'{day(seen)} 08:00:00')
+            for shop_id, product_id, pay_amount, captured, seen in snapshots
+        ]
+    )
+    conn.commit()
+    return conn
+
+
+def test_product_dropping_out_of_listing_is_a_faller(tmp_path):
+    conn = create_database(tmp_path, [
+        # 店铺仍在采集，产品b在2天前之后不再出现
+        ('s1', 'a', 100, 9, 0),
+        ('s1', 'b', 100, 9, 2),
+        # 店铺s2最后一次采集是5天前，之后没有数据的日子沿用之前的值
+        ('s2', 'c', 100, 9, 5),
+    ])
+    trends = trend_analysis.compute_trends(conn, days=10, lookback=3, end_day=TODAY).set_index('product_id')
+    assert trends.loc['a', 'pay_amount'] == 100
+    assert trends.loc['b', 'pay_amount'] == 0
+    assert trends.loc['c', 'pay_amount'] == 100
+
+    movers = trend_analysis.top_movers(trends.reset_index(), 'pay_amount')
+    assert list(movers['market']['fallers']['product_id']) == ['b']
+    assert movers['market']['risers'].empty
+
+
+def test_snapshot_values_carry_forward_until_next_snapshot(tmp_path):
+    conn = create_database(tmp_path, [
+        ('s1', 'a', 100, 9, 3),
+        ('s1', 'a', 160, 2, 0),
+    ])
+    trends = trend_analysis.compute_trends(conn, days=10, lookback=3, end_day=TODAY).set_index('product_id')
+    assert trends.loc['a', 'pay_amount'] == 160
+    assert trends.loc['a', 'pay_amount_velocity'] == 20
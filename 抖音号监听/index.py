@@ -1,8 +1,16 @@
 import asyncio
 import aiosqlite
 import re
+import os
+import sys
 from datetime import datetime, timedelta
-from playwright.async_api import async_playwright
+
+# 将项目根目录加入模块搜索路径，以便复用common下的公共模块
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.append(PROJECT_DIR)
+
+from common.browser_launcher import open_browser, timed_goto
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import json
@@ -145,13 +153,9 @@ async def handle_response(response, db):
 async def run(urls):
     await init_db()
     async with aiosqlite.connect(DB_FILE) as db:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch_persistent_context(
-                user_data_dir="/Users/bairdweng/Library/Application Support/Google/Chrome/Default",
-                channel="chrome",
-                headless=False
-            )
-            page = await browser.new_page()
+        # 使用共用启动器：默认无头模式并导入已导出的登录态
+        async with open_browser() as context:
+            page = await context.new_page()
 
             # 每次抓取前绑定 response 事件
             page.on("response", lambda response: asyncio.create_task(
@@ -159,17 +163,15 @@ async def run(urls):
 
             for url in urls:
                 print(f"🔹 开始抓取 {url}")
-                await page.goto(url)
+                await timed_goto(page, url)
                 await asyncio.sleep(20)  # 等待网络请求触发
 
-            print("✅ 抓取完成，保持浏览器打开 60 秒")
-            await asyncio.sleep(60)
-            await browser.close()
-            
-            # 分析热卖和增长产品
-            print("🔍 分析热卖和增长产品...")
-            await analyze_hot_products(db)
-            await analyze_growth_products(db)
+            print("✅ 抓取完成")
+
+        # 分析热卖和增长产品
+        print("🔍 分析热卖和增长产品...")
+        await analyze_hot_products(db)
+        await analyze_growth_products(db)
 
 # 定义要抓取的用户URL列表
 DEFAULT_URLS = [
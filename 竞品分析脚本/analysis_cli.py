@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+竞品数据分析命令行
+
+子命令：
+    report   生成HTML报告并在浏览器中打开（不带子命令运行 analyze_data.py 时的默认行为）
+    top      全部产品中增长率最高的前N个产品
+    shops    每个店铺增长率最高的前N个产品
+    clusters 跨店铺同款产品（近似重复聚类）按合计支付金额排名
+    export   导出时间窗口内每个产品的最新快照（--all-snapshots 导出全部快照）
+    trends   多日趋势：全市场和各店铺上升/下降最快的产品
+    site     增量生成多日静态报告站点（日报、店铺页和索引页）
+
+公共参数：--days 时间窗口天数，--top 前N个，--shop 店铺ID（可重复），
+--format table/json/csv/parquet，-o 输出文件（parquet必须指定）。
+子命令之前的 --query-dims 指定排名、趋势和站点统计的查询维度（默认见 analyze_data.primary_query_dims）。
+
+查询结果直接从游标逐行写出，不先把全部结果构造成字典列表；parquet按批写入，
+导出大量数据时内存占用保持在一个批次以内。数据写到标准输出时，连接数据库等提示信息
+改写到标准错误，便于通过管道交给其它工具：
+    python analyze_data.py export --days 7 --format csv > products.csv
+    python analyze_data.py top --days 3 --top 20 --format json | jq '.[0]'
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import sys
+from itertools import chain, islice
+
+from analyze_data import DB_PATH, PRIMARY_QUERY_DIMS, SHOP_FILTER_SQL, SITE_DEFAULT_DAYS, SITE_DEFAULT_TOP_N, TOP_CLUSTERS_SQL, \
+    TOP_GROWTH_BY_SHOP_SQL, TOP_GROWTH_PRODUCTS_SQL, TREND_DEFAULT_DAYS, TREND_DEFAULT_LOOKBACK, TREND_DEFAULT_TOP_N, \
+    TREND_METRICS, AnalysisContext, generate_markdown_report, get_date_filter
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ('table', 'json', 'csv', 'parquet')
+# 表格格式根据前若干行确定列宽，之后的行按该列宽截断输出
+TABLE_SAMPLE_ROWS = 200
+TABLE_MAX_WIDTH = 40
+PARQUET_BATCH_ROWS = 50000
+# 旧数据的二维码以base64文本存放在 qr_code 列中，导出时只保留 qr_code_hash
+OMITTED_COLUMNS = {'qr_code'}
+
+# 时间窗口内每个产品（按查询维度区分）的最新快照
+LATEST_SNAPSHOTS_SQL = """
+SELECT p.shop_id, s.shop_name, p.product_id, p.product_name, p.query_dims,
+       p.price_range, p.pay_amount, p.pay_amount_growth_rate, p.impressions_people_num,
+       p.price_mid, p.pay_amount_mid, p.growth_mid, p.impressions_mid, p.growth_score, p.growth_value,
+       p.captured_at, p.last_seen_at, p.product_pic, p.qr_code_hash
+FROM products p LEFT JOIN shops s ON s.shop_id = p.shop_id
+WHERE p.id IN (
+    SELECT MAX(id) FROM products
+    WHERE last_seen_at >= :date_filter AND {shop_filter}
+    GROUP BY shop_id, product_id, query_dims
+)
+ORDER BY p.shop_id, p.product_id, p.query_dims
+""".format(shop_filter=SHOP_FILTER_SQL.format(column='shop_id'))
+
+# 时间窗口内的全部快照，按插入顺序
+ALL_SNAPSHOTS_SQL = """
+SELECT p.id, p.shop_id, s.shop_name, p.product_id, p.product_name, p.query_dims,
+       p.price_range, p.pay_amount, p.pay_amount_growth_rate, p.impressions_people_num,
+       p.price_mid, p.pay_amount_mid, p.growth_mid, p.impressions_mid, p.growth_score, p.growth_value,
+       p.captured_at, p.last_seen_at
+FROM products p LEFT JOIN shops s ON s.shop_id = p.shop_id
+WHERE p.last_seen_at >= :date_filter AND {shop_filter}
+ORDER BY p.id
+""".format(shop_filter=SHOP_FILTER_SQL.format(column='p.shop_id'))
+
+
+# ---------------- 输出格式 ----------------
+
+def cursor_rows(cursor):
+    """返回 (列名, 行迭代器)，去掉不需要导出的列；行迭代器直接迭代游标"""
+    columns = [description[0] for description in cursor.description]
+    keep = [index for index, column in enumerate(columns) if column not in OMITTED_COLUMNS]
+    if len(keep) == len(columns):
+        return columns, cursor
+    return [columns[index] for index in keep], (tuple(row[index] for index in keep) for row in cursor)
+
+
+def format_cell(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def write_table(columns, rows, out):
+    """按前 TABLE_SAMPLE_ROWS 行确定列宽，其余行流式输出"""
+    sample = list(islice(rows, TABLE_SAMPLE_ROWS))
+    widths = [
+        min(max([len(column)] + [len(format_cell(row[index])) for row in sample]), TABLE_MAX_WIDTH)
+        for index, column in enumerate(columns)
+    ]
+    out.write('  '.join(column[:width].ljust(width) for column, width in zip(columns, widths)).rstrip() + '\n')
+    out.write('  '.join('-' * width for width in widths) + '\n')
+    count = 0
+    for row in chain(sample, rows):
+        out.write('  '.join(format_cell(value)[:width].ljust(width) for value, width in zip(row, widths)).rstrip() + '\n')
+        count += 1
+    return count
+
+
+def write_json(columns, rows, out):
+    """输出JSON数组，逐行序列化，不在内存中保留整个数组"""
+    count = 0
+    out.write('[')
+    for row in rows:
+        out.write(',\n' if count else '\n')
+        out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+        count += 1
+    out.write('\n]\n' if count else ']\n')
+    return count
+
+
+def write_csv(columns, rows, out):
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_parquet(columns, rows, path):
+    """按 PARQUET_BATCH_ROWS 行一批写入parquet，列类型由第一批数据推断"""
+    if pyarrow is None:
+        raise RuntimeError("未安装pyarrow，无法输出parquet：pip install pyarrow")
+    writer = None
+    count = 0
+    try:
+        while True:
+            batch = list(islice(rows, PARQUET_BATCH_ROWS))
+            if not batch and writer is not None:
+                break
+            values = [list(value) for value in zip(*batch)] if batch else [[] for _ in columns]
+            if writer is None:
+                # 第一批中全为空的列无法推断类型，按字符串处理
+                fields = [pyarrow.field(column, pyarrow.array(value).type) for column, value in zip(columns, values)]
+                schema = pyarrow.schema([
+                    field.with_type(pyarrow.string()) if pyarrow.types.is_null(field.type) else field
+                    for field in fields
+                ])
+                writer = pyarrow.parquet.ParquetWriter(path, schema)
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(value, type=field.type) for value, field in zip(values, schema)], schema=schema
+            ))
+            count += len(batch)
+            if len(batch) < PARQUET_BATCH_ROWS:
+                break
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def write_rows(columns, rows, fmt, output, stdout=None):
+    """按格式写出数据，返回行数；output为None时写到stdout（默认sys.stdout）"""
+    if fmt == 'parquet':
+        if not output:
+            raise ValueError("parquet格式需要用 -o 指定输出文件")
+        return write_parquet(columns, rows, output)
+
+    writer = {'table': write_table, 'json': write_json, 'csv': write_csv}[fmt]
+    if not output:
+        return writer(columns, rows, stdout or sys.stdout)
+    with open(output, 'w', encoding='utf-8', newline='' if fmt == 'csv' else None) as f:
+        return writer(columns, rows, f)
+
+
+# ---------------- 子命令 ----------------
+
+def run_report(args):
+    from generate_html_report import generate_html_report, open_report
+
+    with AnalysisContext(args.db, date_filter=get_date_filter(args.days), query_dims=args.query_dims) as context:
+        report_file = generate_html_report(
+            context, inline_images=args.inline_images, thumbnails=args.thumbnails, top_n=args.top
+        )
+        if args.markdown:
+            generate_markdown_report(context, top_n=args.top)
+    if report_file and not args.no_open:
+        open_report(report_file)
+
+
+def run_query(args, sql, **params):
+    with AnalysisContext(args.db, date_filter=get_date_filter(args.days), query_dims=args.query_dims) as context:
+        cursor = context.execute(sql, getattr(args, 'top', None), args.shop_ids, **params)
+        columns, rows = cursor_rows(cursor)
+        count = write_rows(columns, rows, args.format, args.output, args.stdout)
+    print(f"✅ 共输出 {count} 行（最近{args.days:g}天）")
+
+
+def run_export(args):
+    sql = ALL_SNAPSHOTS_SQL if args.all_snapshots else LATEST_SNAPSHOTS_SQL
+    if args.limit:
+        sql += f"\nLIMIT {int(args.limit)}"
+    run_query(args, sql)
+
+
+def trend_rows(conn, movers, metric):
+    """把趋势结果展开为行：范围、方向、名次以及产品的指标和变化"""
+    from trend_analysis import attach_names, load_shop_names
+
+    shop_names = load_shop_names(conn)
+    sections = [('market', movers['market'], 'market_rank_change')] + [
+        ('shop', shop_movers, 'shop_rank_change') for shop_movers in movers['shops'].values()
+    ]
+    for scope, section, rank_column in sections:
+        for direction in ('risers', 'fallers'):
+            frame = attach_names(conn, section[direction], shop_names)
+            for rank, row in enumerate(frame.itertuples(index=False), 1):
+                rank_change = getattr(row, rank_column)
+                yield (
+                    scope, direction, rank, row.shop_id, row.shop_name, row.product_id, row.product_name,
+                    float(getattr(row, metric)), float(getattr(row, f'{metric}_velocity')),
+                    float(getattr(row, f'{metric}_acceleration')),
+                    None if rank_change != rank_change else int(rank_change),
+                )
+
+
+def run_trends(args):
+    import trend_analysis
+
+    with AnalysisContext(args.db, query_dims=args.query_dims) as context:
+        trends = trend_analysis.compute_trends(
+            context.conn, args.days, args.lookback, args.metric, query_dims=context.query_dims,
+            shop_ids=args.shop_ids
+        )
+        if trends.empty:
+            print(f"❌ 最近{args.days}天没有产品数据")
+            return
+        movers = trend_analysis.top_movers(trends, args.metric, args.top)
+        columns = [
+            'scope', 'direction', 'rank', 'shop_id', 'shop_name', 'product_id', 'product_name',
+            args.metric, f'{args.metric}_velocity', f'{args.metric}_acceleration', 'rank_change',
+        ]
+        count = write_rows(
+            columns, trend_rows(context.conn, movers, args.metric), args.format, args.output, args.stdout
+        )
+    print(f"✅ 共输出 {count} 行（最近{args.days}天，{len(trends)} 个产品）")
+
+
+def run_site(args):
+    import report_site
+
+    report_site.build_site(
+        args.db, args.output or report_site.SITE_DIR, args.days, args.top, workers=args.workers, force=args.force,
+        query_dims=args.query_dims
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="竞品数据分析")
+    parser.add_argument('--db', default=DB_PATH, help="数据库文件路径")
+    parser.add_argument('--query-dims', default=PRIMARY_QUERY_DIMS,
+                        help="统计的查询维度JSON，如 '{\"date_type\": 7}'（默认取环境变量ANALYSIS_QUERY_DIMS或库中最小的维度）")
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_common(subparser, days, top=None, days_type=float):
+        subparser.add_argument('--days', type=days_type, default=days, help=f"时间窗口天数（默认{days}）")
+        if top is not None:
+            subparser.add_argument('--top', type=int, default=top, help=f"取前N个（默认{top}）")
+        subparser.add_argument('--shop', action='append', dest='shop_ids', help="只分析指定店铺ID，可重复")
+        subparser.add_argument('--format', choices=FORMATS, default='table', help="输出格式（默认table）")
+        subparser.add_argument('-o', '--output', help="输出文件，默认写到标准输出")
+
+    report = subparsers.add_parser('report', help="生成HTML报告并打开")
+    report.add_argument('--days', type=float, default=1, help="时间窗口天数（默认1）")
+    report.add_argument('--top', type=int, default=5, help="各表格取前N个（默认5）")
+    report.add_argument('--markdown', action='store_true', help="同时生成Markdown报告")
+    report.add_argument('--no-open', action='store_true', help="生成后不打开浏览器")
+    report.add_argument('--inline-images', action='store_true', help="内联二维码，生成单个自包含的HTML文件")
+    report.add_argument('--thumbnails', action='store_true', help="把产品主图下载为本地缩略图（需要Pillow）")
+    report.set_defaults(handler=run_report)
+
+    top = subparsers.add_parser('top', help="全部产品增长率TOP N")
+    add_common(top, days=1, top=5)
+    top.set_defaults(handler=lambda args: run_query(args, TOP_GROWTH_PRODUCTS_SQL))
+
+    shops = subparsers.add_parser('shops', help="每个店铺增长率TOP N")
+    add_common(shops, days=1, top=5)
+    shops.set_defaults(handler=lambda args: run_query(args, TOP_GROWTH_BY_SHOP_SQL))
+
+    clusters = subparsers.add_parser('clusters', help="跨店铺同款产品TOP N（按合计支付金额）")
+    add_common(clusters, days=1, top=5)
+    clusters.add_argument('--min-shops', type=int, default=2, help="聚类至少覆盖的店铺数（默认2，为1时包含单店铺产品）")
+    clusters.set_defaults(handler=lambda args: run_query(args, TOP_CLUSTERS_SQL, min_shops=args.min_shops))
+
+    export = subparsers.add_parser('export', help="导出时间窗口内的产品快照")
+    add_common(export, days=1)
+    export.add_argument('--all-snapshots', action='store_true', help="导出全部快照，而不只是每个产品的最新快照")
+    export.add_argument('--limit', type=int, help="最多导出的行数")
+    export.set_defaults(handler=run_export)
+
+    # trends和site的模块只在执行时导入（trend_analysis依赖pandas），默认参数取自 analyze_data
+    trends = subparsers.add_parser('trends', help="多日趋势：上升/下降最快的产品")
+    add_common(trends, days=TREND_DEFAULT_DAYS, top=TREND_DEFAULT_TOP_N, days_type=int)
+    trends.add_argument('--lookback', type=int, default=TREND_DEFAULT_LOOKBACK, help="计算速度的回看天数")
+    trends.add_argument('--metric', choices=list(TREND_METRICS), default='pay_amount', help="排序和排名使用的指标")
+    trends.set_defaults(handler=run_trends)
+
+    site = subparsers.add_parser('site', help="增量生成多日静态报告站点")
+    site.add_argument('--days', type=int, default=SITE_DEFAULT_DAYS, help=f"时间窗口天数（默认{SITE_DEFAULT_DAYS}）")
+    site.add_argument('--top', type=int, default=SITE_DEFAULT_TOP_N, help=f"每个表格取前N个（默认{SITE_DEFAULT_TOP_N}）")
+    site.add_argument('--workers', type=int, help="渲染页面的进程数（默认CPU核数）")
+    site.add_argument('--force', action='store_true', help="忽略输入指纹，重新生成全部页面")
+    site.add_argument('-o', '--output', help="站点目录（默认脚本目录下的 report_site）")
+    site.set_defaults(handler=run_site)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args = parser.parse_args((argv if argv is not None else sys.argv[1:]) + ['report'])
+
+    if args.command in ('report', 'site'):
+        args.handler(args)
+        return
+
+    # 数据写到标准输出时，其它提示信息改写到标准错误，避免混入数据
+    args.stdout = sys.stdout
+    redirect = contextlib.redirect_stdout(sys.stderr) if not args.output else contextlib.nullcontext()
+    try:
+        with redirect:
+            args.handler(args)
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,143 +1,460 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+"""
+竞品数据分析
+
+报告生成时通过 AnalysisContext 共享一个只读数据库连接，每个分析结果在一次运行中只查询一次。
+结果同时缓存到磁盘（.analysis_cache 目录），以数据版本和查询参数为键：没有新的采集数据时，
+重复生成报告直接读取缓存。
+"""
 
 import sqlite3
+import copy
 import datetime
-import re
+import hashlib
+import json
 import os
+import sys
+from urllib.request import pathname2url
+
+# product_db 会把项目根目录加入模块搜索路径，需先于common模块导入
+import product_db
 
 # 获取脚本所在目录的绝对路径
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(SCRIPT_DIR, 'product_data.db')
+# 分析结果缓存目录，设置 ANALYSIS_CACHE_DIR 为空字符串时禁用磁盘缓存
+CACHE_DIR = os.environ.get('ANALYSIS_CACHE_DIR', os.path.join(SCRIPT_DIR, '.analysis_cache'))
 
-def get_growth_score(growth_rate):
-    """根据增长率字符串计算排序分数"""
-    if not growth_rate or growth_rate == '':
-        return 0
-    
-    try:
-        # 尝试匹配数字部分
-        match = re.search(r'([-+]?\d+\.?\d*)%', growth_rate)
-        if not match:
-            return 0
-            
-        rate_value = float(match.group(1))
-        
-        # 根据增长率范围返回不同的优先级分数
-        if rate_value >= 100:
-            return 3  # 最高优先级
-        elif rate_value >= 50:
-            return 2
-        elif rate_value >= 20:
-            return 1
-        elif rate_value >= -15:
-            return 0  # 零分，但仍可能出现在结果中
-        else:
-            return -1  # 不推荐显示的
-    except Exception:
-        return 0
+# 多日趋势分析(trend_analysis)和报告站点(report_site)的默认参数。trend_analysis 依赖pandas，
+# analysis_cli 只在执行对应子命令时才导入这两个模块，未安装pandas时报告和其它子命令照常可用
+TREND_METRICS = {
+    'pay_amount': 'pay_amount_mid',
+    'growth': 'growth_mid',
+    'impressions': 'impressions_mid',
+}
+TREND_DEFAULT_DAYS = 30
+TREND_DEFAULT_LOOKBACK = 7
+TREND_DEFAULT_TOP_N = 10
+SITE_DEFAULT_DAYS = 30
+SITE_DEFAULT_TOP_N = 10
+
+# 排名、同款聚类、趋势和报告站点只统计一个主查询维度的快照，同一产品的1天/7天/30天等指标不会混在一起排名。
+# 主查询维度通过 ANALYSIS_QUERY_DIMS 指定，值为 jp.py 扫描时记录的规范化JSON（如 '{"date_type": 7}'）；
+# 未指定时取库中最小的查询维度：有默认维度('')的数据时就是默认维度，全部为扫描组合时取排序最前的组合
+PRIMARY_QUERY_DIMS = os.environ.get('ANALYSIS_QUERY_DIMS')
 
-def connect_to_database():
-    """连接到SQLite数据库"""
+def open_read_only(db_path=DB_PATH):
+    """打开只读连接，不做表结构检查"""
+    return sqlite3.connect(f"file:{pathname2url(db_path)}?mode=ro", uri=True)
+
+def connect_to_database(db_path=DB_PATH):
+    """以只读方式连接到SQLite数据库
+    
+    表结构落后于当前版本时先用读写连接执行一次迁移（生成列和索引需要迁移后才存在），
+    之后分析全程只读，不会与正在写入的采集脚本争用写锁。
+    """
     try:
-        # 使用脚本目录下的数据库文件
-        db_path = os.path.join(SCRIPT_DIR, 'product_data.db')
-        
-        # 检查数据库文件是否存在
-        conn = None
-        if os.path.exists(db_path):
-            conn = sqlite3.connect(db_path)
-            print(f"✅ 成功连接到数据库: {db_path}")
-        else:
-            # 如果路径不存在，尝试创建
-            conn = sqlite3.connect(db_path)
-            print(f"⚠️  数据库文件不存在，尝试创建: {db_path}")
-        
-        # 调试：检查是否有包含非空二维码的产品
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT COUNT(*) FROM products WHERE qr_code IS NOT NULL AND qr_code != ''")
-            qr_code_count = cursor.fetchone()[0]
-            print(f"🔍 数据库中有 {qr_code_count} 条产品记录包含非空二维码")
-        except sqlite3.Error as e:
-            print(f"⚠️  查询二维码数据时出错: {e}")
-        
+        if not os.path.exists(db_path):
+            print(f"❌ 数据库文件不存在: {db_path}")
+            return None
+        
+        conn = open_read_only(db_path)
+        if conn.execute("PRAGMA user_version").fetchone()[0] < product_db.SCHEMA_VERSION:
+            conn.close()
+            product_db.connect(db_path).close()
+            conn = open_read_only(db_path)
+        print(f"✅ 成功连接到数据库: {db_path}")
         return conn
     except Exception as e:
         print(f"❌ 连接数据库失败: {e}")
         return None
 
-def get_date_filter():
-    """获取最近1天的日期过滤条件"""
-    one_day_ago = datetime.datetime.now() - datetime.timedelta(days=1)
-    return one_day_ago.strftime('%Y-%m-%d %H:%M:%S')
+def primary_query_dims(conn, query_dims=PRIMARY_QUERY_DIMS):
+    """返回分析使用的主查询维度，未指定时按 query_dims 开头的索引取最小值，只需一次索引查找"""
+    if query_dims is not None:
+        return query_dims
+    return conn.execute("SELECT MIN(query_dims) FROM products").fetchone()[0] or ''
 
-def analyze_top_growth_products(return_data=False):
-    """分析最近1天采集的数据，增长速度率最高的前5个产品"""
-    conn = connect_to_database()
-    if not conn:
-        return None if return_data else None
+def get_date_filter(days=1):
+    """获取最近N天（默认1天）的日期过滤条件
     
-    try:
-        cursor = conn.cursor()
-        date_filter = get_date_filter()
-        
-        # 查询最近1天的所有产品数据
-        cursor.execute(
-            "SELECT p.product_id, p.product_name, p.product_pic, p.pay_amount_growth_rate, s.shop_name, p.qr_code "
-            "FROM products p LEFT JOIN shops s ON p.shop_id = s.shop_id "
-            "WHERE p.captured_at >= ?",
-            (date_filter,)
-        )
-        products = cursor.fetchall()
-        
-        if not products:
-            print("❌ 未找到最近1天的产品数据")
-            return None if return_data else None
-        
-        # 计算每个产品的增长率分数并排序
-        products_with_score = []
-        for product in products:
-            product_id, product_name, product_pic, growth_rate, shop_name, qr_code = product
-            score = get_growth_score(growth_rate)
-            if score >= 0:  # 只考虑分数为0或以上的产品
-                products_with_score.append({
-                    'id': product_id,
-                    'name': product_name,
-                    'pic': product_pic,
-                    'growth_rate': growth_rate,
-                    'growth_score': score,
-                    'shop_name': shop_name or "未知店铺",
-                    'qr_code': qr_code if qr_code else ''
-                })
-        
-        # 按照增长率分数和增长率值排序
-        for x in products_with_score:
-            # 添加安全的增长率值提取
-            if x['growth_rate']:
-                match = re.search(r'([-+]?\d+\.?\d*)%', x['growth_rate'])
-                x['growth_value'] = float(match.group(1)) if match else 0
-            else:
-                x['growth_value'] = 0
+    产品数据只在变化时插入新快照，未变化时更新last_seen_at，因此按last_seen_at过滤：
+    最近N天内仍被采集到的快照（包括更早插入、至今未变化的快照）都视为有效。
+    """
+    window_start = datetime.datetime.now() - datetime.timedelta(days=days)
+    return window_start.strftime('%Y-%m-%d %H:%M:%S')
+
+# 可选的店铺过滤条件：:shop_ids 为店铺ID的JSON数组，为NULL时不过滤，SQL语句保持不变
+SHOP_FILTER_SQL = "(:shop_ids IS NULL OR {column} IN (SELECT value FROM json_each(:shop_ids)))"
+
+# 以下分析SQL都只统计主查询维度(:query_dims)的快照，见 primary_query_dims
+
+# 全部产品增长率TOP N：窗口内每个产品取增长率最高的一条快照，排序和LIMIT都在SQL中完成。
+# 排名阶段只读 idx_products_last_seen_growth_dims 覆盖索引，最后只为入选的N个产品回表取名称、图片等字段
+TOP_GROWTH_PRODUCTS_SQL = """
+WITH recent AS MATERIALIZED (
+    SELECT id, product_id, growth_score, growth_value
+    FROM products
+    -- query_dims 前的 + 让SQLite选用以 last_seen_at 开头的覆盖索引，而不是需要回表的 idx_products_trend
+    WHERE last_seen_at >= :date_filter AND growth_score >= 0 AND +query_dims = :query_dims
+),
+best AS (
+    SELECT id, growth_score, growth_value,
+           ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY growth_score DESC, growth_value DESC, id DESC) AS product_rank
+    FROM recent
+)
+SELECT p.product_id, p.product_name, p.product_pic, p.pay_amount_growth_rate, s.shop_name,
+       b.growth_score, b.growth_value, p.qr_code, p.qr_code_hash
+FROM best b
+JOIN products p ON p.id = b.id
+LEFT JOIN shops s ON p.shop_id = s.shop_id
+-- 产品只属于一个店铺，店铺过滤放在去重之后，排名阶段仍然只读覆盖索引
+WHERE b.product_rank = 1 AND {shop_filter}
+ORDER BY b.growth_score DESC, b.growth_value DESC, b.id DESC
+LIMIT :top_n
+""".format(shop_filter=SHOP_FILTER_SQL.format(column='p.shop_id'))
+
+# 每个店铺增长率TOP N：先取每个产品在时间窗口内的最新快照，再在店铺内按增长率排名
+TOP_GROWTH_BY_SHOP_SQL = """
+-- 先按 idx_products_last_seen_growth_dims 取出窗口内的行，耗时只与窗口内数据量有关，与历史采集量无关
+WITH recent AS MATERIALIZED (
+    SELECT id, shop_id, product_id, product_name, product_pic, pay_amount_growth_rate,
+           qr_code, qr_code_hash, growth_score, growth_value
+    FROM products
+    WHERE last_seen_at >= :date_filter AND query_dims = :query_dims AND {shop_filter}
+),
+latest AS (
+    SELECT recent.*,
+           ROW_NUMBER() OVER (PARTITION BY shop_id, product_id ORDER BY id DESC) AS snapshot_rank
+    FROM recent
+),
+ranked AS (
+    SELECT latest.*,
+           ROW_NUMBER() OVER (PARTITION BY shop_id ORDER BY growth_score DESC, growth_value DESC, id DESC) AS shop_rank
+    FROM latest
+    WHERE snapshot_rank = 1 AND growth_score >= 0
+)
+SELECT r.shop_id, s.shop_name, r.product_id, r.product_name, r.product_pic, r.pay_amount_growth_rate,
+       r.growth_score, r.growth_value, r.qr_code, r.qr_code_hash
+FROM ranked r JOIN shops s ON s.shop_id = r.shop_id
+WHERE r.shop_rank <= :top_n
+ORDER BY r.shop_id, r.shop_rank
+""".format(shop_filter=SHOP_FILTER_SQL.format(column='shop_id'))
+
+# 跨店铺同款产品TOP N：近似重复聚类（见 product_clusters）内的产品视为同一款，
+# 每个产品取窗口内主查询维度下的最新快照，按聚类汇总支付金额、曝光人数和按支付金额加权的增长率
+TOP_CLUSTERS_SQL = """
+WITH latest AS MATERIALIZED (
+    SELECT MAX(id) AS id FROM products
+    WHERE query_dims = :query_dims AND last_seen_at >= :date_filter AND {shop_filter}
+    GROUP BY product_id
+),
+members AS (
+    SELECT c.cluster_id, p.product_id, p.product_name, p.product_pic, p.shop_id, s.shop_name,
+           p.pay_amount_mid, p.impressions_mid, p.growth_mid, p.growth_value,
+           ROW_NUMBER() OVER (
+               PARTITION BY c.cluster_id ORDER BY COALESCE(p.pay_amount_mid, 0) DESC, p.id DESC
+           ) AS member_rank
+    FROM latest l
+    JOIN products p ON p.id = l.id
+    JOIN product_clusters c ON c.product_id = p.product_id
+    LEFT JOIN shops s ON s.shop_id = p.shop_id
+)
+SELECT cluster_id,
+       -- 以支付金额最高的产品作为聚类的代表
+       MAX(CASE WHEN member_rank = 1 THEN product_name END) AS product_name,
+       MAX(CASE WHEN member_rank = 1 THEN product_pic END) AS product_pic,
+       COUNT(*) AS product_count,
+       COUNT(DISTINCT shop_id) AS shop_count,
+       group_concat(DISTINCT shop_name) AS shop_names,
+       SUM(pay_amount_mid) AS pay_amount_mid,
+       SUM(impressions_mid) AS impressions_mid,
+       SUM(growth_mid * pay_amount_mid) / SUM(CASE WHEN growth_mid IS NOT NULL THEN pay_amount_mid END) AS growth_mid,
+       MAX(growth_value) AS max_growth_value
+FROM members
+GROUP BY cluster_id
+HAVING COUNT(DISTINCT shop_id) >= :min_shops
+ORDER BY COALESCE(SUM(pay_amount_mid), 0) DESC, product_count DESC, cluster_id
+LIMIT :top_n
+""".format(shop_filter=SHOP_FILTER_SQL.format(column='shop_id'))
+
+class AnalysisContext:
+    """一次分析运行共享的上下文：一个只读连接、统一的时间窗口、结果的内存和磁盘缓存
+    
+        with AnalysisContext() as context:
+            generate_html_report(context)
+            generate_markdown_report(context)
+    
+    内存缓存以 PRAGMA data_version 为键，运行期间采集脚本提交了新数据时会重新查询。
+    PRAGMA data_version 只在同一连接内有意义，不能跨进程比较，因此磁盘缓存使用数据指纹：
+    产品表最大id（新快照）、最大last_seen_at（心跳更新）、店铺表的行数与最后更新时间，
+    以及聚类数（补充图片哈希后聚类可能合并），都可以直接从主键或索引取得。时间窗口每次运行都会后移，缓存的窗口起点与本次起点之间
+    没有快照过期时，窗口内的数据集合不变，缓存仍然有效。
+    """
+    
+    def __init__(self, db_path=DB_PATH, cache_dir=CACHE_DIR, date_filter=None, query_dims=PRIMARY_QUERY_DIMS):
+        self.db_path = db_path
+        self.cache_dir = cache_dir
+        # 同一次运行的所有分析使用同一个时间窗口和查询维度，报告各部分的数据口径一致
+        self.date_filter = date_filter or get_date_filter()
+        self._created_at = datetime.datetime.now()
+        self._query_dims = query_dims
+        self._conn = None
+        self._results = {}
+        self._data_fingerprint = None
+    
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = connect_to_database(self.db_path)
+            if self._conn is None:
+                raise RuntimeError(f"无法打开数据库: {self.db_path}")
+        return self._conn
+    
+    @property
+    def days(self):
+        """时间窗口天数，由 date_filter 到创建上下文时的时长换算，用于报告中的分析范围说明"""
+        window_start = datetime.datetime.fromisoformat(self.date_filter)
+        return round((self._created_at - window_start).total_seconds() / 86400, 2)
+    
+    @property
+    def query_dims(self):
+        if self._query_dims is None:
+            self._query_dims = primary_query_dims(self.conn, None)
+        return self._query_dims
+    
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def data_fingerprint(self):
+        """跨进程可比较的数据版本"""
+        if self._data_fingerprint is None:
+            row = self.conn.execute(
+                "SELECT (SELECT MAX(id) FROM products), (SELECT MAX(last_seen_at) FROM products), "
+                "(SELECT COUNT(*) FROM shops), (SELECT MAX(last_updated) FROM shops), "
+                "(SELECT COUNT(DISTINCT cluster_id) FROM product_clusters)"
+            ).fetchone()
+            self._data_fingerprint = list(row)
+        return self._data_fingerprint
+    
+    def _cache_path(self, name, params):
+        key = hashlib.sha1(
+            json.dumps([name, params, self.query_dims], ensure_ascii=False).encode('utf-8')
+        ).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{name}_{key}.json")
+    
+    def _load_cached(self, name, params):
+        """读取磁盘缓存，数据版本不一致或窗口内有快照过期时返回None"""
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_path(name, params), encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get('data_fingerprint') != self.data_fingerprint():
+            return None
+        cached_filter = cached.get('date_filter', '')
+        if cached_filter > self.date_filter:
+            return None
+        if cached_filter < self.date_filter and self.conn.execute(
+            "SELECT 1 FROM products WHERE last_seen_at >= ? AND last_seen_at < ? LIMIT 1",
+            (cached_filter, self.date_filter)
+        ).fetchone():
+            return None
+        return cached['result']
+    
+    def _store_cached(self, name, params, result):
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._cache_path(name, params)
+            # 先写临时文件再替换，避免并发运行时读到写了一半的缓存
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({
+                    'data_fingerprint': self.data_fingerprint(),
+                    'date_filter': self.date_filter,
+                    'result': result,
+                }, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"⚠️  写入分析缓存失败: {e}")
+    
+    def result(self, name, compute, **params):
+        """返回分析结果：同一次运行内只计算一次，数据未变化时直接读取磁盘缓存
+        
+        每次返回结果的副本，调用方（如报告把图片替换为资源地址）修改结果不会影响之后的调用。
+        """
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        memo_key = (name, json.dumps(params, sort_keys=True), self.query_dims)
+        memo = self._results.get(memo_key)
+        if memo is not None and memo[0] == data_version:
+            return copy.deepcopy(memo[1])
+        if memo is not None:
+            # 运行期间有新的提交，数据指纹需要重新读取
+            self._data_fingerprint = None
+        
+        result = self._load_cached(name, params)
+        if result is None:
+            result = compute(**params)
+            self._store_cached(name, params, result)
+        self._results[memo_key] = (data_version, result)
+        return copy.deepcopy(result)
+    
+    def execute(self, sql, top_n=None, shop_ids=None, **params):
+        """在当前时间窗口内执行分析SQL，返回游标，调用方可以逐行迭代而不必一次取出全部结果"""
+        return self.conn.execute(sql, {
+            'date_filter': self.date_filter,
+            'query_dims': self.query_dims,
+            'top_n': top_n,
+            'shop_ids': json.dumps(list(shop_ids)) if shop_ids else None,
+            **params,
+        })
+    
+    def top_growth_products(self, top_n=5, shop_ids=None):
+        return self.result('top_growth_products', self._query_top_growth_products, top_n=top_n, shop_ids=shop_ids)
+    
+    def top_growth_by_shop(self, top_n=5, shop_ids=None):
+        return self.result('top_growth_by_shop', self._query_top_growth_by_shop, top_n=top_n, shop_ids=shop_ids)
+    
+    def top_clusters(self, top_n=5, shop_ids=None, min_shops=2):
+        return self.result('top_clusters', self._query_top_clusters, top_n=top_n, shop_ids=shop_ids,
+                           min_shops=min_shops)
+    
+    def _query_top_growth_products(self, top_n, shop_ids=None):
+        cursor = self.execute(TOP_GROWTH_PRODUCTS_SQL, top_n, shop_ids)
+        return [
+            {
+                'id': product_id,
+                'name': product_name,
+                'pic': product_pic,
+                'growth_rate': growth_rate,
+                'growth_score': score,
+                'shop_name': shop_name or "未知店铺",
+                'qr_code': qr_code if qr_code else '',
+                'qr_code_hash': qr_code_hash,
+                'growth_value': growth_value
+            }
+            for (product_id, product_name, product_pic, growth_rate, shop_name,
+                 score, growth_value, qr_code, qr_code_hash) in cursor
+        ]
+    
+    def _query_top_growth_by_shop(self, top_n, shop_ids=None):
+        shop_data = {}
+        cursor = self.execute(TOP_GROWTH_BY_SHOP_SQL, top_n, shop_ids)
+        for (shop_id, shop_name, product_id, product_name, product_pic, growth_rate,
+             score, growth_value, qr_code, qr_code_hash) in cursor:
+            shop = shop_data.setdefault(shop_id, {'name': shop_name, 'products': []})
+            shop['products'].append({
+                'id': product_id,
+                'name': product_name,
+                'pic': product_pic,
+                'growth_rate': growth_rate,
+                'growth_score': score,
+                'growth_value': growth_value,
+                'qr_code': qr_code if qr_code else '',
+                'qr_code_hash': qr_code_hash
+            })
+        return shop_data
+    
+    def _query_top_clusters(self, top_n, shop_ids=None, min_shops=2):
+        cursor = self.execute(TOP_CLUSTERS_SQL, top_n, shop_ids, min_shops=min_shops)
+        return [
+            {
+                'cluster_id': cluster_id,
+                'name': product_name,
+                'pic': product_pic,
+                'product_count': product_count,
+                'shop_count': shop_count,
+                'shop_names': shop_names.split(',') if shop_names else [],
+                'pay_amount_mid': pay_amount_mid,
+                'impressions_mid': impressions_mid,
+                'growth_mid': growth_mid,
+                'max_growth_value': max_growth_value
+            }
+            for (cluster_id, product_name, product_pic, product_count, shop_count, shop_names,
+                 pay_amount_mid, impressions_mid, growth_mid, max_growth_value) in cursor
+        ]
+    
+    def resolve_qr_codes(self, products, assets=None):
+        """按需将产品的二维码哈希解析为data URI，只读取实际要展示的产品对应的图片
+        
+        传入 report_assets.ReportAssets 时改为把二维码写入资源目录并替换为文件地址，
+        资源目录中已有的哈希不再读取blobs表。
+        """
+        if assets is not None:
+            return self._export_qr_codes(products, assets)
+        hashes = [product.get('qr_code_hash') for product in products if product.get('qr_code_hash')]
+        if not hashes:
+            return products
         
-        products_with_score.sort(key=lambda x: (x['growth_score'], x['growth_value']), reverse=True)
+        try:
+            qr_codes = product_db.load_qr_codes(self.conn, hashes)
+        except Exception as e:
+            print(f"⚠️  读取二维码图片失败: {e}")
+            return products
         
-        # 根据产品ID去重，保留第一个出现的产品
-        unique_products = []
-        seen_ids = set()
-        for product in products_with_score:
-            if product['id'] not in seen_ids:
-                seen_ids.add(product['id'])
-                unique_products.append(product)
+        for product in products:
+            qr_code_hash = product.get('qr_code_hash')
+            if qr_code_hash in qr_codes:
+                product['qr_code'] = qr_codes[qr_code_hash]
+        return products
+    
+    def _export_qr_codes(self, products, assets):
+        try:
+            return export_qr_codes(self.conn, products, assets)
+        except Exception as e:
+            print(f"⚠️  读取二维码图片失败: {e}")
+            return products
+
+def export_qr_codes(conn, products, assets):
+    """把产品的二维码写入报告资源目录并替换为文件地址，资源目录中已有的哈希不再读取blobs表"""
+    missing = {
+        product['qr_code_hash'] for product in products
+        if product.get('qr_code_hash') and not assets.has_qr_code(product['qr_code_hash'])
+    }
+    for qr_code_hash, data in product_db.load_blobs(conn, missing).items():
+        assets.add_qr_code(qr_code_hash, data)
+    
+    for product in products:
+        qr_code_hash = product.get('qr_code_hash')
+        if qr_code_hash and assets.has_qr_code(qr_code_hash):
+            product['qr_code'] = assets.qr_code_url(qr_code_hash)
+        elif product.get('qr_code'):
+            # 旧数据的二维码仍以data URI保存在产品行中，解码后同样按内容哈希写出
+            decoded = product_db.decode_qr_code(product['qr_code'])
+            if decoded:
+                product['qr_code'] = assets.add_qr_code(*decoded)
+    return products
+
+def analyze_top_growth_products(return_data=False, top_n=5, context=None):
+    """分析时间窗口内采集的数据，增长速度率最高的前N个产品"""
+    owns_context = context is None
+    context = context or AnalysisContext()
+    
+    try:
+        top_products = context.top_growth_products(top_n)
         
-        # 取前5个不重复的产品
-        top_products = unique_products[:5]
+        if not top_products:
+            print(f"❌ 未找到最近{context.days:g}天的产品数据")
+            return None if return_data else None
         
         # 如果需要返回数据，直接返回
         if return_data:
             return top_products
         
         # 打印结果
-        print("\n📊 最近1天增长速度率最高的前5个产品：")
+        print(f"\n📊 最近{context.days:g}天增长速度率最高的前{top_n}个产品：")
         print("=" * 120)
         print(f"{'序号':<4} {'店铺名称':<20} {'产品名称':<40} {'增长率':<10} {'图片URL':<30}")
         print("=" * 120)
@@ -152,121 +469,89 @@ def analyze_top_growth_products(return_data=False):
         print(f"❌ 分析产品数据时出错: {e}")
         return None if return_data else None
     finally:
-        conn.close()
+        if owns_context:
+            context.close()
 
-def analyze_top_growth_by_shop(return_data=False):
-    """分析最近1天采集的数据，每个店铺增长率最高的前5个产品"""
-    conn = connect_to_database()
-    if not conn:
-        return None if return_data else None
+def analyze_top_growth_by_shop(return_data=False, top_n=5, context=None):
+    """分析时间窗口内采集的数据，每个店铺增长率最高的前N个产品
+    
+    一条SQL完成：每个产品取窗口内最新快照，在店铺内按 (增长率分数, 增长率值) 排名取前N，
+    不再逐个店铺查询，也不再在Python中解析、排序和去重。
+    """
+    owns_context = context is None
+    context = context or AnalysisContext()
     
     try:
-        cursor = conn.cursor()
-        date_filter = get_date_filter()
-        
-        # 获取最近1天有数据的所有店铺
-        cursor.execute(
-            "SELECT DISTINCT s.shop_id, s.shop_name "
-            "FROM shops s JOIN products p ON s.shop_id = p.shop_id "
-            "WHERE p.captured_at >= ?",
-            (date_filter,)
-        )
-        shops = cursor.fetchall()
-        
-        if not shops:
-            print("❌ 未找到最近1天的店铺数据")
-            return None if return_data else None
-        
-        # 准备返回数据结构
-        shop_data = {}
+        shop_data = context.top_growth_by_shop(top_n)
         
-        # 如果不需要返回数据，先打印标题
-        if not return_data:
-            print(f"\n📊 最近1天每个店铺增长率最高的前5个产品：")
-            print("=" * 120)
-        
-        for shop_id, shop_name in shops:
-            # 查询该店铺最近1天的产品数据
-            cursor.execute(
-                "SELECT product_id, product_name, product_pic, pay_amount_growth_rate, qr_code "
-                "FROM products WHERE shop_id = ? AND captured_at >= ?",
-                (shop_id, date_filter)
-            )
-            products = cursor.fetchall()
-            
-            if not products:
-                if not return_data:
-                    print(f"❌ 店铺 {shop_name} 未找到最近1天的产品数据")
-                continue
-            
-            # 计算每个产品的增长率分数并排序
-            products_with_score = []
-            for product in products:
-                product_id, product_name, product_pic, growth_rate, qr_code = product
-                score = get_growth_score(growth_rate)
-                if score >= 0:  # 只考虑分数为0或以上的产品
-                    products_with_score.append({
-                        'id': product_id,
-                        'name': product_name,
-                        'pic': product_pic,
-                        'growth_rate': growth_rate,
-                        'growth_score': score,
-                        'qr_code': qr_code if qr_code else ''
-                    })
-            
-            # 按照增长率分数和增长率值排序
-            for x in products_with_score:
-                # 添加安全的增长率值提取
-                if x['growth_rate']:
-                    match = re.search(r'([-+]?\d+\.?\d*)%', x['growth_rate'])
-                    x['growth_value'] = float(match.group(1)) if match else 0
-                else:
-                    x['growth_value'] = 0
-            
-            products_with_score.sort(key=lambda x: (x['growth_score'], x['growth_value']), reverse=True)
-            
-            # 根据产品ID去重，保留第一个出现的产品
-            unique_products = []
-            seen_ids = set()
-            for product in products_with_score:
-                if product['id'] not in seen_ids:
-                    seen_ids.add(product['id'])
-                    unique_products.append(product)
-            
-            # 取前5个不重复的产品
-            top_products = unique_products[:5]
-            
-            # 保存店铺数据
-            shop_data[shop_id] = {
-                'name': shop_name,
-                'products': top_products
-            }
-            
-            # 如果不需要返回数据，则打印该店铺的结果
-            if not return_data:
-                print(f"\n🏪 店铺: {shop_name} (ID: {shop_id})")
-                print("-" * 120)
-                print(f"{'序号':<4} {'产品名称':<40} {'增长率':<10} {'图片URL':<30}")
-                print("-" * 120)
-                
-                for i, product in enumerate(top_products, 1):
-                    # 显示产品信息
-                    print(f"{i:<4} {product['name'][:40]:<42} {product['growth_rate']:<12} {product['pic']}")
-                    print(f"{'    ':<4} {'产品ID':<20} {product['id']}")
-                    print()
+        if not shop_data:
+            print(f"❌ 未找到最近{context.days:g}天的店铺数据")
+            return None if return_data else None
         
         # 如果需要返回数据，返回shop_data
         if return_data:
             return shop_data
         
+        print(f"\n📊 最近{context.days:g}天每个店铺增长率最高的前{top_n}个产品：")
+        print("=" * 120)
+        for shop_id, shop_info in shop_data.items():
+            print(f"\n🏪 店铺: {shop_info['name']} (ID: {shop_id})")
+            print("-" * 120)
+            print(f"{'序号':<4} {'产品名称':<40} {'增长率':<10} {'图片URL':<30}")
+            print("-" * 120)
+            
+            for i, product in enumerate(shop_info['products'], 1):
+                # 显示产品信息
+                print(f"{i:<4} {product['name'][:40]:<42} {product['growth_rate']:<12} {product['pic']}")
+                print(f"{'    ':<4} {'产品ID':<20} {product['id']}")
+                print()
+        
     except Exception as e:
         print(f"❌ 分析店铺数据时出错: {e}")
         return None if return_data else None
     finally:
-        conn.close()
+        if owns_context:
+            context.close()
+
+def analyze_top_clusters(return_data=False, top_n=5, context=None):
+    """分析时间窗口内在多个店铺同时在售的同款产品，按合计支付金额取前N个"""
+    owns_context = context is None
+    context = context or AnalysisContext()
+    
+    try:
+        clusters = context.top_clusters(top_n)
+        
+        if not clusters:
+            print(f"❌ 未找到最近{context.days:g}天跨店铺的同款产品")
+            return None
+        
+        if return_data:
+            return clusters
+        
+        print(f"\n📊 最近{context.days:g}天跨店铺同款产品合计支付金额前{top_n}名：")
+        print("=" * 120)
+        print(f"{'序号':<4} {'产品名称':<40} {'店铺数':<6} {'产品数':<6} {'支付金额':<14} {'加权增长率':<10}")
+        print("=" * 120)
+        
+        for i, cluster in enumerate(clusters, 1):
+            pay_amount = f"{cluster['pay_amount_mid']:,.0f}" if cluster['pay_amount_mid'] is not None else '-'
+            growth = f"{cluster['growth_mid']:.0f}%" if cluster['growth_mid'] is not None else '-'
+            print(f"{i:<4} {cluster['name'][:40]:<42} {cluster['shop_count']:<8} {cluster['product_count']:<8} "
+                  f"{pay_amount:<16} {growth}")
+            print(f"{'    ':<4} {'店铺':<20} {'、'.join(cluster['shop_names'])}")
+            print()
+        
+    except Exception as e:
+        print(f"❌ 分析同款产品数据时出错: {e}")
+        return None
+    finally:
+        if owns_context:
+            context.close()
 
-def generate_markdown_report():
-    """生成美观的Markdown格式分析报告"""
+def generate_markdown_report(context=None, top_n=5):
+    """生成美观的Markdown格式分析报告，传入共享的 AnalysisContext 时复用其中的分析结果和时间窗口"""
+    owns_context = context is None
+    context = context or AnalysisContext()
     try:
         # 获取当前时间作为报告生成时间
         current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -278,28 +563,32 @@ def generate_markdown_report():
         
         # 获取分析数据
         print("📊 正在生成Markdown报告...")
-        print("🔄 正在获取平台增长率TOP5产品数据...")
-        top5_products = analyze_top_growth_products(return_data=True)
+        print(f"🔄 正在获取平台增长率TOP{top_n}产品数据...")
+        top_products = analyze_top_growth_products(return_data=True, top_n=top_n, context=context)
         
-        print("🔄 正在获取各店铺增长率TOP5产品数据...")
-        shop_top_products = analyze_top_growth_by_shop(return_data=True)
+        print(f"🔄 正在获取各店铺增长率TOP{top_n}产品数据...")
+        shop_top_products = analyze_top_growth_by_shop(return_data=True, top_n=top_n, context=context)
+        
+        print("🔄 正在获取跨店铺同款产品数据...")
+        top_clusters = analyze_top_clusters(return_data=True, top_n=top_n, context=context)
+        days = context.days
         
         # 开始构建报告内容
         report_content = f"""# 产品数据分析报告
 
 ## 报告信息
 - **生成时间**: {current_time}
-- **分析范围**: 最近1天采集的数据
+- **分析范围**: 最近{days:g}天采集的数据
 - **数据来源**: product_data.db
 
-## 1. 平台增长率TOP5产品
+## 1. 平台增长率TOP{top_n}产品
 
 | 排名 | 店铺名称 | 产品名称 | 增长率 | 产品ID |
 |------|----------|----------|--------|--------|"""
         
-        # 添加平台TOP5产品表格
-        if top5_products:
-            for i, product in enumerate(top5_products, 1):
+        # 添加平台TOP N产品表格
+        if top_products:
+            for i, product in enumerate(top_products, 1):
                 shop_name = product['shop_name'][:30]  # 限制长度
                 product_name = product['name'][:50]    # 限制长度
                 growth_rate = product['growth_rate'] if product['growth_rate'] else "-"
@@ -308,9 +597,9 @@ def generate_markdown_report():
             report_content += "\n| - | 暂无数据 | 暂无数据 | - | - |"
         
         # 添加店铺产品分析部分
-        report_content += """
+        report_content += f"""
 
-## 2. 各店铺增长率TOP5产品
+## 2. 各店铺增长率TOP{top_n}产品
 
 """
         
@@ -333,12 +622,30 @@ def generate_markdown_report():
         else:
             report_content += "暂无店铺数据\n"
         
+        # 添加跨店铺同款产品部分：近似重复的标题归为同一款，按合计支付金额排名
+        report_content += f"""
+
+## 3. 跨店铺同款产品TOP{top_n}
+
+| 排名 | 产品名称 | 店铺数 | 产品数 | 合计支付金额 | 加权增长率 | 店铺 |
+|------|----------|--------|--------|--------------|------------|------|"""
+        
+        if top_clusters:
+            for i, cluster in enumerate(top_clusters, 1):
+                pay_amount = f"{cluster['pay_amount_mid']:,.0f}" if cluster['pay_amount_mid'] is not None else "-"
+                growth = f"{cluster['growth_mid']:.0f}%" if cluster['growth_mid'] is not None else "-"
+                shop_names = '、'.join(cluster['shop_names'])[:60]
+                report_content += (f"\n| {i} | {cluster['name'][:50]} | {cluster['shop_count']} | "
+                                   f"{cluster['product_count']} | {pay_amount} | {growth} | {shop_names} |")
+        else:
+            report_content += "\n| - | 暂无数据 | - | - | - | - | - |"
+        
         # 添加结论和建议部分
-        report_content += """
+        report_content += f"""
 
-## 3. 结论与建议
+## 4. 结论与建议
 
-根据对最近1天产品数据的分析，我们得出以下结论和建议：
+根据对最近{days:g}天产品数据的分析，我们得出以下结论和建议：
 
 1. **热门产品趋势**：平台增长率较高的产品主要集中在[根据实际数据填写相关品类]。
 
@@ -366,11 +673,14 @@ def generate_markdown_report():
         print(f"✅ Markdown分析报告已成功生成！")
         print(f"📄 报告文件：{report_filename}")
         print(f"📍 文件位置：{report_path}")
-        print(f"📊 报告内容：包含平台TOP5产品和各店铺TOP5产品")
+        print(f"📊 报告内容：包含平台TOP{top_n}产品、各店铺TOP{top_n}产品和跨店铺同款产品")
         print(f"💡 提示：可以用Markdown查看器或文本编辑器打开报告")
         
     except Exception as e:
         print(f"❌ 生成Markdown报告失败: {e}")
+    finally:
+        if owns_context:
+            context.close()
 
 def main():
     """主函数，调用HTML生成模块生成报告并打开"""
@@ -381,7 +691,8 @@ def main():
     # 导入并调用HTML生成模块
     try:
         from generate_html_report import generate_html_report
-        report_filename = generate_html_report()
+        with AnalysisContext() as context:
+            report_filename = generate_html_report(context)
         
         if report_filename:
             # 获取最新生成的HTML报告文件
@@ -416,4 +727,6 @@ def main():
     print("\n✅ 操作完成！")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # 不带参数时生成HTML报告并打开；子命令和导出参数见 analysis_cli.py
+    import analysis_cli
+    sys.exit(analysis_cli.main())
\ No newline at end of file
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite后台写入线程
+
+所有写操作都提交到一个专用线程中串行执行，该线程独占一个开启WAL模式的连接。
+事件循环中通过 await writer.run(fn, ...) 提交写任务，不会因为磁盘IO而阻塞
+Playwright的请求/响应处理。
+"""
+
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DatabaseWriter:
+    """在独立线程中持有SQLite连接并串行执行写操作"""
+
+    def __init__(self, db_path, init_fn=None):
+        self.db_path = db_path
+        self.conn = None
+        # 单线程执行器保证所有写操作按提交顺序串行执行
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-writer')
+        # 启动阶段同步等待连接建立和表结构初始化完成
+        self.executor.submit(self._open, init_fn).result()
+
+    def _open(self, init_fn):
+        """在写入线程中建立连接"""
+        self.conn = sqlite3.connect(self.db_path)
+        # WAL模式下读写互不阻塞，分析脚本可以在采集期间并发读取
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        if init_fn:
+            init_fn(self.conn)
+            self.conn.commit()
+
+    def _call(self, fn, args):
+        """在写入线程中执行一个写任务，整个任务为一个事务"""
+        try:
+            result = fn(self.conn, *args)
+            self.conn.commit()
+            return result
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    async def run(self, fn, *args):
+        """提交写任务并等待完成，fn的第一个参数为连接对象"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._call, fn, args)
+
+    def close(self):
+        """等待已提交的写任务完成后关闭连接"""
+        if self.conn is not None:
+            self.executor.submit(self.conn.close).result()
+            self.conn = None
+        self.executor.shutdown(wait=True)
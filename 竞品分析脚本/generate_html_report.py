@@ -1,53 +1,32 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+"""
+HTML分析报告
+
+页面由预编译的 string.Template 片段组成，逐段直接写入报告文件，不在内存中拼接整个文档；
+表格的行数据逐行写为JSON数组，以一段JSON嵌入页面，由页面末尾的小脚本
+只渲染滚动位置附近的几十行，并在浏览器中排序和筛选；行数增加到数千时DOM大小和打开速度
+基本不变。单元格由脚本用 textContent 写入，JSON中的 < 经过转义，其它代入模板的字段经过
+html.escape 转义，产品名中的 < & " 等字符不会破坏页面结构。报告先写入临时文件，
+写完后再替换正式文件，生成失败时不会留下写了一半的报告。
+二维码和缩略图默认作为外部文件写入 report_assets 目录（见 report_assets.py）。
+"""
 
 import os
 import datetime
+import html
+import itertools
+import json
+import string
 import webbrowser
 import glob
+from urllib.parse import urlsplit
 
 # 获取脚本所在目录的绝对路径
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def generate_html_report():
-    """生成美观的HTML格式分析报告"""
-    # 导入数据分析模块
-    import sys
-    import os
-    # 将当前脚本目录添加到Python路径
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    if script_dir not in sys.path:
-        sys.path.append(script_dir)
-    
-    # 导入数据分析函数
-    from analyze_data import analyze_top_growth_products, analyze_top_growth_by_shop, SCRIPT_DIR
-    
-    # 获取分析数据
-    print("📊 正在生成HTML报告...")
-    print("🔄 正在获取平台增长率TOP5产品数据...")
-    top5_products = analyze_top_growth_products(return_data=True)
-    
-    print("🔄 正在获取各店铺增长率TOP5产品数据...")
-    shop_top_products = analyze_top_growth_by_shop(return_data=True)
-    
-    try:
-        # 获取当前时间作为报告生成时间
-        current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        report_date = datetime.datetime.now().strftime('%Y%m%d')
-        
-        # 生成报告文件名，按日期生成唯一报告
-        report_filename = os.path.join(SCRIPT_DIR, f'竞品分析报告_{report_date}.html')
-        
-        print(f"📊 正在生成HTML报告: {report_filename}")
-        
-        # 构建HTML内容
-        html_content = '''<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>产品数据分析报告 - ''' + report_date + '''</title>
-    <style>
+# 报告样式，作为模板字段代入页面头部（普通字符串，花括号不需要转义，也不能含有$）
+REPORT_CSS = """
         /* 商业主题CSS样式 */
         * {
             margin: 0;
@@ -130,17 +109,17 @@ def generate_html_report():
             min-width: 120px;
         }
         
-        .table-container {{
+        .table-container {
             overflow-x: auto;
             margin: 20px 0;
-        }}
+        }
         
-        img {{
+        img {
             max-width: 100%;
             height: auto;
             border-radius: 4px;
             border: 1px solid #ddd;
-        }}
+        }
         
         table {
             width: 100%;
@@ -206,6 +185,87 @@ def generate_html_report():
             font-weight: 600;
         }
         
+        /* 虚拟滚动表格：固定行高，只渲染可见区域附近的行 */
+        .table-tools {
+            display: flex;
+            align-items: center;
+            gap: 12px;
+            margin: 15px 0 10px 0;
+        }
+        
+        .table-tools input {
+            flex: 0 1 320px;
+            padding: 6px 10px;
+            border: 1px solid #ccc;
+            border-radius: 4px;
+            font-size: 0.95em;
+        }
+        
+        .table-count {
+            color: #7f8c8d;
+            font-size: 0.9em;
+        }
+        
+        .table-viewport {
+            max-height: 70vh;
+            overflow: auto;
+            border: 1px solid #eee;
+            border-radius: 4px;
+        }
+        
+        .data-table table {
+            table-layout: fixed;
+        }
+        
+        .data-table th {
+            position: sticky;
+            top: 0;
+            z-index: 1;
+            cursor: pointer;
+            user-select: none;
+        }
+        
+        .data-table th.number {
+            width: 90px;
+        }
+        
+        .data-table th.image {
+            width: 135px;
+        }
+        
+        .data-table th.sorted-asc::after {
+            content: " ▲";
+        }
+        
+        .data-table th.sorted-desc::after {
+            content: " ▼";
+        }
+        
+        .data-table td {
+            height: 50px;
+            white-space: nowrap;
+            overflow: hidden;
+            text-overflow: ellipsis;
+        }
+        
+        .data-table td.image {
+            height: 127px;
+        }
+        
+        .data-table tr:nth-child(even) {
+            background-color: transparent;
+        }
+        
+        .data-table tr.odd {
+            background-color: #f9f9f9;
+        }
+        
+        .data-table tr.spacer td {
+            height: auto;
+            padding: 0;
+            border: 0;
+        }
+        
         /* 响应式设计 */
         @media (max-width: 768px) {
             .container {
@@ -228,201 +288,583 @@ def generate_html_report():
                 margin-bottom: 4px;
             }
         }
-    </style>
+"""
+
+# ---------------- 预编译的页面片段 ----------------
+
+PAGE_HEAD = string.Template('''<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>产品数据分析报告 - $report_date</title>
+    <style>$css    </style>
 </head>
 <body>
     <div class="container">
         <div class="header">
             <h1>产品数据分析报告</h1>
-            <p>基于最近1天采集的数据生成</p>
+            <p>基于最近${days}天采集的数据生成</p>
         </div>
-        
+
         <div class="section">
             <h2>报告信息</h2>
             <div class="info-box">
                 <div class="info-item">
                     <span class="info-label">生成时间:</span>
-                    <span>'''
-        
-        html_content += current_time
-        html_content += '''</span>
+                    <span>$current_time</span>
                 </div>
                 <div class="info-item">
                     <span class="info-label">分析范围:</span>
-                    <span>最近1天采集的数据</span>
+                    <span>最近${days}天采集的数据</span>
                 </div>
                 <div class="info-item">
                     <span class="info-label">数据来源:</span>
                     <span>product_data.db</span>
                 </div>
             </div>
-        </div>
-        
+        </div>''')
+
+SECTION_START = string.Template('''
+
         <div class="section">
-            <h2>1. 平台增长率TOP5产品</h2>
+            <h2>$title</h2>''')
+
+SECTION_END = '''
+        </div>'''
+
+SUBSECTION_TITLE = string.Template('''
+            <h3>$title</h3>''')
+
+TABLE_START = string.Template('''
             <div class="table-container">
                 <table>
                     <thead>
-                        <tr>
-                            <th>排名</th>
-                            <th>店铺名称</th>
-                            <th>产品名称</th>
-                            <th>增长率</th>
-                            <th>产品图片</th>
-                            <th>二维码</th>
-                            <th>产品ID</th>
+                        <tr>$header_cells
                         </tr>
                     </thead>
-                    <tbody>'''
-        
-        # 添加平台TOP5产品表格内容
-        if top5_products:
-            for i, product in enumerate(top5_products, 1):
-                shop_name = product['shop_name'][:30]  # 限制长度
-                product_name = product['name'][:50]    # 限制长度
-                growth_rate = product['growth_rate'] if product['growth_rate'] else "-"
-                
-                # 处理图片显示
-                pic_html = '<img src="' + product['pic'] + '" width="100" height="100">' if product['pic'] else '-'
-                qr_html = '<img src="' + product['qr_code'] + '" width="100" height="100">' if product['qr_code'] else '-'
-                
-                # 拼接HTML
-                html_content += "\n                        <tr>"
-                html_content += "\n                            <td>" + str(i) + "</td>"
-                html_content += "\n                            <td>" + shop_name + "</td>"
-                html_content += "\n                            <td>" + product_name + "</td>"
-                html_content += "\n                            <td>" + growth_rate + "</td>"
-                html_content += "\n                            <td>" + pic_html + "</td>"
-                html_content += "\n                            <td>" + qr_html + "</td>"
-                html_content += "\n                            <td>" + product['id'] + "</td>"
-                html_content += "\n                        </tr>"
-        else:
-            html_content += '''
-                        <tr>
-                            <td>-</td>
-                            <td>暂无数据</td>
-                            <td>暂无数据</td>
-                            <td>-</td>
-                            <td>-</td>
-                            <td>-</td>
-                            <td>-</td>
-                        </tr>'''
-        
-        html_content += '''
-                    </tbody>
-                </table>
-            </div>
-        </div>
-        
-        <div class="section">
-            <h2>2. 各店铺增长率TOP5产品</h2>'''
-        
-        # 添加店铺产品分析部分
-        if shop_top_products:
-            for shop_id, shop_info in shop_top_products.items():
-                shop_name = shop_info['name']
-                products = shop_info['products']
-                
-                html_content += '''
-            <h3>2.1 ''' + shop_name + '''</h3>
-            <div class="table-container">
-                <table>
-                    <thead>
-                        <tr>
-                                <th>排名</th>
-                                <th>产品名称</th>
-                                <th>增长率</th>
-                                <th>产品图片</th>
-                                <th>二维码</th>
-                                <th>产品ID</th>
-                            </tr>
-                    </thead>
-                    <tbody>'''
-                
-                if products:
-                    for i, product in enumerate(products, 1):
-                        product_name = product['name'][:50]  # 限制长度
-                        growth_rate = product['growth_rate'] if product['growth_rate'] else "-"
-                        
-                        # 处理图片显示
-                        pic_html = '<img src="' + product['pic'] + '" width="100" height="100">' if product['pic'] else '-'
-                        qr_html = '<img src="' + product['qr_code'] + '" width="100" height="100">' if product['qr_code'] else '-'
-                        
-                        # 拼接HTML
-                        html_content += "\n                        <tr>"
-                        html_content += "\n                            <td>" + str(i) + "</td>"
-                        html_content += "\n                            <td>" + product_name + "</td>"
-                        html_content += "\n                            <td>" + growth_rate + "</td>"
-                        html_content += "\n                            <td>" + pic_html + "</td>"
-                        html_content += "\n                            <td>" + qr_html + "</td>"
-                        html_content += "\n                            <td>" + product['id'] + "</td>"
-                        html_content += "\n                        </tr>"
-                else:
-                    html_content += '''
-                        <tr>
-                            <td>-</td>
-                            <td>暂无数据</td>
-                            <td>-</td>
-                            <td>-</td>
-                            <td>-</td>
-                            <td>-</td>
-                        </tr>'''
-                
-                html_content += '''
+                    <tbody>''')
+
+HEADER_CELL = string.Template('''
+                            <th>$label</th>''')
+
+ROW = string.Template('''
+                        <tr>$cells
+                        </tr>''')
+
+CELL = string.Template('''
+                            <td>$content</td>''')
+
+TABLE_END = '''
                     </tbody>
                 </table>
             </div>'''
-        else:
-            html_content += '''
-            <p>暂无店铺数据</p>'''
-        
-        # 添加结论和建议部分
-        html_content += '''
-        </div>
-        
+
+PARAGRAPH = string.Template('''
+            <p>$text</p>''')
+
+# 图片在滚动到附近时才加载，产品数量增加时页面打开速度不受影响
+IMAGE = string.Template('<img src="$src" width="100" height="100" loading="lazy" decoding="async">')
+
+# 虚拟滚动表格：行数据以JSON嵌入一次，由页面末尾的脚本按滚动位置渲染可见的行；
+# tbody中预先写出前几行静态内容，未启用JavaScript时仍能看到表格开头，脚本运行后被替换。
+# JSON的行数组在开始和结束片段之间逐批写入，总行数写完后才知道，降级提示放在表格之后
+DATA_TABLE_START = string.Template('''
+            <div class="data-table">
+                <div class="table-tools">
+                    <input type="search" placeholder="筛选：输入店铺、产品名称或ID">
+                    <span class="table-count"></span>
+                </div>
+                <div class="table-viewport">
+                    <table>
+                        <thead>
+                            <tr>$header_cells
+                            </tr>
+                        </thead>
+                        <tbody>$static_rows
+                        </tbody>
+                    </table>
+                </div>
+                <script type="application/json" class="table-data">{"columns":$columns,"rows":[''')
+
+DATA_TABLE_END = string.Template(''']}</script>
+                <noscript><p class="table-count">浏览器未启用JavaScript，仅显示前 $static_count / $total 行，无法筛选和排序</p></noscript>
+            </div>''')
+
+DATA_HEADER_CELL = string.Template('''
+                                <th class="$column_type" title="点击排序">$label</th>''')
+
+DATA_ROW = string.Template('''
+                            <tr class="$row_class">$cells
+                            </tr>''')
+
+DATA_CELL = string.Template('''
+                                <td class="$column_type">$content</td>''')
+
+# 每个表格预先写出的静态行数，以及JSON行数组每批写入的行数
+STATIC_ROW_COUNT = 20
+JSON_CHUNK_ROWS = 500
+
+# 表格脚本（普通字符串，不经过模板替换）：单元格一律用 textContent 和 img.src 写入，不拼接HTML
+DATA_TABLE_SCRIPT = '''
+
+    <script>
+    (function () {
+        var OVERSCAN = 8;
+        var collator = new Intl.Collator('zh-CN', {numeric: true});
+
+        function isEmpty(value) {
+            return value === null || value === '';
+        }
+
+        function compareValues(a, b, descending) {
+            if (isEmpty(a) || isEmpty(b)) {
+                // 空值无论升序降序都排在最后
+                return isEmpty(a) - isEmpty(b);
+            }
+            var result = typeof a === 'number' && typeof b === 'number' ? a - b : collator.compare(String(a), String(b));
+            return descending ? -result : result;
+        }
+
+        function setupTable(root) {
+            var payload = JSON.parse(root.querySelector('script.table-data').textContent);
+            var columns = payload.columns;
+            var rows = payload.rows;
+            var total = rows.length;
+            var viewport = root.querySelector('.table-viewport');
+            var tbody = root.querySelector('tbody');
+            var headers = root.querySelectorAll('th');
+            var filterInput = root.querySelector('input');
+            var counter = root.querySelector('.table-count');
+            var hasImages = columns.some(function (column) { return column.type === 'image'; });
+            var rowHeight = hasImages ? 128 : 51;
+            var measured = false;
+            var view = [];
+            var searchText = null;
+            var sortColumn = -1;
+            var descending = false;
+            var pending = false;
+
+            function makeCell(column, value) {
+                var td = document.createElement('td');
+                td.className = column.type;
+                if (isEmpty(value)) {
+                    td.textContent = '-';
+                } else if (column.type === 'image') {
+                    var img = document.createElement('img');
+                    img.width = 100;
+                    img.height = 100;
+                    img.loading = 'lazy';
+                    img.decoding = 'async';
+                    img.src = value;
+                    td.appendChild(img);
+                } else {
+                    td.textContent = value;
+                    td.title = value;
+                }
+                return td;
+            }
+
+            function makeSpacer(height) {
+                var tr = document.createElement('tr');
+                var td = document.createElement('td');
+                tr.className = 'spacer';
+                td.colSpan = columns.length;
+                td.style.height = height + 'px';
+                tr.appendChild(td);
+                return tr;
+            }
+
+            function render() {
+                pending = false;
+                var fragment = document.createDocumentFragment();
+                if (!view.length) {
+                    var empty = makeSpacer(0);
+                    empty.firstChild.textContent = total ? '没有匹配的行' : '暂无数据';
+                    empty.firstChild.style.padding = '12px 15px';
+                    fragment.appendChild(empty);
+                    tbody.textContent = '';
+                    tbody.appendChild(fragment);
+                    return;
+                }
+                var height = Math.max(viewport.clientHeight, window.innerHeight * 0.7);
+                var start = Math.max(0, Math.floor(viewport.scrollTop / rowHeight) - OVERSCAN);
+                var end = Math.min(view.length, Math.ceil((viewport.scrollTop + height) / rowHeight) + OVERSCAN);
+                fragment.appendChild(makeSpacer(start * rowHeight));
+                for (var i = start; i < end; i++) {
+                    var tr = document.createElement('tr');
+                    var row = view[i];
+                    tr.className = i % 2 ? 'odd' : '';
+                    for (var c = 0; c < columns.length; c++) {
+                        tr.appendChild(makeCell(columns[c], rows[row][c]));
+                    }
+                    fragment.appendChild(tr);
+                }
+                fragment.appendChild(makeSpacer((view.length - end) * rowHeight));
+                tbody.textContent = '';
+                tbody.appendChild(fragment);
+                if (!measured) {
+                    // 按实际渲染的行高修正一次（字体和缩放会影响行高）
+                    measured = true;
+                    var actual = tbody.children[1].getBoundingClientRect().height;
+                    if (actual && Math.abs(actual - rowHeight) > 0.5) {
+                        rowHeight = actual;
+                        render();
+                    }
+                }
+            }
+
+            function schedule() {
+                if (!pending) {
+                    pending = true;
+                    window.requestAnimationFrame(render);
+                }
+            }
+
+            function buildSearchText() {
+                searchText = new Array(total);
+                for (var row = 0; row < total; row++) {
+                    var parts = [];
+                    for (var c = 0; c < columns.length; c++) {
+                        if (columns[c].type !== 'image' && !isEmpty(rows[row][c])) {
+                            parts.push(String(rows[row][c]).toLowerCase());
+                        }
+                    }
+                    searchText[row] = parts.join('\\u0001');
+                }
+            }
+
+            function update() {
+                var query = filterInput.value.trim().toLowerCase();
+                view = [];
+                if (query && !searchText) {
+                    buildSearchText();
+                }
+                for (var row = 0; row < total; row++) {
+                    if (!query || searchText[row].indexOf(query) !== -1) {
+                        view.push(row);
+                    }
+                }
+                if (sortColumn >= 0) {
+                    var column = columns[sortColumn];
+                    var key = column.sort === undefined ? sortColumn : column.sort;
+                    view.sort(function (a, b) {
+                        return compareValues(rows[a][key], rows[b][key], descending) || a - b;
+                    });
+                }
+                counter.textContent = query ? '显示 ' + view.length + ' / ' + total + ' 行' : '共 ' + total + ' 行';
+                viewport.scrollTop = 0;
+                render();
+            }
+
+            Array.prototype.forEach.call(headers, function (header, index) {
+                header.addEventListener('click', function () {
+                    descending = sortColumn === index ? !descending : false;
+                    sortColumn = index;
+                    Array.prototype.forEach.call(headers, function (other) {
+                        other.classList.remove('sorted-asc', 'sorted-desc');
+                    });
+                    header.classList.add(descending ? 'sorted-desc' : 'sorted-asc');
+                    update();
+                });
+            });
+            var filterTimer = null;
+            filterInput.addEventListener('input', function () {
+                window.clearTimeout(filterTimer);
+                filterTimer = window.setTimeout(update, 150);
+            });
+            viewport.addEventListener('scroll', schedule, {passive: true});
+            window.addEventListener('resize', schedule);
+            update();
+        }
+
+        Array.prototype.forEach.call(document.querySelectorAll('.data-table'), setupTable);
+    })();
+    </script>'''
+
+PAGE_TAIL = string.Template('''
+
         <div class="section">
-            <h2>3. 结论与建议</h2>
+            <h2>$number. 结论与建议</h2>
             <div class="conclusion">
-                <p>根据对最近1天产品数据的分析，我们得出以下结论和建议：</p>
-                
+                <p>根据对最近${days}天产品数据的分析，我们得出以下结论和建议：</p>
+
                 <h4>热门产品趋势</h4>
                 <p>平台增长率较高的产品主要集中在<span class="highlight">[根据实际数据填写相关品类]</span>。</p>
-                
+
                 <h4>店铺竞争力</h4>
                 <p>从店铺维度看，<span class="highlight">[根据实际数据填写表现较好的店铺]</span>在增长率方面表现突出。</p>
-                
+
                 <h4>产品优化建议</h4>
                 <ul>
                     <li>关注增长率较高的产品特点，借鉴其成功经验</li>
                     <li>定期更新产品信息，保持数据的时效性</li>
                     <li>结合市场趋势，适时调整产品策略</li>
                 </ul>
-                
+
                 <h4>数据质量评估</h4>
                 <p>本次分析基于<span class="highlight">[具体数据量]</span>条产品数据，数据完整性良好。</p>
             </div>
         </div>
-        
+
         <div class="footer">
             <p>报告生成工具: 产品数据分析助手 v1.0 | 数据更新频率: 每日自动更新</p>
         </div>
     </div>
 </body>
-</html>'''
-        
-        # 写入HTML文件
-        with open(report_filename, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
+</html>
+''')
+
+TOP_PRODUCT_HEADERS = ['排名', '店铺名称', '产品名称', '增长率', '产品图片', '二维码', '产品ID']
+SHOP_PRODUCT_HEADERS = ['排名', '产品名称', '增长率', '产品图片', '二维码', '产品ID']
+
+# 虚拟滚动表格的列：(表头, 类型, 排序依据)，排序依据为行中显示列之后的附加值的序号，
+# 如增长率按数值而不是按文字排序；类型为 number/text/image
+TOP_PRODUCT_COLUMNS = [
+    ('排名', 'number', None), ('店铺名称', 'text', None), ('产品名称', 'text', None), ('增长率', 'text', 0),
+    ('产品图片', 'image', None), ('二维码', 'image', None), ('产品ID', 'text', None),
+]
+SHOP_PRODUCT_COLUMNS = [
+    ('店铺名称', 'text', None), ('店铺内排名', 'number', None), ('产品名称', 'text', None), ('增长率', 'text', 0),
+    ('产品图片', 'image', None), ('二维码', 'image', None), ('产品ID', 'text', None),
+]
+CLUSTER_COLUMNS = [
+    ('排名', 'number', None), ('产品名称', 'text', None), ('店铺数', 'number', None), ('产品数', 'number', None),
+    ('合计支付金额', 'text', 0), ('加权增长率', 'text', 1), ('店铺', 'text', None),
+]
+
+
+# ---------------- 字段转义 ----------------
+
+def escape(value, limit=None):
+    """把字段转为转义后的HTML文本，空值显示为 -，limit为转义前截断的字符数"""
+    if value is None or value == '':
+        return '-'
+    text = str(value)
+    return html.escape(text[:limit] if limit else text)
+
+
+def safe_image_src(src):
+    """只接受http(s)、相对路径和 data:image/ 图片地址，其它协议（如javascript:）返回None"""
+    if not src:
+        return None
+    scheme = urlsplit(src).scheme.lower()
+    if scheme not in ('', 'http', 'https') and not src.startswith('data:image/'):
+        return None
+    return src
+
+
+def image_html(src):
+    """图片单元格，不安全的地址显示为 -"""
+    src = safe_image_src(src)
+    return IMAGE.substitute(src=html.escape(src)) if src else '-'
+
+
+def format_amount(value):
+    return f"{value:,.0f}" if value is not None else None
+
+
+def format_percent(value):
+    return f"{value:.0f}%" if value is not None else None
+
+
+# ---------------- 分段写出 ----------------
+
+def write_table(out, headers, rows):
+    """写出一个表格，rows为单元格HTML片段列表的可迭代对象，没有行时写一行占位"""
+    out.write(TABLE_START.substitute(
+        header_cells=''.join(HEADER_CELL.substitute(label=escape(label)) for label in headers)
+    ))
+    empty = True
+    for cells in rows:
+        empty = False
+        out.write(ROW.substitute(cells=''.join(CELL.substitute(content=content) for content in cells)))
+    if empty:
+        placeholder = ['-', '暂无数据'] + ['-'] * (len(headers) - 2)
+        out.write(ROW.substitute(cells=''.join(CELL.substitute(content=content) for content in placeholder)))
+    out.write(TABLE_END)
+
+
+def to_json(value):
+    """紧凑的JSON文本，< 写为 \\u003c，字段中的 </script> 不会提前结束脚本块"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).replace('<', '\\u003c')
+
+
+def write_data_table(out, columns, rows):
+    """写出一个虚拟滚动表格，rows为值元组的可迭代对象（显示列的值之后跟排序依据的附加值）
+
+    前 STATIC_ROW_COUNT 行同时写为静态的表格行，未启用JavaScript时作为降级显示。
+    行数据逐行转为JSON数组，每 JSON_CHUNK_ROWS 行写入一次，内存中只保留一批行，
+    列定义只出现一次。
+    """
+    rows = iter(rows)
+    static_rows = list(itertools.islice(rows, STATIC_ROW_COUNT))
+    out.write(DATA_TABLE_START.substitute(
+        header_cells=''.join(
+            DATA_HEADER_CELL.substitute(column_type=column_type, label=escape(label))
+            for label, column_type, _ in columns
+        ),
+        static_rows=''.join(
+            DATA_ROW.substitute(
+                row_class='odd' if i % 2 else '',
+                cells=''.join(
+                    DATA_CELL.substitute(
+                        column_type=column_type,
+                        content=image_html(value) if column_type == 'image' else escape(value),
+                    )
+                    for (_, column_type, _), value in zip(columns, values)
+                ),
+            )
+            for i, values in enumerate(static_rows)
+        ),
+        columns=to_json([
+            {'label': label, 'type': column_type, **({'sort': len(columns) + sort} if sort is not None else {})}
+            for label, column_type, sort in columns
+        ]),
+    ))
+    total = 0
+    pending = itertools.chain(static_rows, rows)
+    while True:
+        chunk = [to_json(list(values)) for values in itertools.islice(pending, JSON_CHUNK_ROWS)]
+        if not chunk:
+            break
+        out.write((',' if total else '') + ','.join(chunk))
+        total += len(chunk)
+    out.write(DATA_TABLE_END.substitute(static_count=len(static_rows), total=total))
+
+
+def top_product_rows(products):
+    for i, product in enumerate(products, 1):
+        yield (
+            i, product['shop_name'], product['name'], product['growth_rate'],
+            safe_image_src(product['pic']), safe_image_src(product['qr_code']), product['id'],
+            product['growth_value'],
+        )
+
+
+def shop_product_rows(shop_top_products):
+    for shop_info in shop_top_products.values():
+        for i, product in enumerate(shop_info['products'], 1):
+            yield (
+                shop_info['name'], i, product['name'], product['growth_rate'],
+                safe_image_src(product['pic']), safe_image_src(product['qr_code']), product['id'],
+                product['growth_value'],
+            )
+
+
+def cluster_rows(clusters):
+    for i, cluster in enumerate(clusters, 1):
+        yield (
+            i, cluster['name'], cluster['shop_count'], cluster['product_count'],
+            format_amount(cluster['pay_amount_mid']), format_percent(cluster['growth_mid']),
+            '、'.join(cluster['shop_names']),
+            cluster['pay_amount_mid'], cluster['growth_mid'],
+        )
+
+
+def render_html_report(out, top_products, shop_top_products, top_clusters, current_time, report_date, top_n=5, days=1):
+    """把分析结果逐段写入文件对象out，表格数据以JSON嵌入，由页面脚本渲染；days为分析的时间窗口天数"""
+    out.write(PAGE_HEAD.substitute(
+        css=REPORT_CSS, report_date=escape(report_date), current_time=escape(current_time), days=f'{days:g}'
+    ))
+
+    out.write(SECTION_START.substitute(title=f'1. 平台增长率TOP{top_n}产品'))
+    write_data_table(out, TOP_PRODUCT_COLUMNS, top_product_rows(top_products or []))
+    out.write(SECTION_END)
+
+    out.write(SECTION_START.substitute(title=f'2. 各店铺增长率TOP{top_n}产品'))
+    write_data_table(out, SHOP_PRODUCT_COLUMNS, shop_product_rows(shop_top_products or {}))
+    out.write(SECTION_END)
+
+    out.write(SECTION_START.substitute(title=f'3. 跨店铺同款产品TOP{top_n}'))
+    write_data_table(out, CLUSTER_COLUMNS, cluster_rows(top_clusters or []))
+    out.write(SECTION_END)
+
+    out.write(DATA_TABLE_SCRIPT)
+    out.write(PAGE_TAIL.substitute(number=4, days=f'{days:g}'))
+
+
+def generate_html_report(context=None, inline_images=False, thumbnails=False, top_n=5):
+    """生成美观的HTML格式分析报告，传入共享的 AnalysisContext 时复用其中的连接和分析结果
+    
+    默认把二维码按内容哈希写入报告旁的 report_assets 目录并以相对地址引用；inline_images为True时
+    沿用内联base64二维码，生成单个自包含文件。thumbnails为True时把产品主图下载为本地缩略图（需要Pillow）。
+    top_n为各表格取前N个，表格在浏览器中虚拟滚动，取数百个时页面仍然可以流畅打开。
+    报告的分析范围取自context的时间窗口。
+    """
+    # 导入数据分析模块
+    import sys
+    import os
+    # 将当前脚本目录添加到Python路径
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    if script_dir not in sys.path:
+        sys.path.append(script_dir)
+
+    # 导入数据分析函数
+    from analyze_data import (
+        AnalysisContext, analyze_top_clusters, analyze_top_growth_products, analyze_top_growth_by_shop, SCRIPT_DIR
+    )
+    from report_assets import ASSETS_DIRNAME, ReportAssets
+
+    owns_context = context is None
+    context = context or AnalysisContext()
+
+    # 获取分析数据
+    print("📊 正在生成HTML报告...")
+    print(f"🔄 正在获取平台增长率TOP{top_n}产品数据...")
+    top_products = analyze_top_growth_products(return_data=True, top_n=top_n, context=context)
+
+    print(f"🔄 正在获取各店铺增长率TOP{top_n}产品数据...")
+    shop_top_products = analyze_top_growth_by_shop(return_data=True, top_n=top_n, context=context)
+
+    print("🔄 正在获取跨店铺同款产品数据...")
+    top_clusters = analyze_top_clusters(return_data=True, top_n=top_n, context=context)
+
+    # 只为报告中实际展示的产品读取二维码图片
+    displayed_products = list(top_products or [])
+    for shop_info in (shop_top_products or {}).values():
+        displayed_products.extend(shop_info['products'])
+    assets = None
+    if not inline_images:
+        assets = ReportAssets(os.path.join(SCRIPT_DIR, ASSETS_DIRNAME), thumbnails=thumbnails)
+        if thumbnails and not assets.thumbnails:
+            print("⚠️  未安装Pillow，产品图片仍直接引用原图地址：pip install Pillow")
+    context.resolve_qr_codes(displayed_products, assets)
+    if assets is not None:
+        thumbnail_urls = assets.thumbnail_urls(product['pic'] for product in displayed_products)
+        for product in displayed_products:
+            product['pic'] = thumbnail_urls.get(product['pic'], product['pic'])
+        print(f"🖼️  图片资源目录: {assets.root_dir}（本次新写入 {assets.written} 个文件）")
+    if owns_context:
+        context.close()
+
+    try:
+        # 获取当前时间作为报告生成时间
+        current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        report_date = datetime.datetime.now().strftime('%Y%m%d')
+
+        # 生成报告文件名，按日期生成唯一报告
+        report_filename = os.path.join(SCRIPT_DIR, f'竞品分析报告_{report_date}.html')
+
+        print(f"📊 正在生成HTML报告: {report_filename}")
+
+        # 逐段写入临时文件，完成后替换正式报告
+        temp_filename = report_filename + '.tmp'
+        with open(temp_filename, 'w', encoding='utf-8') as f:
+            render_html_report(
+                f, top_products, shop_top_products, top_clusters, current_time, report_date, top_n, context.days
+            )
+        os.replace(temp_filename, report_filename)
+
         # 打印成功信息
         report_path = os.path.abspath(report_filename)
         print(f"✅ HTML分析报告已成功生成！")
         print(f"📄 报告文件：{report_filename}")
         print(f"📍 文件位置：{report_path}")
         print(f"💡 提示：可以用浏览器打开查看HTML报告")
-        
+
         return report_filename
-        
+
     except Exception as e:
         print(f"❌ 生成HTML报告失败: {e}")
         return None
@@ -451,13 +893,8 @@ def open_report(report_file):
             return False
 
 if __name__ == "__main__":
-    # 导入数据准备模块并生成报告
-    # 注意：这里需要确保analyze_data.py已经更新为只返回数据
     import analyze_data
     
-    print("📊 正在获取产品数据...")
-    top5_products = analyze_data.analyze_top_growth_products(return_data=True)
-    shop_top_products = analyze_data.analyze_top_growth_by_shop(return_data=True)
-    
-    report_file = generate_html_report(top5_products, shop_top_products)
-    open_report(report_file)
\ No newline at end of file
+    with analyze_data.AnalysisContext() as context:
+        report_file = generate_html_report(context)
+    open_report(report_file)
@@ -1,23 +1,178 @@
 import asyncio
 import json
-import re
 import os
-import sqlite3
+import sys
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from playwright.async_api import async_playwright
 from playwright.async_api import Request, Response
 
 # 获取脚本所在目录的绝对路径
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 将项目根目录加入模块搜索路径，以便复用common下的公共模块
+PROJECT_DIR = os.path.dirname(SCRIPT_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.append(PROJECT_DIR)
+
+from common.rate_limiter import TokenBucket, AdaptiveBackoff, LatencyStats
+from db_writer import DatabaseWriter
+from product_clusters import assign_clusters
+from product_db import (
+    DB_PATH, RANGE_VALUE_COLUMNS, archive_raw_payload, ensure_schema, load_latest_snapshots, range_values,
+    snapshot_fingerprint, store_qr_codes
+)
+from common.browser_launcher import open_browser, get_page, timed_goto
+from common.http_client import HTTP_CLIENT_AVAILABLE, ApiClient
+from response_routes import PRODUCTS, ROUTES_BY_NAME, SHOP_LIST, extract_records, match_route
+
+# 自动采集的默认并发数和限速（请求/秒），可通过环境变量调整
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get('JP_MAX_CONCURRENCY', '4'))
+DEFAULT_REQUESTS_PER_SECOND = float(os.environ.get('JP_REQUESTS_PER_SECOND', '2'))
+# 单个店铺失败后的最大尝试次数及重试基础间隔（秒），重试间隔按指数增长
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get('JP_MAX_ATTEMPTS', '3'))
+RETRY_BASE_DELAY = 2.0
+
+# 批量采集的维度矩阵：每个店铺按 日期范围 × 类目 展开，每个组合再逐页采集直到数据取完。
+# 日期范围和类目以JSON列表配置，每个元素是覆盖到请求模板post_data上的字段，例如：
+#   JP_SWEEP_DATE_RANGES='[{"date_type": 1}, {"date_type": 7}, {"date_type": 30}]'
+#   JP_SWEEP_CATEGORIES='[{"first_cid": "20000"}, {"first_cid": "20117"}]'
+# 未配置时只使用模板中捕获到的日期范围和类目
+SWEEP_DATE_RANGES = json.loads(os.environ.get('JP_SWEEP_DATE_RANGES', '[{}]'))
+SWEEP_CATEGORIES = json.loads(os.environ.get('JP_SWEEP_CATEGORIES', '[{}]'))
+# 每个组合最多采集的页数
+DEFAULT_MAX_PAGES = int(os.environ.get('JP_MAX_PAGES', '10'))
+# 批量采集是否通过直连HTTP客户端发送请求（需安装httpx），设为0时经由浏览器的page.request发送
+DEFAULT_DIRECT_HTTP = os.environ.get('JP_DIRECT_HTTP', '1') != '0'
+# 请求模板中可能表示页码/每页数量的字段名，按顺序取第一个存在的
+PAGE_FIELDS = ('page', 'page_no', 'page_num', 'pageNo', 'page_index', 'current_page', 'current')
+PAGE_SIZE_FIELDS = ('page_size', 'pageSize', 'size', 'limit')
+
+
+# 协调器在没有事件时打印状态提示的间隔（秒）
+STATUS_INTERVAL = 30
+
+
+# ---------------- 响应处理器产生的事件 ----------------
+
+@dataclass
+class ShopListCaptured:
+    """捕获到同行店铺列表"""
+    shops: list
+
+
+@dataclass
+class TemplateCaptured:
+    """捕获到产品信息请求，可作为自动采集的请求模板"""
+    template: dict
+
+
+@dataclass
+class ProductsCaptured:
+    """捕获到某个店铺的产品数据"""
+    shop_id: str
+    rows: list
+    shop_name: str = None
+
+
+# ---------------- 批量采集的任务矩阵 ----------------
+
+def find_field(post_data, candidates):
+    """返回post_data中第一个存在的候选字段名，都不存在时返回None"""
+    return next((field for field in candidates if field in post_data), None)
+
+
+def expand_sweep_jobs(post_data, date_ranges=None, categories=None):
+    """把请求模板按 日期范围 × 类目 展开，返回 [(query_dims, post_data)]
+    
+    query_dims为该组合相对模板覆盖字段的规范化JSON，未覆盖任何字段时为空字符串，
+    入库时作为快照比对的一部分，避免不同维度的数据互相覆盖。
+    """
+    jobs = []
+    for date_range in date_ranges or SWEEP_DATE_RANGES:
+        for category in categories or SWEEP_CATEGORIES:
+            overrides = {**date_range, **category}
+            query_dims = json.dumps(overrides, ensure_ascii=False, sort_keys=True) if overrides else ''
+            jobs.append((query_dims, {**post_data, **overrides}))
+    return jobs
+
+
+# ---------------- 数据库写入函数（均在后台写入线程中执行） ----------------
+
+def write_shop_rows(conn, rows):
+    """批量UPSERT店铺信息，rows为 (shop_id, shop_name, last_updated)，名称为空时保留已有名称"""
+    conn.executemany(
+        '''INSERT INTO shops (shop_id, shop_name, last_updated)
+        VALUES (?1, COALESCE(?2, '未知店铺'), ?3)
+        ON CONFLICT(shop_id) DO UPDATE SET
+            shop_name = COALESCE(?2, shops.shop_name),
+            last_updated = excluded.last_updated''',
+        rows
+    )
+    return len(rows)
+
+
+def write_product_rows(conn, shop_id, shop_name, rows, captured_at, snapshots):
+    """在一个事务中写入店铺信息和一批产品数据，返回 (新增快照数, 未变化数)
+    
+    rows最后两列为查询维度和原始qr_code，PNG二维码解码后存入blobs表，产品行只保存其哈希；
+    价格、支付金额、增长率、曝光人数等区间字符串同时解析为 _low/_high/_mid 数值列。
+    snapshots为 {shop_id: {(product_id, query_dims): (快照行id, 指纹)}} 的内存映射，首次遇到
+    某店铺时从数据库加载；指纹与最新快照相同的产品只更新 last_seen_at，不插入新行。
+    首次出现的产品同时分配近似重复聚类（见 product_clusters）。
+    """
+    if shop_id:
+        write_shop_rows(conn, [(shop_id, shop_name, captured_at)])
+    latest = snapshots.get(shop_id)
+    if latest is None:
+        latest = snapshots[shop_id] = load_latest_snapshots(conn, shop_id)
+    
+    changed = []
+    seen_ids = []
+    for row in rows:
+        fingerprint = snapshot_fingerprint(row[1], *row[3:7])
+        snapshot = latest.get((row[0], row[9])) if row[0] else None
+        if snapshot and snapshot[1] == fingerprint:
+            seen_ids.append((captured_at, snapshot[0]))
+        else:
+            changed.append((row, fingerprint))
+    
+    if seen_ids:
+        conn.executemany("UPDATE products SET last_seen_at = ? WHERE id = ?", seen_ids)
+    
+    qr_hashes = store_qr_codes(conn, [row[-1] for row, _ in changed])
+    columns = [
+        'product_id', 'product_name', 'product_pic', 'price_range', 'pay_amount',
+        'pay_amount_growth_rate', 'impressions_people_num', 'shop_id', 'captured_at',
+        'query_dims', 'qr_code', 'qr_code_hash', 'fingerprint', 'last_seen_at'
+    ] + RANGE_VALUE_COLUMNS
+    sql = f"INSERT INTO products ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    for row, fingerprint in changed:
+        cursor = conn.execute(
+            sql,
+            row[:-1]
+            + ((None, qr_hashes[row[-1]]) if row[-1] in qr_hashes else (row[-1], None))
+            + (fingerprint, captured_at)
+            + range_values(row[3:7])
+        )
+        # 新快照成为该产品的最新快照（没有产品ID的记录无法比对，每次都插入）
+        if row[0]:
+            latest[(row[0], row[9])] = (cursor.lastrowid, fingerprint)
+    # 首次出现的产品在同一事务中分配近似重复聚类，已分配的产品直接跳过
+    assign_clusters(conn, [(row[0], row[1]) for row, _ in changed if row[0]])
+    return len(changed), len(seen_ids)
+
 
 # 产品分析和报告生成类
 class ProductAnalyzer:
-    def __init__(self):
-        self.products_data = []
-        self.request_captured = False
-        self.current_shop_id = None
-        self.current_shop_name = None
-        self.db_conn = None
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        # 事件队列：响应处理器只负责产生事件，由协调器统一消费
+        self.events = asyncio.Queue()
+        # 当前正在执行的自动采集任务
+        self.collection_task = None
+        self.db_writer = None
+        # 每个店铺下各产品在各查询维度下的最新快照 {shop_id: {(product_id, query_dims): (快照行id, 指纹)}}，只在写入线程中读写
+        self.latest_snapshots = {}
         self.initialize_database()
         # 新增：存储店铺列表
         self.shop_list = []
@@ -31,364 +186,169 @@ class ProductAnalyzer:
         self.current_page = None
         # 新增：存储原始请求模板
         self.products_request_template = None
+        # 自动采集的并发数和请求速率限制
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        # 当前采集批次ID，用于断点续采
+        self.run_id = None
+        # 单个店铺在一次运行中的最大尝试次数
+        self.max_attempts = max_attempts
     
     def initialize_database(self):
-        """初始化SQLite数据库"""
+        """初始化SQLite数据库，启动后台写入线程"""
         try:
-            # 使用脚本目录路径连接到SQLite数据库
-            db_path = os.path.join(SCRIPT_DIR, 'product_data.db')
-            self.db_conn = sqlite3.connect(db_path)
-            cursor = self.db_conn.cursor()
-            
-            # 创建店铺表
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shops (
-                shop_id TEXT PRIMARY KEY,
-                shop_name TEXT,
-                last_updated TIMESTAMP
-            )
-            ''')
-            
-            # 创建产品表
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id TEXT,
-                product_name TEXT,
-                product_pic TEXT,
-                price_range TEXT,
-                pay_amount TEXT,
-                pay_amount_growth_rate TEXT,
-                impressions_people_num TEXT,
-                shop_id TEXT,
-                captured_at TIMESTAMP,
-                qr_code TEXT,
-                FOREIGN KEY (shop_id) REFERENCES shops (shop_id)
-            )
-            ''')
-            
-            # 创建索引以提高查询性能
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_shop_id ON products(shop_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_captured_at ON products(captured_at)')
-            
-            self.db_conn.commit()
+            # 使用脚本目录下的数据库文件，启动时自动执行表结构迁移
+            self.db_writer = DatabaseWriter(DB_PATH, init_fn=ensure_schema)
             print("✅ 数据库初始化成功")
         except Exception as e:
             print(f"❌ 数据库初始化失败: {e}")
     
-    async def handle_request(self, request):
-        """处理请求，提取关键信息"""
-        url = request.url
-        
-        # 只保留关键URL捕获信息
-        if "get_sub_peer_shop_list" in url:
-            print(f"📨 捕获到店铺列表请求: {url}")
-            # 强制设置请求捕获标志
-            self.request_captured = True
-            try:
-                # 尝试获取请求体数据
-                if request.post_data:
-                    try:
-                        post_data = json.loads(request.post_data)
-                        # 保存请求模板，用于后续自动发送请求
-                        self.products_request_template = {
-                            'url': url,
-                            'method': request.method,
-                            'headers': dict(request.headers),
-                            'post_data': post_data
-                        }
-                    except Exception as e:
-                        pass
-            except Exception as e:
-                pass
+    def close_database(self):
+        """等待所有写入完成并关闭数据库连接"""
+        if self.db_writer:
+            self.db_writer.close()
+            self.db_writer = None
+            print("✅ 数据库连接已关闭")
+    
+    async def handle_request(self, request, route=None):
+        """处理请求，捕获产品信息请求作为自动采集的请求模板"""
+        route = route or match_route(request.url)
+        if route is None or route.name != PRODUCTS:
+            return
         
-        # 处理产品信息请求 - 使用更灵活的匹配
-        elif "business_chance_center" in url and "peer_shop_top_sale_goods_info" in url:
-            print(f"📨 捕获到产品信息请求: {url}")
-            # 设置请求捕获标志
-            self.request_captured = True
-            try:
-                # 保存请求模板，用于后续自动发送请求
-                if request.post_data:
-                    try:
-                        post_data = json.loads(request.post_data)
-                        # 保存请求模板
-                        self.products_request_template = {
-                            'url': url,
-                            'method': request.method,
-                            'headers': dict(request.headers),
-                            'post_data': post_data
-                        }
-                        
-                        # 检查是否包含店铺相关信息
-                        if isinstance(post_data, dict):
-                            # 保存当前处理的店铺信息
-                            if 'shop_id' in post_data:
-                                self.current_shop_id = post_data['shop_id']
-                            if 'shop_name' in post_data:
-                                self.current_shop_name = post_data['shop_name']
-                    except:
-                        pass
-            except Exception as e:
-                pass
+        url = request.url
+        print(f"📨 捕获到产品信息请求: {url}")
+        try:
+            # 保存请求模板，用于后续自动发送请求
+            if request.post_data:
+                post_data = json.loads(request.post_data)
+                self.events.put_nowait(TemplateCaptured({
+                    'url': url,
+                    'method': request.method,
+                    'headers': dict(request.headers),
+                    'post_data': post_data
+                }))
+        except Exception as e:
+            print(f"⚠️  解析产品信息请求体失败: {e}")
     
-    async def handle_response(self, response):
-        """处理响应，提取店铺和产品数据"""
+    async def handle_response(self, response, route=None):
+        """处理响应：按路由表提取数据，交给路由指定的处理方法"""
+        route = route or match_route(response.url)
+        if route is None:
+            return
+        
         url = response.url
-        request = response.request
+        if route.name == SHOP_LIST and response.status != 200:
+            return
+        print(f"📨 捕获到{route.label}响应: {url}")
+        try:
+            body = await response.body()
+        except Exception as e:
+            print(f"❌ 读取{route.label}响应失败: {e}")
+            return
         
-        # 处理店铺列表请求 - 使用更宽松的匹配规则
-        if "get_sub_peer_shop_list" in url or ("peer_shop" in url and "list" in url):
-            # 强制设置请求捕获标志
-            self.request_captured = True
-            try:
-                # 检查响应状态码
-                if response.status == 200:
-                    # 解析JSON响应
-                    try:
-                        data = await response.json()
-                        
-                        # 保存完整的响应数据到临时文件（带时间戳）
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                        shop_list_file = os.path.join(SCRIPT_DIR, f'shop_list_{timestamp}.json')
-                        with open(shop_list_file, 'w', encoding='utf-8') as f:
-                            json.dump(data, f, ensure_ascii=False, indent=2)
-                        
-                        # 尝试多种可能的数据结构路径
-                        # 路径1: data.peer_shop_list
-                        if isinstance(data, dict):
-                            # 检查直接在data中的情况
-                            if 'peer_shop_list' in data:
-                                shop_list = data['peer_shop_list']
-                                # 保存店铺列表到实例变量，用于后续自动采集
-                                self.shop_list = shop_list
-                                self.got_shop_list = True
-                                print(f"✅ 成功获取店铺列表，包含 {len(shop_list)} 个店铺")
-                                # 保存店铺信息到数据库
-                                self.save_shop_list_to_database(shop_list)
-                            # 路径2: data.data.peer_shop_list
-                            elif 'data' in data and isinstance(data['data'], dict) and 'peer_shop_list' in data['data']:
-                                shop_list = data['data']['peer_shop_list']
-                                # 保存店铺列表到实例变量，用于后续自动采集
-                                self.shop_list = shop_list
-                                self.got_shop_list = True
-                                print(f"✅ 成功获取店铺列表，包含 {len(shop_list)} 个店铺")
-                                # 保存店铺信息到数据库
-                                self.save_shop_list_to_database(shop_list)
-                            # 路径3: 检查其他可能的键名
-                            elif 'data' in data and isinstance(data['data'], dict) and 'list' in data['data']:
-                                shop_list = data['data']['list']
-                                if isinstance(shop_list, list) and len(shop_list) > 0 and isinstance(shop_list[0], dict):
-                                    # 保存店铺列表到实例变量，用于后续自动采集
-                                    self.shop_list = shop_list
-                                    self.got_shop_list = True
-                                    print(f"✅ 成功获取店铺列表，包含 {len(shop_list)} 个店铺")
-                                    # 保存店铺信息到数据库
-                                    self.save_shop_list_to_database(shop_list)
-                    except Exception as json_err:
-                        print(f"❌ 解析店铺列表JSON失败: {json_err}")
-                        # 保存原始响应文本用于调试
-                        try:
-                            text = await response.text()
-                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                            debug_file = os.path.join(SCRIPT_DIR, f'shop_list_raw_{timestamp}.txt')
-                            with open(debug_file, 'w', encoding='utf-8') as f:
-                                f.write(text[:2000])  # 只保存前2000字符
-                            print(f"💾 原始店铺列表响应已保存到 {debug_file} 用于分析")
-                        except:
-                            pass
-            except Exception as e:
-                print(f"❌ 处理店铺列表响应失败: {e}")
+        # 原始响应在后台写入线程中压缩归档，相同内容只存一份
+        await self.archive_payload(url, body)
         
-        # 处理产品信息请求响应 - 使用更灵活的匹配
-        elif "business_chance_center" in url and "peer_shop_top_sale_goods_info" in url:
-            print(f"📨 捕获到产品信息响应: {url}")
-            try:
-                # 解析JSON响应
-                try:
-                    data = await response.json()
-                    print(f"📋 产品响应数据结构: {list(data.keys())}")
-                    
-                    # 保存响应数据到products_data
-                    product_data_found = False
-                    if isinstance(data, dict) and 'data' in data:
-                        print(f"🔍 发现data字段，内部结构: {list(data['data'].keys()) if isinstance(data['data'], dict) else type(data['data'])}")
-                        # 尝试不同的数据结构路径
-                        if isinstance(data['data'], dict):
-                            # 路径1: data.data.list
-                            if 'list' in data['data']:
-                                self.products_data = data['data']['list']
-                                self.request_captured = True
-                                product_data_found = True
-                                print(f"✅ 从data.data.list解析到 {len(self.products_data)} 个产品数据")
-                            # 路径2: data.data.data
-                            elif 'data' in data['data']:
-                                self.products_data = data['data']['data']
-                                self.request_captured = True
-                                product_data_found = True
-                                print(f"✅ 从data.data.data解析到 {len(self.products_data)} 个产品数据")
-                            # 检查其他可能的键名
-                            elif 'peer_shop_top_sale_goods_info_list' in data['data']:
-                                self.products_data = data['data']['peer_shop_top_sale_goods_info_list']
-                                self.request_captured = True
-                                product_data_found = True
-                                print(f"✅ 从data.data.peer_shop_top_sale_goods_info_list解析到 {len(self.products_data)} 个产品数据")
-                            elif 'product_list' in data['data']:
-                                self.products_data = data['data']['product_list']
-                                self.request_captured = True
-                                product_data_found = True
-                                print(f"✅ 从data.data.product_list解析到 {len(self.products_data)} 个产品数据")
-                        # 如果data.data直接是列表
-                        elif isinstance(data['data'], list):
-                            self.products_data = data['data']
-                            self.request_captured = True
-                            product_data_found = True
-                            print(f"✅ 从data.data列表解析到 {len(self.products_data)} 个产品数据")
-                    # 路径3: 直接在data中有list
-                    elif isinstance(data, dict) and 'list' in data:
-                        self.products_data = data['list']
-                        self.request_captured = True
-                        product_data_found = True
-                        print(f"✅ 从data.list解析到 {len(self.products_data)} 个产品数据")
-                    # 路径4: 直接在data中有peer_shop_top_sale_goods_info_list
-                    elif isinstance(data, dict) and 'peer_shop_top_sale_goods_info_list' in data:
-                        self.products_data = data['peer_shop_top_sale_goods_info_list']
-                        self.request_captured = True
-                        product_data_found = True
-                        print(f"✅ 从data.peer_shop_top_sale_goods_info_list解析到 {len(self.products_data)} 个产品数据")
-                    # 路径5: 直接在data中有product_list
-                    elif isinstance(data, dict) and 'product_list' in data:
-                        self.products_data = data['product_list']
-                        self.request_captured = True
-                        product_data_found = True
-                        print(f"✅ 从data.product_list解析到 {len(self.products_data)} 个产品数据")
-                except Exception as json_err:
-                    print(f"❌ 解析产品JSON失败: {json_err}")
-                    # 保存原始响应文本
-                    try:
-                        text = await response.text()
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                        debug_file = os.path.join(SCRIPT_DIR, f'product_response_raw_{timestamp}.txt')
-                        with open(debug_file, 'w', encoding='utf-8') as f:
-                            f.write(text[:2000])  # 只保存前2000字符
-                        print(f"💾 原始响应已保存到 {debug_file} 用于分析")
-                    except:
-                        pass
-            except Exception as e:
-                print(f"❌ 处理产品响应失败: {e}")
-            # 已在上方处理
+        try:
+            data = json.loads(body)
+        except ValueError as json_err:
+            print(f"❌ 解析{route.label}响应JSON失败: {json_err}（原始响应已归档，可用哈希查询）")
+            return
         
-        # 处理产品信息请求
-        elif "/business_chance_center/peer_shop_top_sale_goods_info" in url:
-            print(f"📨 捕获到备用路径产品信息响应: {url}")
+        records = extract_records(data, route.paths)
+        if records:
+            getattr(self, route.handler)(response.request, records)
+    
+    async def archive_payload(self, url, body):
+        """把接口原始响应归档到数据库，返回内容哈希"""
+        try:
+            if not self.db_writer:
+                return None
+            captured_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            payload_hash, is_new = await self.db_writer.run(archive_raw_payload, url, body, captured_at)
+            print(f"💾 原始响应已归档 {payload_hash[:12]}（{'新内容' if is_new else '内容重复，仅记录索引'}）")
+            return payload_hash
+        except Exception as e:
+            print(f"⚠️  归档原始响应失败: {e}")
+            return None
+    
+    def on_shop_list(self, request, shops):
+        """店铺列表路由的处理方法"""
+        print(f"✅ 成功获取店铺列表，包含 {len(shops)} 个店铺")
+        self.events.put_nowait(ShopListCaptured(shops))
+    
+    def on_products(self, request, products):
+        """产品信息路由的处理方法"""
+        print(f"✅ 解析到 {len(products)} 个产品数据")
+        self.put_products_event(request, products)
+    
+    def put_products_event(self, request, products):
+        """根据请求体中的店铺信息，把产品数据作为ProductsCaptured事件放入队列"""
+        shop_id = None
+        shop_name = None
+        try:
+            post_data = json.loads(request.post_data) if request.post_data else {}
+            if isinstance(post_data, dict):
+                shop_id = post_data.get('shop_id')
+                shop_name = post_data.get('shop_name')
+        except Exception:
+            pass
+        self.events.put_nowait(ProductsCaptured(shop_id, products, shop_name))
+    
+    def maybe_start_auto_collection(self, page):
+        """店铺列表和请求模板都已就绪且当前没有在采集时，立即启动自动批量采集"""
+        if not (self.got_shop_list and self.products_request_template):
+            return
+        if self.collection_task and not self.collection_task.done():
+            return
+        print("🚀 自动采集条件已满足！")
+        print("🔄 系统将自动开始批量采集所有店铺数据")
+        self.collection_task = asyncio.create_task(self.auto_collect_all_shops(page))
+    
+    async def run_coordinator(self, page):
+        """事件协调器：串行消费处理器产生的事件，按需启动自动采集"""
+        while True:
             try:
-                # 解析JSON响应
-                data = await response.json()
-                print(f"📋 备用路径产品响应数据结构: {list(data.keys())}")
-                
-                # 使用标准解析逻辑
-                product_data_found = False
-                if isinstance(data, dict) and 'data' in data:
-                    inner_data = data['data']
-                    print(f"🔍 备用路径发现data字段，内部结构: {list(inner_data.keys()) if isinstance(inner_data, dict) else type(inner_data)}")
-                    
-                    # 检查是否存在peer_shop_top_sale_goods_info_list
-                    if 'peer_shop_top_sale_goods_info_list' in inner_data:
-                        self.products_data = inner_data['peer_shop_top_sale_goods_info_list']
-                        product_data_found = True
-                        print(f"✅ 备用路径从data.data.peer_shop_top_sale_goods_info_list解析到 {len(self.products_data)} 个产品数据")
-                    elif 'product_list' in inner_data:
-                        self.products_data = inner_data['product_list']
-                        product_data_found = True
-                        print(f"✅ 备用路径从data.data.product_list解析到 {len(self.products_data)} 个产品数据")
-                    elif 'list' in inner_data:
-                        self.products_data = inner_data['list']
-                        product_data_found = True
-                        print(f"✅ 备用路径从data.data.list解析到 {len(self.products_data)} 个产品数据")
-                    elif 'data' in inner_data:
-                        self.products_data = inner_data['data']
-                        product_data_found = True
-                        print(f"✅ 备用路径从data.data.data解析到 {len(self.products_data)} 个产品数据")
-                    else:
-                        self.products_data = []
-                else:
-                    self.products_data = []
-                
-                # 如果成功解析到产品数据
-                if self.products_data and product_data_found:
-                    self.request_captured = True
-                    print(f"✅ 备用路径成功捕获到产品数据，共 {len(self.products_data)} 条")
-            except Exception as e:
-                print(f"❌ 处理备用路径产品响应失败: {e}")
-                # 保存原始响应文本
-                try:
-                    text = await response.text()
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    debug_file = os.path.join(SCRIPT_DIR, f'product_alt_response_raw_{timestamp}.txt')
-                    with open(debug_file, 'w', encoding='utf-8') as f:
-                        f.write(text[:2000])  # 只保存前2000字符
-                    print(f"💾 备用路径原始响应已保存到 {debug_file} 用于分析")
-                except:
-                    pass
-    
-    def get_growth_score(self, growth_rate_str):
-        """根据增长率字符串计算排序分数"""
-        if not growth_rate_str:
-            return 0
+                event = await asyncio.wait_for(self.events.get(), timeout=STATUS_INTERVAL)
+            except asyncio.TimeoutError:
+                # 长时间没有事件时提示用户系统仍在运行
+                if not self.auto_collection_mode:
+                    print("🔄 系统持续运行中，等待捕获店铺列表和产品数据")
+                continue
             
-        # 处理负增长率范围，如 "-10%--15%"
-        if growth_rate_str.startswith('-'):
-            # 提取负增长范围的两个数字
-            match = re.match(r'-([\d.]+)%--([\d.]+)%', growth_rate_str)
-            if match:
-                # 对于负增长，取较小的负值作为排序依据（更负的增长）
-                val1, val2 = float(match.group(1)), float(match.group(2))
-                # 返回负数表示负增长
-                return -max(val1, val2)
-            return 0
-        
-        # 处理正增长率范围，如 "50%-100%", "100%-200%"
-        match = re.match(r'([\d.]+)%-(\d+)%', growth_rate_str)
-        if match:
-            min_val, max_val = float(match.group(1)), float(match.group(2))
-            # 对于正增长，计算中间值作为排序依据
-            # 根据规则：100%-200% > 50%-100% > -10%--15%
-            # 我们通过返回较高的正数值来确保正确排序
-            return (min_val + max_val) / 2
-        
-        return 0
-    
-    def save_shop_list_to_database(self, shop_list):
-        """将店铺列表数据保存到SQLite数据库"""
+            if isinstance(event, ShopListCaptured):
+                self.shop_list = event.shops
+                self.got_shop_list = True
+                await self.save_shop_list_to_database(event.shops)
+                self.maybe_start_auto_collection(page)
+            elif isinstance(event, TemplateCaptured):
+                is_first_template = self.products_request_template is None
+                self.products_request_template = event.template
+                if is_first_template:
+                    self.maybe_start_auto_collection(page)
+            elif isinstance(event, ProductsCaptured):
+                print(f"\n✅ 成功捕获产品数据，共 {len(event.rows)} 个，店铺ID: {event.shop_id or '未知'}")
+                await self.save_to_database(event.rows, event.shop_id, event.shop_name)
+                if not self.got_shop_list:
+                    print("💡 提示：已捕获产品数据，但需要获取店铺列表才能开始自动批量采集")
+    
+    async def save_shop_list_to_database(self, shop_list):
+        """将店铺列表数据批量UPSERT到SQLite数据库（在后台写入线程中执行）"""
         try:
-            if not self.db_conn:
+            if not self.db_writer:
                 print("❌ 数据库连接未初始化")
                 return
                 
-            cursor = self.db_conn.cursor()
             captured_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            shops_saved = 0
-            for shop in shop_list:
-                shop_id = shop.get('shop_id', '')
-                shop_name = shop.get('shop_name', '未知店铺')
-                
-                # 使用INSERT OR REPLACE更新店铺信息
-                cursor.execute(
-                    "INSERT OR REPLACE INTO shops (shop_id, shop_name, last_updated) VALUES (?, ?, ?)",
-                    (shop_id, shop_name, captured_at)
-                )
-                shops_saved += 1
-            
-            self.db_conn.commit()
+            rows = [(shop.get('shop_id', ''), shop.get('shop_name'), captured_at) for shop in shop_list]
+            shops_saved = await self.db_writer.run(write_shop_rows, rows)
             print(f"✅ 成功保存 {shops_saved} 个店铺信息到数据库")
         except Exception as e:
             print(f"❌ 保存店铺列表到数据库失败: {e}")
-            if self.db_conn:
-                self.db_conn.rollback()
     
     async def auto_collect_all_shops(self, page):
-        """自动批量采集所有店铺的数据"""
+        """自动批量采集所有店铺的数据（并发请求，令牌桶限速）"""
         if not self.got_shop_list or not self.shop_list:
             print("❌ 未获取店铺列表，无法开始自动采集")
             return
@@ -402,182 +362,341 @@ class ProductAnalyzer:
         print("🚀 开始自动批量采集所有店铺数据...")
         print(f"📊 总共需要采集 {len(self.shop_list)} 个店铺")
         
-        # 过滤已处理的店铺
-        shops_to_process = [shop for shop in self.shop_list if shop.get('shop_id') not in self.processed_shop_ids]
+        # 恢复或创建采集批次，只处理本批次中待采集或失败的店铺
+        await self.start_or_resume_run()
+        await self.register_run_shops(self.shop_list)
+        shops_to_process = await self.get_pending_shops()
         print(f"📋 待处理店铺数量: {len(shops_to_process)}")
+        print(f"⚙️  并发数: {self.max_concurrency}，限速: {self.requests_per_second} 请求/秒")
+        print(f"🧮 每个店铺展开 {len(expand_sweep_jobs({}))} 个日期范围×类目组合，每个组合最多 {DEFAULT_MAX_PAGES} 页")
         
-        # 为当前页面创建临时监听器，专门处理自动发送的请求响应
-        original_products_data = self.products_data.copy()
-        
-        success_count = 0
-        fail_count = 0
+        # 并发控制：店铺名额限制同时采集的店铺数，信号量限制同时在途的请求数，令牌桶限制请求速率
+        shop_slots = asyncio.Semaphore(self.max_concurrency)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        bucket = TokenBucket(self.requests_per_second)
+        backoff = AdaptiveBackoff(bucket)
+        stats = LatencyStats()
         
-        for i, shop in enumerate(shops_to_process, 1):
-            shop_id = shop.get('shop_id')
-            shop_name = shop.get('shop_name', '未知店铺')
-            
-            if not shop_id:
-                print(f"⚠️  店铺 {i} 缺少shop_id，跳过")
-                fail_count += 1
-                continue
-                
-            print(f"\n🔄 正在采集店铺 {i}/{len(shops_to_process)}: {shop_name} (ID: {shop_id})")
-            
-            try:
-                # 重置产品数据
-                self.products_data = []
-                self.request_captured = False
-                
-                # 准备请求数据
-                request_data = self.products_request_template['post_data'].copy()
-                request_data['shop_id'] = shop_id
-                
-                # 保存当前店铺信息
-                self.current_shop_id = shop_id
-                self.current_shop_name = shop_name
-                
-                print(f"📤 发送产品信息请求...")
-                print(f"📋 请求参数: shop_id={shop_id}")
-                
-                # 发送请求
-                response = await page.request.post(
-                    self.products_request_template['url'],
-                    data=json.dumps(request_data, ensure_ascii=False),
-                    headers=self.products_request_template['headers']
+        requester = await self.open_requester(page)
+        try:
+            results = await asyncio.gather(*(
+                self.collect_shop_with_retry(
+                    requester, shop, i, len(shops_to_process), shop_slots, semaphore, bucket, backoff, stats
                 )
-                
-                print(f"📥 收到响应，状态码: {response.status}")
-                
-                # 手动处理响应
-                data = await response.json()
-                
-                # 解析产品数据
-                if isinstance(data, dict) and 'data' in data:
-                    inner_data = data['data']
-                    
-                    # 检查是否存在peer_shop_top_sale_goods_info_list
-                    if 'peer_shop_top_sale_goods_info_list' in inner_data:
-                        self.products_data = inner_data['peer_shop_top_sale_goods_info_list']
-                        print(f"📊 解析到 {len(self.products_data)} 个产品数据")
-                    elif 'product_list' in inner_data:
-                        self.products_data = inner_data['product_list']
-                        print(f"📊 解析到 {len(self.products_data)} 个产品数据")
-                    elif isinstance(inner_data, list):
-                        self.products_data = inner_data
-                        print(f"📊 解析到 {len(self.products_data)} 个产品数据")
-                    else:
-                        print(f"❌ 未找到产品列表数据")
-                
-                # 保存数据到数据库
-                if self.products_data:
-                    # 调试：在保存到数据库前检查qr_code字段
-                    qr_code_count = 0
-                    for product in self.products_data[:3]:  # 只检查前3个产品
-                        if 'qr_code' in product and product['qr_code']:
-                            qr_code_count += 1
-                            print(f"🔍 产品 {product.get('product_id', 'unknown')} 包含非空qr_code字段")
-                        else:
-                            print(f"🔍 产品 {product.get('product_id', 'unknown')} qr_code字段为空或不存在")
-                    print(f"🔍 总共有 {qr_code_count}/{min(3, len(self.products_data))} 个产品包含非空qr_code字段")
-                    self.save_to_database()
-                    self.processed_shop_ids.add(shop_id)
-                    success_count += 1
-                    print(f"✅ 店铺 {shop_name} 数据采集成功")
-                else:
-                    print(f"❌ 店铺 {shop_name} 未采集到有效数据")
-                    fail_count += 1
-                
-                # 避免请求过快，添加延迟
-                print("⏱️  等待2秒后继续下一个店铺...")
-                await asyncio.sleep(2)
-                
-            except Exception as e:
-                print(f"❌ 采集店铺 {shop_name} 数据时出错: {e}")
-                import traceback
-                traceback.print_exc()
-                fail_count += 1
-                # 出错后也添加延迟，避免连续失败
-                await asyncio.sleep(1)
-        
-        # 恢复原始数据
-        self.products_data = original_products_data
+                for i, shop in enumerate(shops_to_process, 1)
+            ))
+        finally:
+            if requester is not page.request:
+                await requester.close()
+        success_count = sum(1 for ok in results if ok)
+        fail_count = len(results) - success_count
         
         # 打印总结
         print("\n📋 自动批量采集完成！")
         print(f"✅ 成功采集: {success_count} 个店铺")
         print(f"❌ 采集失败: {fail_count} 个店铺")
         print(f"📊 已处理店铺总数: {len(self.processed_shop_ids)}")
+        print(stats.summary(len(results), unit="店铺"))
         
-        # 如果还有未处理的店铺，可以提示用户
-        remaining_shops = len(self.shop_list) - len(self.processed_shop_ids)
+        # 如果还有未处理的店铺，可以提示用户；全部完成则结束本批次
+        remaining_shops = len(await self.get_pending_shops())
         if remaining_shops > 0:
-            print(f"💡 提示: 还有 {remaining_shops} 个店铺未处理，可以再次运行自动采集")
+            print(f"💡 提示: 批次 {self.run_id} 还有 {remaining_shops} 个店铺未完成，再次运行自动采集将从断点继续")
+        else:
+            await self.finish_run()
         
         self.auto_collection_mode = False
         print("\n🔄 已退出自动采集模式，可以继续手动操作")
     
-    def save_to_database(self):
-        """将采集的数据保存到SQLite数据库"""
+    async def open_requester(self, page):
+        """返回批量采集使用的请求发送器：优先使用从浏览器导出cookies的直连HTTP客户端，
+        未安装httpx或已关闭直连模式时使用 page.request（两者的post用法一致）"""
+        if DEFAULT_DIRECT_HTTP and HTTP_CLIENT_AVAILABLE:
+            try:
+                return await ApiClient.from_context(
+                    page.context, headers=self.products_request_template['headers'],
+                    max_per_host=self.max_concurrency
+                )
+            except Exception as e:
+                print(f"⚠️  创建直连HTTP客户端失败，改用浏览器发送请求: {e}")
+        elif DEFAULT_DIRECT_HTTP:
+            print("💡 未安装httpx，批量采集经由浏览器发送请求（pip install httpx h2 可启用直连HTTP模式）")
+        return page.request
+    
+    async def collect_shop_with_retry(self, requester, shop, index, total, shop_slots, semaphore, bucket, backoff,
+                                      stats):
+        """采集单个店铺，失败时按指数退避重试，并把每次尝试记录到批次状态表
+        
+        每次尝试先取得店铺名额再标记为running，started_at和duration_ms不包含排队等待的时间，
+        中断时停留在running的店铺最多只有并发数个；重试等待期间名额释放给其它店铺。
+        """
+        shop_id = shop.get('shop_id')
+        # attempts 为该店铺在本批次中的累计尝试次数，每次运行最多再尝试 max_attempts 次
+        attempts = shop.get('attempts', 0)
+        # 已采集成功的维度组合 {query_dims: 产品列表}，重试时只重新采集失败的组合
+        completed = {}
+        for retry in range(1, self.max_attempts + 1):
+            attempts += 1
+            async with shop_slots:
+                started_at = time.monotonic()
+                await self.mark_shop_status(shop_id, 'running', attempts=attempts)
+                ok, error = await self.collect_shop(
+                    requester, shop, index, total, semaphore, bucket, backoff, stats, completed
+                )
+                duration_ms = int((time.monotonic() - started_at) * 1000)
+                if ok:
+                    await self.mark_shop_status(shop_id, 'done', duration_ms=duration_ms)
+                else:
+                    await self.mark_shop_status(shop_id, 'failed', error=error, duration_ms=duration_ms)
+            if ok:
+                self.processed_shop_ids.add(shop_id)
+                return True
+            if retry < self.max_attempts:
+                delay = RETRY_BASE_DELAY * (2 ** (retry - 1))
+                print(f"🔁 店铺 {shop.get('shop_name', '未知店铺')} 第 {retry} 次采集失败，{delay:.0f} 秒后重试")
+                await asyncio.sleep(delay)
+        print(f"❌ 店铺 {shop.get('shop_name', '未知店铺')} 连续 {self.max_attempts} 次采集失败，留待下次续采")
+        return False
+    
+    async def collect_shop(self, requester, shop, index, total, semaphore, bucket, backoff, stats, completed=None):
+        """按 日期范围 × 类目 × 分页 采集单个店铺的产品数据，返回 (是否成功, 错误信息)
+        
+        各维度组合并发执行，组合内逐页请求，数据取完即停止翻页；
+        店铺全部组合采集完成后一次性批量写入数据库。
+        completed 为 {query_dims: 产品列表}，记录已采集成功的组合，其中的组合不再请求，
+        本次成功的组合也会加入其中，重试时只需重新采集失败的组合。
+        """
+        shop_id = shop.get('shop_id')
+        shop_name = shop.get('shop_name', '未知店铺')
+        
+        if not shop_id:
+            print(f"⚠️  店铺 {index} 缺少shop_id，跳过")
+            return False, '缺少shop_id'
+        
+        print(f"\n🔄 正在采集店铺 {index}/{total}: {shop_name} (ID: {shop_id})")
+        
+        completed = {} if completed is None else completed
+        jobs = expand_sweep_jobs({**self.products_request_template['post_data'], 'shop_id': shop_id})
+        pending = [(query_dims, request_data) for query_dims, request_data in jobs if query_dims not in completed]
+        if len(pending) < len(jobs):
+            print(f"♻️  店铺 {shop_name} 已完成 {len(jobs) - len(pending)} 个维度组合，只重新采集 {len(pending)} 个")
+        results = await asyncio.gather(*(
+            self.collect_combination(requester, shop_name, request_data, semaphore, bucket, backoff, stats)
+            for _, request_data in pending
+        ))
+        
+        errors = []
+        for (query_dims, _), (products, error) in zip(pending, results):
+            if error:
+                errors.append(error)
+            else:
+                completed[query_dims] = products
+        if errors:
+            return False, f"{len(errors)}/{len(jobs)} 个维度组合失败: {errors[0]}"
+        
+        captured_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        rows = []
+        for query_dims, _ in jobs:
+            rows.extend(self.build_product_rows(completed[query_dims], shop_id, captured_at, query_dims))
+        
+        # 所有组合都没有数据，视为可能被限流的信号
+        if not rows:
+            # 空结果不能确认组合已采集完成，下次重试全部重新采集
+            completed.clear()
+            delay = backoff.on_throttle()
+            print(f"❌ 店铺 {shop_name} 未采集到有效数据，退避 {delay:.1f} 秒")
+            return False, '未采集到有效数据'
+        
+        print(f"📊 店铺 {shop_name} 在 {len(jobs)} 个维度组合下共解析到 {len(rows)} 个产品数据")
+        await self.save_rows(rows, shop_id, shop_name, captured_at)
+        print(f"✅ 店铺 {shop_name} 数据采集成功")
+        return True, None
+    
+    async def collect_combination(self, requester, shop_name, request_data, semaphore, bucket, backoff, stats):
+        """逐页采集一个维度组合，返回 (产品列表, 错误信息)
+        
+        模板中没有页码字段时只采集一页；返回空页、不足一页、has_more为假、
+        或与上一页内容相同（接口忽略页码）时停止翻页。
+        """
+        page_field = find_field(request_data, PAGE_FIELDS)
+        page_size_field = find_field(request_data, PAGE_SIZE_FIELDS)
+        page_size = request_data.get(page_size_field) if page_size_field else None
+        first_page = request_data.get(page_field, 1) if page_field else 1
+        max_pages = DEFAULT_MAX_PAGES if page_field else 1
+        
+        products = []
+        previous_ids = None
+        for page_no in range(first_page, first_page + max_pages):
+            if page_field:
+                request_data = {**request_data, page_field: page_no}
+            async with semaphore:
+                page_products, has_more, error = await self.fetch_products_page(
+                    requester, shop_name, request_data, bucket, backoff, stats
+                )
+            if error:
+                return products, error
+            
+            page_ids = [product.get('product_id') for product in page_products]
+            if not page_products or page_ids == previous_ids:
+                break
+            products.extend(page_products)
+            previous_ids = page_ids
+            
+            if has_more is False:
+                break
+            if page_size and str(page_size).isdigit() and len(page_products) < int(page_size):
+                break
+        return products, None
+    
+    async def fetch_products_page(self, requester, shop_name, request_data, bucket, backoff, stats):
+        """发送一次产品信息请求，返回 (产品列表, has_more, 错误信息)"""
         try:
-            if not self.db_conn:
-                print("❌ 数据库连接未初始化")
-                return
-                
-            cursor = self.db_conn.cursor()
-            captured_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            # 等待退避期结束并获取令牌
+            await backoff.wait()
+            await bucket.acquire()
             
-            # 保存店铺信息
-            if self.current_shop_id:
-                # 先从数据库中查询是否已有该店铺信息
-                cursor.execute("SELECT shop_name FROM shops WHERE shop_id = ?", (self.current_shop_id,))
-                existing_shop = cursor.fetchone()
-                
-                # 优先使用当前提供的店铺名称，如果没有则尝试从数据库获取
-                shop_name_to_save = self.current_shop_name
-                
-                # 如果当前没有提供名称，但数据库中有，则使用数据库中的名称
-                if not shop_name_to_save and existing_shop and existing_shop[0]:
-                    shop_name_to_save = existing_shop[0]
-                # 如果都没有，使用默认名称
-                if not shop_name_to_save:
-                    shop_name_to_save = "未知店铺"
-                
-                # 使用INSERT OR REPLACE更新店铺信息
-                cursor.execute(
-                    "INSERT OR REPLACE INTO shops (shop_id, shop_name, last_updated) VALUES (?, ?, ?)",
-                    (self.current_shop_id, shop_name_to_save, captured_at)
-                )
+            started_at = time.monotonic()
+            response = await requester.post(
+                self.products_request_template['url'],
+                data=json.dumps(request_data, ensure_ascii=False),
+                headers=self.products_request_template['headers']
+            )
+            stats.record(time.monotonic() - started_at)
+            print(f"📥 店铺 {shop_name} 收到响应，状态码: {response.status}")
             
-            # 保存产品信息
-            products_saved = 0
-            for product in self.products_data:
-                product_id = product.get('product_id', '')
-                product_name = product.get('product_name', '未知产品')
-                product_pic = product.get('product_pic', '')
-                price_range = product.get('price_range', '')
-                pay_amount = product.get('pay_amount', '')
-                pay_amount_growth_rate = product.get('pay_amount_growth_rate', '')
-                impressions_people_num = product.get('impressions_people_num', '')
-                
-                # 插入产品数据
+            # 限流或服务端错误：降低速率并退避
+            if response.status == 429 or response.status >= 500:
+                delay = backoff.on_throttle()
+                print(f"⚠️  店铺 {shop_name} 请求被限流/服务端错误，速率降至 {bucket.rate:.2f}/秒，退避 {delay:.1f} 秒")
+                return [], None, f"HTTP {response.status}"
+            
+            data = await response.json()
+            products = extract_records(data, ROUTES_BY_NAME[PRODUCTS].paths) or []
+            inner_data = data.get('data') if isinstance(data, dict) else None
+            has_more = inner_data.get('has_more') if isinstance(inner_data, dict) else None
+            backoff.on_success()
+            return products, has_more, None
+            
+        except Exception as e:
+            print(f"❌ 采集店铺 {shop_name} 数据时出错: {e}")
+            backoff.on_throttle()
+            return [], None, str(e)
+    
+    async def start_or_resume_run(self):
+        """恢复最近一个未完成的采集批次，没有则创建新批次"""
+        def resume_or_create(conn):
+            row = conn.execute(
+                "SELECT run_id FROM collection_runs WHERE status = 'running' ORDER BY run_id DESC LIMIT 1"
+            ).fetchone()
+            if row:
+                done = conn.execute(
+                    "SELECT shop_id FROM collection_shop_status WHERE run_id = ? AND status = 'done'",
+                    (row[0],)
+                ).fetchall()
+                return row[0], {shop_id for (shop_id,) in done}, True
+            cursor = conn.execute(
+                "INSERT INTO collection_runs (status, started_at) VALUES ('running', ?)",
+                (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),)
+            )
+            return cursor.lastrowid, set(), False
+        
+        self.run_id, self.processed_shop_ids, resumed = await self.db_writer.run(resume_or_create)
+        if resumed:
+            print(f"♻️  恢复采集批次 {self.run_id}，已完成 {len(self.processed_shop_ids)} 个店铺")
+        else:
+            print(f"🆕 创建采集批次 {self.run_id}")
+        return self.run_id
+    
+    async def register_run_shops(self, shop_list):
+        """将店铺列表登记到当前批次，已登记的店铺保持原状态"""
+        rows = [
+            (self.run_id, shop.get('shop_id'), shop.get('shop_name', '未知店铺'))
+            for shop in shop_list if shop.get('shop_id')
+        ]
+        await self.db_writer.run(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO collection_shop_status (run_id, shop_id, shop_name, status) VALUES (?, ?, ?, 'pending')",
+            rows
+        ))
+    
+    async def get_pending_shops(self):
+        """获取当前批次中待采集的店铺（pending/failed，以及中断时停留在running的店铺）"""
+        rows = await self.db_writer.run(lambda conn: conn.execute(
+            "SELECT shop_id, shop_name, attempts FROM collection_shop_status "
+            "WHERE run_id = ? AND status IN ('pending', 'running', 'failed')",
+            (self.run_id,)
+        ).fetchall())
+        return [
+            {'shop_id': shop_id, 'shop_name': shop_name, 'attempts': attempts or 0}
+            for shop_id, shop_name, attempts in rows
+        ]
+    
+    async def mark_shop_status(self, shop_id, status, attempts=None, error=None, duration_ms=None):
+        """更新店铺在当前批次中的采集状态"""
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if status == 'running':
+            sql = ("UPDATE collection_shop_status SET status = ?, attempts = ?, started_at = ? "
+                   "WHERE run_id = ? AND shop_id = ?")
+            params = (status, attempts, now, self.run_id, shop_id)
+        else:
+            sql = ("UPDATE collection_shop_status SET status = ?, last_error = ?, finished_at = ?, duration_ms = ? "
+                   "WHERE run_id = ? AND shop_id = ?")
+            params = (status, error, now, duration_ms, self.run_id, shop_id)
+        try:
+            await self.db_writer.run(lambda conn: conn.execute(sql, params))
+        except Exception as e:
+            print(f"❌ 更新店铺 {shop_id} 采集状态失败: {e}")
+    
+    async def finish_run(self):
+        """标记当前批次已完成，下次自动采集将创建新批次"""
+        finished_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        await self.db_writer.run(lambda conn: conn.execute(
+            "UPDATE collection_runs SET status = 'finished', finished_at = ? WHERE run_id = ?",
+            (finished_at, self.run_id)
+        ))
+        print(f"🏁 采集批次 {self.run_id} 已全部完成")
+    
+    def build_product_rows(self, products, shop_id, captured_at, query_dims=''):
+        """把接口返回的产品字典转换为入库行"""
+        return [
+            (
+                product.get('product_id', ''),
+                product.get('product_name', '未知产品'),
+                product.get('product_pic', ''),
+                product.get('price_range', ''),
+                product.get('pay_amount', ''),
+                product.get('pay_amount_growth_rate', ''),
+                product.get('impressions_people_num', ''),
+                shop_id,
+                captured_at,
+                query_dims,
                 # 检查是否有qr_code字段，如果没有则使用空字符串
-                qr_code = product.get('qr_code', '')
-                cursor.execute(
-                    '''INSERT INTO products 
-                    (product_id, product_name, product_pic, price_range, pay_amount, 
-                    pay_amount_growth_rate, impressions_people_num, shop_id, captured_at, qr_code) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                    (product_id, product_name, product_pic, price_range, pay_amount, 
-                     pay_amount_growth_rate, impressions_people_num, self.current_shop_id, captured_at, qr_code)
-                )
-                products_saved += 1
+                product.get('qr_code', ''),
+            )
+            for product in products
+        ]
+    
+    async def save_rows(self, rows, shop_id, shop_name, captured_at):
+        """把组装好的产品行整体提交给后台写入线程
+        
+        店铺信息UPSERT、新快照插入和未变化快照的last_seen_at更新在同一个事务中完成。
+        """
+        try:
+            if not self.db_writer:
+                print("❌ 数据库连接未初始化")
+                return
             
-            self.db_conn.commit()
-            print(f"✅ 成功保存 {products_saved} 个产品到数据库")
+            inserted, unchanged = await self.db_writer.run(
+                write_product_rows, shop_id, shop_name, rows, captured_at, self.latest_snapshots
+            )
+            print(f"✅ 成功保存 {len(rows)} 个产品到数据库（新增快照 {inserted} 个，未变化 {unchanged} 个）")
         except Exception as e:
             print(f"❌ 保存数据到数据库失败: {e}")
-            if self.db_conn:
-                self.db_conn.rollback()
+    
+    async def save_to_database(self, products, shop_id, shop_name=None, query_dims=''):
+        """将采集的数据保存到SQLite数据库"""
+        captured_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        await self.save_rows(self.build_product_rows(products, shop_id, captured_at, query_dims),
+                             shop_id, shop_name, captured_at)
 
 # 移除了所有文件读取相关功能，只保留接口监听功能
 
@@ -597,50 +716,28 @@ async def run_playwright():
     print("\n🛑 按 Ctrl+C 可随时停止监听")
     print("🚀 系统配置为自动模式：获取店铺列表和产品请求后将自动开始批量采集")
     
-    async with async_playwright() as p:
-        # 使用launch_persistent_context启动带有用户数据目录的浏览器
-        context = await p.chromium.launch_persistent_context(
-            user_data_dir="/Users/bairdweng/Desktop/myproject/doudianpc/chrome_user_data",
-            headless=False,
-            slow_mo=100,
-            executable_path="/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--disable-features=IsolateOrigins,site-per-process",
-                "--window-size=1280,800"
-            ]
-        )
-        
-        # 获取浏览器实例
-        browser = context.browser
-        
+    # 使用共用启动器：默认无头模式并导入已导出的登录态，可用环境变量切换到有界面模式
+    async with open_browser() as context:
         # 获取第一个页面或创建新页面
-        if context.pages:
-            page = context.pages[0]
-        else:
-            page = await context.new_page()
-        
-        # 直接打开指定的抖店页面
-        target_url = "https://fxg.jinritemai.com/ffa/bu/NewBusinessCenter?btm_ppre=a0.b0.c0.d0&btm_pre=a2427.b76571.c902327.d871297&btm_show_id=5374be68-95d7-49f5-99f1-faab744c7567"
-        print(f"🚀 正在打开目标URL: {target_url}")
-        await page.goto(target_url)
+        page = await get_page(context)
         
         # 绑定请求和响应事件
         print("🔗 正在绑定浏览器事件监听器...")
         
-        # 增强版请求监听器
-        async def on_request(request):
-            # print(f"📡 捕获到请求: {request.method} {request.url}")
-            await analyzer.handle_request(request)
+        # 监听器先查路由表，不需要处理的请求/响应（图片、JS、CSS等）直接丢弃，不创建任务
+        def on_request(request):
+            route = match_route(request.url)
+            if route:
+                asyncio.create_task(analyzer.handle_request(request, route))
         
-        # 增强版响应监听器
-        async def on_response(response):
-            # print(f"📡 捕获到响应: {response.status} {response.url}")
-            await analyzer.handle_response(response)
+        def on_response(response):
+            route = match_route(response.url)
+            if route:
+                asyncio.create_task(analyzer.handle_response(response, route))
         
         # 绑定事件监听器
-        page.on("request", lambda request: asyncio.create_task(on_request(request)))
-        page.on("response", lambda response: asyncio.create_task(on_response(response)))
+        page.on("request", on_request)
+        page.on("response", on_response)
         
         # 监听页面导航完成事件
         async def on_navigation(details):
@@ -648,7 +745,12 @@ async def run_playwright():
         
         page.on("load", on_navigation)
         print("✅ 浏览器事件监听器绑定成功")
-        print("📋 已启用增强版事件监听，将显示所有请求和响应")
+        
+        # 先绑定监听器再打开页面，无头模式下页面加载时发出的店铺列表和产品请求也能被捕获
+        target_url = "https://fxg.jinritemai.com/ffa/bu/NewBusinessCenter?btm_ppre=a0.b0.c0.d0&btm_pre=a2427.b76571.c902327.d871297&btm_show_id=5374be68-95d7-49f5-99f1-faab744c7567"
+        print(f"🚀 正在打开目标URL: {target_url}")
+        await timed_goto(page, target_url)
+        print("📋 已启用路由表事件监听，只处理店铺列表和产品信息接口")
         
         # 提示用户访问正确的业务页面
         print("🎯 请在浏览器中访问正确的业务页面")
@@ -662,74 +764,25 @@ async def run_playwright():
             print("📊 获取店铺列表和产品请求模板后将自动开始批量采集")
             print("🔄 系统将持续监听，按Ctrl+C可随时停止")
             
-            # 持续监听模式，不设置超时
-            # 添加计数器显示监听状态
-            counter = 0
             print("\n🔄 系统已启动监听模式")
             print("🎯 等待捕获店铺列表和产品请求模板")
             
-            while True:
-                # 检查是否已捕获请求
-                if analyzer.request_captured:
-                    # 如果捕获到数据，保存到数据库
-                    if analyzer.products_data:
-                        print("\n✅ 成功捕获产品数据")
-                        print(f"📊 捕获到 {len(analyzer.products_data)} 个产品数据")
-                        print("💾 开始保存数据到数据库...")
-                        
-                        # 保存数据到数据库
-                        analyzer.save_to_database()
-                        
-                        # 重置请求捕获标志，准备捕获下一个店铺的数据
-                        analyzer.request_captured = False
-                        print("\n🔄 已重置捕获状态，准备捕获下一个店铺的数据")
-                        print("🚀 自动采集模式：系统正在自动处理下一个店铺")
-                        # 确保始终启用自动模式
-                        analyzer.auto_collection_mode = True
-                        # 只有在获取到店铺列表和产品请求模板后才开始自动采集
-                        if analyzer.got_shop_list and analyzer.products_request_template:
-                            print("📋 已获取所需数据，即将开始自动批量采集")
-                            await analyzer.auto_collect_all_shops(page)
-                        else:
-                            print("⏳ 等待获取店铺列表和产品请求模板...")
-                    else:
-                        analyzer.request_captured = False
-                
-                # 每30秒打印一次监听状态
-                counter += 1
-                # 每5秒检查一次状态
-                if counter % 5 == 0:
-                    # 检查是否已获取店铺列表和产品请求模板，自动开启采集
-                    if analyzer.got_shop_list and analyzer.products_request_template and not analyzer.auto_collection_mode:
-                        print("🚀 自动采集条件已满足！")
-                        print("🔄 系统将自动开始批量采集所有店铺数据")
-                        analyzer.auto_collection_mode = True
-                        await analyzer.auto_collect_all_shops(page)
-                elif counter % 30 == 0:
-                    # 30秒状态检查，提示用户系统仍在运行
-                    print("🔄 系统持续运行中，等待捕获店铺列表和产品数据")
-                    # 如果已经有一些数据但没有完整的店铺列表，也给用户提示
-                    if analyzer.products_data and not analyzer.got_shop_list:
-                        print("💡 提示：已捕获产品数据，但需要获取店铺列表才能开始自动批量采集")
-                
-                # 短暂休眠，避免CPU占用过高
-                await asyncio.sleep(1)
+            # 由协调器消费响应处理器产生的事件，条件满足后自动开始批量采集
+            await analyzer.run_coordinator(page)
         
         except KeyboardInterrupt:
             print("\n\n🛑 监听已停止")
         finally:
-            # 关闭数据库连接
-            if analyzer.db_conn:
-                analyzer.db_conn.close()
-                print("✅ 数据库连接已关闭")
+            # 等待后台写入完成并关闭数据库连接
+            analyzer.close_database()
                 
             print("\n📋 使用说明:")
             print("1. 本工具监听特定API请求获取产品数据")
             print("2. 采集的数据自动保存到SQLite数据库(product_data.db)")
             print("3. 请使用analyze_data.py脚本进行数据分析")
-            print("4. 浏览器保持打开状态，您可以继续查看其他店铺数据")
+            print("4. 首次在服务器上运行前，请先执行 python -m common.browser_launcher login 导出登录态")
             
-            print("\n✅ 数据采集工具已停止运行，浏览器将保持打开状态")
+            print("\n✅ 数据采集工具已停止运行")
 
 def main():
     """主函数，启动浏览器监听"""
@@ -753,7 +806,7 @@ def main():
                 elif cmd.lower() == 'auto':
                     print("🚀 准备开始自动批量采集所有店铺数据...")
                     print("📝 注意: 请确保已经获取过店铺列表和产品请求模板")
-                    print("🔄 重新启动浏览器以执行自动采集")
+                    print("🔄 重新启动浏览器以执行自动采集，未完成的批次将从断点继续")
                     # 重新启动监听，这次会自动执行采集
                     asyncio.run(run_playwright())
                 elif cmd.lower() == 'exit':
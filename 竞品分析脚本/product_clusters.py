@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨店铺的近似重复产品聚类
+
+同一款手机壳会以略有差别的标题出现在不同店铺中。本模块把产品名称归一化后切成字符
+n-gram，计算MinHash签名，再按LSH分段写入 product_cluster_buckets 表：新产品只与落入
+同一分段桶的已有产品比较，不做两两全量计算。判定为同一产品的归入已有聚类，同时命中
+多个聚类时合并到编号最小的聚类；没有命中的新建聚类。产品图片可选地计算64位dHash，
+图片哈希也按分段入桶，图片相同而标题改动较大的产品同样能被找到。
+
+判定规则：两个产品都有图片哈希时，以图片为准（汉明距离不超过 IMAGE_MAX_DISTANCE，
+且标题相似度不低于 IMAGE_NAME_SIMILARITY）；否则要求标题相似度不低于 NAME_SIMILARITY。
+聚类只合并不拆分；产品按 product_id 分配一次，之后标题变化不会重新分配。
+
+采集时 jp.py 在写入新快照的同一事务中为新产品分配聚类；已有数据在表结构迁移时补齐。
+单独运行本模块可补齐未分配的产品，--images 同时下载产品图片计算图片哈希（需要Pillow）：
+    python product_clusters.py --images
+"""
+
+import argparse
+import hashlib
+import io
+import operator
+import random
+import re
+import struct
+import unicodedata
+import urllib.request
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 标题切分为3个字符的n-gram
+NGRAM_SIZE = 3
+# MinHash签名长度，分为 NAME_BANDS 段，每段 NAME_BAND_ROWS 个值；
+# 相似度为s的两个标题至少落入一个相同桶的概率为 1-(1-s^4)^16，s=0.5时约64%，s=0.7时约99%
+NAME_BANDS = 16
+NAME_BAND_ROWS = 4
+NUM_PERMUTATIONS = NAME_BANDS * NAME_BAND_ROWS
+# 64位图片哈希分为4段，每段16位：汉明距离不超过3的两张图片至少有一段完全相同
+IMAGE_BANDS = 4
+IMAGE_BAND_BITS = 64 // IMAGE_BANDS
+# 图片分段与标题分段存在同一张表中，图片分段编号从 NAME_BANDS 开始
+IMAGE_BAND_BASE = NAME_BANDS
+
+NAME_SIMILARITY = 0.8
+IMAGE_MAX_DISTANCE = 3
+IMAGE_NAME_SIMILARITY = 0.5
+
+IMAGE_FETCH_TIMEOUT = 10
+
+# MinHash的哈希函数族 h(x) = (a*x + b) mod p，参数由固定种子生成，保证签名在不同进程间一致
+_MERSENNE_PRIME = (1 << 61) - 1
+_random = random.Random(20240611)
+PERMUTATIONS = [
+    (_random.randrange(1, _MERSENNE_PRIME), _random.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+_SIGNATURE_FORMAT = f'<{NUM_PERMUTATIONS}Q'
+# 去掉空白、标点和下划线，只保留文字和数字
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_name(name):
+    """全角转半角、转小写并去掉空白和标点"""
+    return _NON_WORD.sub('', unicodedata.normalize('NFKC', name or '').lower())
+
+
+def name_shingles(name, size=NGRAM_SIZE):
+    """归一化标题的字符n-gram集合，标题短于n时整体作为一个n-gram"""
+    text = normalize_name(name)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def _signed64(value):
+    """无符号64位整数转为SQLite可存储的有符号整数"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def minhash_signature(shingles):
+    """计算n-gram集合的MinHash签名，空集合返回None"""
+    if not shingles:
+        return None
+    values = [_hash64(shingle.encode('utf-8')) for shingle in shingles]
+    return tuple(min((a * x + b) % _MERSENNE_PRIME for x in values) for a, b in PERMUTATIONS)
+
+
+def signature_similarity(first, second):
+    """两个MinHash签名相同位置取值相等的比例，即标题n-gram集合Jaccard相似度的估计"""
+    if first is None or second is None:
+        return 0.0
+    return sum(map(operator.eq, first, second)) / NUM_PERMUTATIONS
+
+
+def pack_signature(signature):
+    return None if signature is None else struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack_signature(data):
+    return None if data is None else struct.unpack(_SIGNATURE_FORMAT, data)
+
+
+def name_buckets(signature):
+    """标题签名的LSH分段桶，返回 [(分段编号, 桶)]"""
+    if signature is None:
+        return []
+    return [
+        (band, _signed64(_hash64(struct.pack(
+            f'<{NAME_BAND_ROWS}Q', *signature[band * NAME_BAND_ROWS:(band + 1) * NAME_BAND_ROWS]
+        ))))
+        for band in range(NAME_BANDS)
+    ]
+
+
+def image_buckets(image_hash):
+    """图片哈希的分段桶，每段取连续的 IMAGE_BAND_BITS 位"""
+    if image_hash is None:
+        return []
+    value = image_hash & ((1 << 64) - 1)
+    mask = (1 << IMAGE_BAND_BITS) - 1
+    return [
+        (IMAGE_BAND_BASE + band, (value >> (band * IMAGE_BAND_BITS)) & mask)
+        for band in range(IMAGE_BANDS)
+    ]
+
+
+def image_distance(first, second):
+    return bin((first ^ second) & ((1 << 64) - 1)).count('1')
+
+
+def is_same_product(first, second):
+    """first/second为 (标题签名, 图片哈希)，按模块说明中的规则判定是否为同一产品"""
+    similarity = signature_similarity(first[0], second[0])
+    if first[1] is not None and second[1] is not None:
+        return image_distance(first[1], second[1]) <= IMAGE_MAX_DISTANCE and similarity >= IMAGE_NAME_SIMILARITY
+    return similarity >= NAME_SIMILARITY
+
+
+# ---------------- 图片哈希 ----------------
+
+def dhash_image(data):
+    """计算图片字节的64位差值哈希(dHash)，未安装Pillow或无法解析时返回None"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return _signed64(value)
+
+
+def fetch_image_hash(url, timeout=IMAGE_FETCH_TIMEOUT):
+    """下载产品图片并计算dHash，失败时返回None"""
+    if not url or Image is None:
+        return None
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return dhash_image(response.read())
+    except Exception:
+        return None
+
+
+# ---------------- 聚类分配（均在写入连接上执行，由调用方提交事务） ----------------
+
+def _find_matching_clusters(conn, product_id, features, buckets):
+    """在共享分段桶的已有产品中查找判定为同一产品的
+
+    返回 (命中的聚类编号集合, {(分段编号, 桶): 桶中已有的聚类编号集合})。
+    """
+    if not buckets:
+        return set(), {}
+    values = ','.join(['(?, ?)'] * len(buckets))
+    params = [value for bucket in buckets for value in bucket]
+    occupied = {}
+    candidates = {}
+    for band, bucket, candidate_id, cluster_id in conn.execute(
+        # 以常量表连接分段桶表，保证按主键逐桶查找（写成 (band, bucket) IN (VALUES ...) 时可能全表扫描）
+        f"""WITH wanted(band, bucket) AS (VALUES {values})
+        SELECT b.band, b.bucket, c.product_id, c.cluster_id
+        FROM wanted w
+        JOIN product_cluster_buckets b ON b.band = w.band AND b.bucket = w.bucket
+        JOIN product_clusters c ON c.product_id = b.product_id
+        WHERE b.product_id != ?""",
+        params + [product_id]
+    ):
+        occupied.setdefault((band, bucket), set()).add(cluster_id)
+        candidates[candidate_id] = cluster_id
+
+    # 每个聚类只需命中一个产品，按聚类逐个比较，命中后跳过该聚类的其它产品
+    matches = set()
+    candidate_ids = list(candidates)
+    for start in range(0, len(candidate_ids), 500):
+        chunk = candidate_ids[start:start + 500]
+        for candidate_id, signature, image_hash in conn.execute(
+            f"SELECT product_id, name_signature, image_hash FROM product_clusters "
+            f"WHERE product_id IN ({','.join('?' * len(chunk))})", chunk
+        ):
+            cluster_id = candidates[candidate_id]
+            if cluster_id not in matches and is_same_product(features, (unpack_signature(signature), image_hash)):
+                matches.add(cluster_id)
+    return matches, occupied
+
+
+def _merge_clusters(conn, cluster_ids):
+    """把多个聚类合并到编号最小的一个，返回合并后的编号"""
+    target = min(cluster_ids)
+    others = [cluster_id for cluster_id in cluster_ids if cluster_id != target]
+    if others:
+        conn.execute(
+            f"UPDATE product_clusters SET cluster_id = ? WHERE cluster_id IN ({','.join('?' * len(others))})",
+            [target] + others
+        )
+    return target
+
+
+def _insert_buckets(conn, product_id, buckets, occupied, cluster_ids):
+    """写入产品的分段桶；桶中已有同一聚类的产品时跳过，每个桶中每个聚类最多一个产品，
+    标题完全相同的大量产品不会让桶无限增大"""
+    conn.executemany(
+        "INSERT OR IGNORE INTO product_cluster_buckets (band, bucket, product_id) VALUES (?, ?, ?)",
+        [
+            (band, bucket, product_id) for band, bucket in buckets
+            if not occupied.get((band, bucket), set()) & cluster_ids
+        ]
+    )
+
+
+def assign_clusters(conn, products, image_hashes=None):
+    """为尚未分配聚类的产品分配cluster_id，返回 (新分配数, 合并的聚类数)
+
+    products为 [(product_id, product_name)]，已分配的产品跳过；image_hashes为可选的
+    {product_id: 图片哈希}。同一批内先分配的产品对后面的产品可见。
+    """
+    image_hashes = image_hashes or {}
+    pending = {product_id: name for product_id, name in products if product_id}
+    if not pending:
+        return 0, 0
+    product_ids = list(pending)
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        for (product_id,) in conn.execute(
+            f"SELECT product_id FROM product_clusters WHERE product_id IN ({','.join('?' * len(chunk))})", chunk
+        ):
+            del pending[product_id]
+
+    assigned = merged = 0
+    for product_id, name in pending.items():
+        signature = minhash_signature(name_shingles(name))
+        image_hash = image_hashes.get(product_id)
+        buckets = name_buckets(signature) + image_buckets(image_hash)
+        matches, occupied = _find_matching_clusters(conn, product_id, (signature, image_hash), buckets)
+        if matches:
+            cluster_id = _merge_clusters(conn, matches)
+            merged += len(matches) - 1
+        else:
+            cluster_id = conn.execute("SELECT COALESCE(MAX(cluster_id), 0) + 1 FROM product_clusters").fetchone()[0]
+        conn.execute(
+            "INSERT INTO product_clusters (product_id, cluster_id, name_signature, image_hash, assigned_at) "
+            "VALUES (?, ?, ?, ?, datetime('now', 'localtime'))",
+            (product_id, cluster_id, pack_signature(signature), image_hash)
+        )
+        _insert_buckets(conn, product_id, buckets, occupied, matches | {cluster_id})
+        assigned += 1
+    return assigned, merged
+
+
+def update_image_hashes(conn, image_hashes):
+    """为已分配聚类的产品补充图片哈希，并按图片重新查找同一产品，返回合并的聚类数"""
+    merged = 0
+    for product_id, image_hash in image_hashes.items():
+        row = conn.execute(
+            "SELECT cluster_id, name_signature FROM product_clusters WHERE product_id = ?", (product_id,)
+        ).fetchone()
+        if row is None or image_hash is None:
+            continue
+        conn.execute("UPDATE product_clusters SET image_hash = ? WHERE product_id = ?", (image_hash, product_id))
+        buckets = image_buckets(image_hash)
+        matches, occupied = _find_matching_clusters(
+            conn, product_id, (unpack_signature(row[1]), image_hash), buckets
+        )
+        cluster_ids = matches | {row[0]}
+        if len(cluster_ids) > 1:
+            _merge_clusters(conn, cluster_ids)
+            merged += len(cluster_ids) - 1
+        _insert_buckets(conn, product_id, buckets, occupied, cluster_ids)
+    return merged
+
+
+def unassigned_products(conn):
+    """尚未分配聚类的产品及其最新标题、图片"""
+    return conn.execute(
+        """SELECT product_id, product_name, product_pic FROM products
+        WHERE id IN (SELECT MAX(id) FROM products WHERE product_id IS NOT NULL GROUP BY product_id)
+          AND product_id NOT IN (SELECT product_id FROM product_clusters)
+        ORDER BY id"""
+    ).fetchall()
+
+
+def backfill_clusters(conn, fetch_images=False, batch_size=500):
+    """为所有未分配的产品分配聚类，fetch_images为True时先下载图片计算图片哈希，返回新分配数"""
+    products = unassigned_products(conn)
+    assigned = 0
+    for start in range(0, len(products), batch_size):
+        batch = products[start:start + batch_size]
+        image_hashes = {}
+        if fetch_images:
+            image_hashes = {product_id: fetch_image_hash(pic) for product_id, _, pic in batch}
+        count, _ = assign_clusters(conn, [(product_id, name) for product_id, name, _ in batch], image_hashes)
+        assigned += count
+        conn.commit()
+    return assigned
+
+
+def backfill_image_hashes(conn):
+    """为已分配聚类但没有图片哈希的产品下载图片，返回 (补充数, 合并的聚类数)"""
+    rows = conn.execute(
+        """SELECT p.product_id, p.product_pic FROM products p JOIN product_clusters c ON c.product_id = p.product_id
+        WHERE p.id IN (SELECT MAX(id) FROM products WHERE product_id IS NOT NULL GROUP BY product_id)
+          AND c.image_hash IS NULL AND p.product_pic IS NOT NULL"""
+    ).fetchall()
+    image_hashes = {product_id: fetch_image_hash(pic) for product_id, pic in rows}
+    image_hashes = {product_id: value for product_id, value in image_hashes.items() if value is not None}
+    merged = update_image_hashes(conn, image_hashes)
+    conn.commit()
+    return len(image_hashes), merged
+
+
+def main():
+    import product_db
+
+    parser = argparse.ArgumentParser(description="为产品分配近似重复聚类")
+    parser.add_argument('--db', default=product_db.DB_PATH, help="数据库文件路径")
+    parser.add_argument('--images', action='store_true', help="下载产品图片计算图片哈希（需要Pillow）")
+    args = parser.parse_args()
+    if args.images and Image is None:
+        parser.error("未安装Pillow，无法计算图片哈希：pip install Pillow")
+
+    conn = product_db.connect(args.db)
+    try:
+        assigned = backfill_clusters(conn, fetch_images=args.images)
+        print(f"✅ 已为 {assigned} 个产品分配聚类")
+        if args.images:
+            hashed, merged = backfill_image_hashes(conn)
+            print(f"✅ 已为 {hashed} 个产品补充图片哈希，合并 {merged} 个聚类")
+        clusters, products = conn.execute(
+            "SELECT COUNT(DISTINCT cluster_id), COUNT(*) FROM product_clusters"
+        ).fetchone()
+        print(f"📊 共 {products} 个产品，{clusters} 个聚类")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
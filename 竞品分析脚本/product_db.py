@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+竞品数据库(product_data.db)的表结构、迁移和二维码图片存储
+
+采集脚本(jp.py)和分析脚本(analyze_data.py)共用本模块，保证双方看到的表结构一致。
+二维码图片按内容哈希存入 blobs 表，products 只保存哈希引用，同一张图片只存一份。
+价格、支付金额、增长率、曝光人数等区间字符串在入库时解析为 _low/_high/_mid 数值列。
+产品按快照存储：指标指纹未变化时不插入新行，只更新最新快照的 last_seen_at，
+最新快照在下一次变化之前一直有效。同一产品在不同查询维度（日期范围、类目等）下的
+数据分别记录在 query_dims 中，各维度独立比对快照。
+接口原始响应按内容哈希压缩存入 raw_payloads 表，raw_payload_index 记录每次捕获的
+(哈希, URL, 捕获时间)，相同的响应只多一行索引。
+product_clusters/product_cluster_buckets 保存跨店铺近似重复产品的聚类，分配逻辑见 product_clusters。
+"""
+
+import base64
+import hashlib
+import os
+import sqlite3
+import sys
+import zlib
+
+# 获取脚本所在目录的绝对路径
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(SCRIPT_DIR, 'product_data.db')
+# 将项目根目录加入模块搜索路径，以便复用common下的公共模块
+PROJECT_DIR = os.path.dirname(SCRIPT_DIR)
+if PROJECT_DIR not in sys.path:
+    sys.path.append(PROJECT_DIR)
+
+from common.range_parser import parse_range
+
+# 当前表结构版本，记录在 PRAGMA user_version 中
+SCHEMA_VERSION = 8
+
+PNG_DATA_URI_PREFIX = 'data:image/png;base64,'
+
+# 区间字符串列 -> 解析后数值列的前缀，每个前缀对应 _low/_high/_mid 三列
+RANGE_COLUMNS = [
+    ('price_range', 'price'),
+    ('pay_amount', 'pay_amount'),
+    ('pay_amount_growth_rate', 'growth'),
+    ('impressions_people_num', 'impressions'),
+]
+RANGE_VALUE_COLUMNS = [
+    f"{prefix}_{suffix}" for _, prefix in RANGE_COLUMNS for suffix in ('low', 'high', 'mid')
+]
+
+# 增长率排序规则的SQL表达式，与 common.range_parser.growth_score 一致：
+# 取区间书写时的第一个数：正区间和跨0的区间取下限，负区间取离0较近的上限；
+# >=100%为3，>=50%为2，>=20%为1，>=-15%为0，其余为-1；无数据为0。
+# 两个表达式作为 products 的虚拟生成列 growth_value/growth_score，排序和筛选直接在SQL中完成
+GROWTH_VALUE_SQL = "COALESCE(CASE WHEN growth_high < 0 THEN growth_high ELSE growth_low END, 0)"
+GROWTH_SCORE_SQL = f"""CASE
+    WHEN growth_low IS NULL THEN 0
+    WHEN {GROWTH_VALUE_SQL} >= 100 THEN 3
+    WHEN {GROWTH_VALUE_SQL} >= 50 THEN 2
+    WHEN {GROWTH_VALUE_SQL} >= 20 THEN 1
+    WHEN {GROWTH_VALUE_SQL} >= -15 THEN 0
+    ELSE -1
+END"""
+
+# 参与快照指纹计算的列：任一列变化即视为产品数据有变化，需要插入新快照
+FINGERPRINT_COLUMNS = [
+    'product_name', 'price_range', 'pay_amount', 'pay_amount_growth_rate', 'impressions_people_num'
+]
+
+
+def create_tables(conn):
+    """创建采集所需的表和索引"""
+    cursor = conn.cursor()
+
+    # 创建店铺表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shops (
+        shop_id TEXT PRIMARY KEY,
+        shop_name TEXT,
+        last_updated TIMESTAMP
+    )
+    ''')
+
+    # 创建产品表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id TEXT,
+        product_name TEXT,
+        product_pic TEXT,
+        price_range TEXT,
+        pay_amount TEXT,
+        pay_amount_growth_rate TEXT,
+        impressions_people_num TEXT,
+        shop_id TEXT,
+        captured_at TIMESTAMP,
+        qr_code TEXT,
+        FOREIGN KEY (shop_id) REFERENCES shops (shop_id)
+    )
+    ''')
+
+    # 创建索引以提高查询性能
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_shop_id ON products(shop_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_captured_at ON products(captured_at)')
+
+    # 创建二维码图片表，按sha256内容哈希去重存储解码后的PNG字节
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash TEXT PRIMARY KEY,
+        bytes BLOB
+    )
+    ''')
+
+    # 创建原始响应归档表，按响应体sha256去重，zlib压缩存储
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS raw_payloads (
+        hash TEXT PRIMARY KEY,
+        size INTEGER,
+        data BLOB
+    )
+    ''')
+
+    # 创建原始响应索引表，每次捕获一行
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS raw_payload_index (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        hash TEXT,
+        url TEXT,
+        captured_at TIMESTAMP,
+        FOREIGN KEY (hash) REFERENCES raw_payloads (hash)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_raw_payload_index_hash ON raw_payload_index(hash)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_raw_payload_index_captured_at ON raw_payload_index(captured_at)')
+
+    # 创建采集批次表，记录每次批量采集的进度，用于中断后续采
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS collection_runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        status TEXT,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    ''')
+
+    # 创建批次内店铺状态表：pending/running/done/failed
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS collection_shop_status (
+        run_id INTEGER,
+        shop_id TEXT,
+        shop_name TEXT,
+        status TEXT,
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        duration_ms INTEGER,
+        PRIMARY KEY (run_id, shop_id),
+        FOREIGN KEY (run_id) REFERENCES collection_runs (run_id)
+    )
+    ''')
+
+    # 创建近似重复产品聚类表，每个产品一行，保存MinHash签名和图片哈希用于后续比对
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS product_clusters (
+        product_id TEXT PRIMARY KEY,
+        cluster_id INTEGER,
+        name_signature BLOB,
+        image_hash INTEGER,
+        assigned_at TIMESTAMP
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_clusters_cluster_id ON product_clusters(cluster_id)')
+
+    # 创建聚类LSH分段桶表，新产品只与同一分段桶中的产品比较
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS product_cluster_buckets (
+        band INTEGER,
+        bucket INTEGER,
+        product_id TEXT,
+        PRIMARY KEY (band, bucket, product_id)
+    ) WITHOUT ROWID
+    ''')
+
+
+def add_missing_columns(conn, table, columns):
+    """为已存在的旧表补充新增的列，columns为 [(列名, 类型定义)]"""
+    # table_xinfo 才会列出生成列，table_info 会把它们隐藏
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_xinfo({table})")}
+    for name, definition in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def add_growth_columns(conn):
+    """添加增长率排序的生成列，以及以它们为键的增长率排名覆盖索引"""
+    # 生成列依赖区间数值列，需要在它们之后添加；ALTER TABLE 只能添加VIRTUAL生成列，
+    # 查询时按需计算，建索引后索引中保存计算结果
+    add_missing_columns(
+        conn, 'products',
+        [('growth_value', f"REAL GENERATED ALWAYS AS ({GROWTH_VALUE_SQL}) VIRTUAL"),
+         ('growth_score', f"INTEGER GENERATED ALWAYS AS ({GROWTH_SCORE_SQL}) VIRTUAL")]
+    )
+    # 按最后出现时间筛选有效快照；同时是增长率排名的覆盖索引（含查询维度），时间窗口内排名时只读索引，不回表
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_products_last_seen_growth_dims '
+        'ON products(last_seen_at, growth_score, growth_value, product_id, query_dims)'
+    )
+
+
+def ensure_schema(conn):
+    """创建表结构并执行尚未应用的迁移"""
+    create_tables(conn)
+    add_missing_columns(
+        conn, 'products',
+        [('qr_code_hash', 'TEXT')] + [(column, 'REAL') for column in RANGE_VALUE_COLUMNS]
+        + [('fingerprint', 'TEXT'), ('last_seen_at', 'TIMESTAMP'), ("query_dims", "TEXT DEFAULT ''")]
+    )
+    add_growth_columns(conn)
+    # 数值列索引，排序和筛选可以直接在SQL中完成
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_growth_mid ON products(growth_mid)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_shop_growth ON products(shop_id, growth_mid)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_pay_amount_mid ON products(pay_amount_mid)')
+    # 按店铺加载每个产品的最新快照
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_products_shop_product_dims ON products(shop_id, product_id, query_dims, id)'
+    )
+    # 多日趋势分析的覆盖索引：按查询维度和时间窗口取快照的数值列，不回表读取名称、图片等宽字段
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_products_trend ON products('
+        'query_dims, last_seen_at, shop_id, product_id, captured_at, pay_amount_mid, growth_mid, impressions_mid)'
+    )
+
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    migrated = 0
+    if version < 1:
+        migrated += migrate_qr_codes_to_blobs(conn)
+    if version < 2:
+        backfilled = backfill_range_columns(conn)
+        print(f"✅ 已为 {backfilled} 条产品记录补充区间数值列")
+    if version < 3:
+        backfilled = backfill_snapshot_columns(conn)
+        print(f"✅ 已为 {backfilled} 条产品记录补充快照指纹")
+    if version < 4:
+        # 快照索引增加了查询维度列，旧索引不再使用
+        conn.execute('DROP INDEX IF EXISTS idx_products_shop_product')
+    if version < 5:
+        # 单列的最后出现时间索引已被以它开头的增长率覆盖索引取代
+        conn.execute('DROP INDEX IF EXISTS idx_products_last_seen_at')
+    if version < 6:
+        from product_clusters import backfill_clusters
+        assigned = backfill_clusters(conn)
+        print(f"✅ 已为 {assigned} 个产品分配近似重复聚类")
+    if version < 7:
+        # 增长率排名按主查询维度筛选，覆盖索引增加了查询维度列
+        conn.execute('DROP INDEX IF EXISTS idx_products_last_seen_growth')
+    if version < 8:
+        # 跨0的增长率区间改为取下限（与重构前的排序一致），生成列的表达式无法修改，删除后按新表达式重新添加
+        conn.execute('DROP INDEX IF EXISTS idx_products_last_seen_growth_dims')
+        conn.execute('ALTER TABLE products DROP COLUMN growth_score')
+        conn.execute('ALTER TABLE products DROP COLUMN growth_value')
+        add_growth_columns(conn)
+
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    if migrated:
+        # 回收迁移释放出的空间
+        conn.execute("VACUUM")
+        print(f"✅ 已将 {migrated} 条产品记录的二维码迁移到blobs表")
+
+
+def decode_qr_code(qr_code):
+    """将PNG data URI解码为 (哈希, 字节)，不是PNG data URI时返回None"""
+    if not qr_code or not qr_code.startswith(PNG_DATA_URI_PREFIX):
+        return None
+    try:
+        data = base64.b64decode(qr_code[len(PNG_DATA_URI_PREFIX):])
+    except (ValueError, TypeError):
+        return None
+    return hashlib.sha256(data).hexdigest(), data
+
+
+def store_qr_codes(conn, qr_codes):
+    """批量存储二维码图片，返回 {原始qr_code: 哈希}，相同图片只写入一次"""
+    hashes = {}
+    blobs = {}
+    for qr_code in qr_codes:
+        if qr_code in hashes:
+            continue
+        decoded = decode_qr_code(qr_code)
+        if decoded:
+            blob_hash, data = decoded
+            hashes[qr_code] = blob_hash
+            blobs[blob_hash] = data
+    if blobs:
+        conn.executemany(
+            "INSERT OR IGNORE INTO blobs (hash, bytes) VALUES (?, ?)",
+            [(blob_hash, sqlite3.Binary(data)) for blob_hash, data in blobs.items()]
+        )
+    return hashes
+
+
+def migrate_qr_codes_to_blobs(conn, batch_size=500):
+    """把旧记录中内联的二维码data URI改写为blobs表中的哈希引用，返回迁移的行数"""
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, qr_code FROM products WHERE id > ? AND qr_code LIKE 'data:image/png;base64,%' "
+            "ORDER BY id LIMIT ?",
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        hashes = store_qr_codes(conn, [qr_code for _, qr_code in rows])
+        updates = [(hashes[qr_code], row_id) for row_id, qr_code in rows if qr_code in hashes]
+        conn.executemany("UPDATE products SET qr_code_hash = ?, qr_code = NULL WHERE id = ?", updates)
+        migrated += len(updates)
+        last_id = rows[-1][0]
+    return migrated
+
+
+def range_values(text_values):
+    """把各区间字符串列的值解析为数值列，返回顺序与 RANGE_VALUE_COLUMNS 一致的元组"""
+    values = ()
+    for text in text_values:
+        values += parse_range(text)
+    return values
+
+
+def backfill_range_columns(conn):
+    """用一条UPDATE为旧记录补充区间数值列，返回更新的行数
+
+    解析函数注册为SQLite确定性函数，并按字符串缓存解析结果，
+    每个不同的区间字符串只解析一次。
+    """
+    def part(index):
+        return lambda text: parse_range(text)[index]
+
+    for name, index in (('range_low', 0), ('range_high', 1), ('range_mid', 2)):
+        conn.create_function(name, 1, part(index), deterministic=True)
+
+    assignments = ', '.join(
+        f"{prefix}_{suffix} = range_{suffix}({source})"
+        for source, prefix in RANGE_COLUMNS for suffix in ('low', 'high', 'mid')
+    )
+    cursor = conn.execute(f"UPDATE products SET {assignments}")
+    return cursor.rowcount
+
+
+def snapshot_fingerprint(*values):
+    """计算产品指标的指纹，参数顺序与 FINGERPRINT_COLUMNS 一致"""
+    text = '\x1f'.join('' if value is None else str(value) for value in values)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def backfill_snapshot_columns(conn):
+    """为旧记录补充快照指纹，并以采集时间作为最后出现时间，返回更新的行数"""
+    conn.create_function('snapshot_fingerprint', len(FINGERPRINT_COLUMNS), snapshot_fingerprint, deterministic=True)
+    cursor = conn.execute(
+        f"UPDATE products SET fingerprint = snapshot_fingerprint({', '.join(FINGERPRINT_COLUMNS)}), "
+        "last_seen_at = COALESCE(last_seen_at, captured_at) WHERE fingerprint IS NULL"
+    )
+    return cursor.rowcount
+
+
+def load_latest_snapshots(conn, shop_id):
+    """读取店铺下每个产品在各查询维度下的最新快照，返回 {(product_id, query_dims): (快照行id, 指纹)}"""
+    rows = conn.execute(
+        "SELECT product_id, query_dims, id, fingerprint FROM products "
+        "WHERE id IN (SELECT MAX(id) FROM products WHERE shop_id = ? GROUP BY product_id, query_dims)",
+        (shop_id,)
+    )
+    return {
+        (product_id, query_dims or ''): (row_id, fingerprint)
+        for product_id, query_dims, row_id, fingerprint in rows
+    }
+
+
+def archive_raw_payload(conn, url, body, captured_at):
+    """归档一次接口原始响应，返回 (哈希, 是否为新内容)；相同内容只压缩存储一次"""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    payload_hash = hashlib.sha256(body).hexdigest()
+    exists = conn.execute("SELECT 1 FROM raw_payloads WHERE hash = ?", (payload_hash,)).fetchone()
+    if not exists:
+        conn.execute(
+            "INSERT INTO raw_payloads (hash, size, data) VALUES (?, ?, ?)",
+            (payload_hash, len(body), sqlite3.Binary(zlib.compress(body, 6)))
+        )
+    conn.execute(
+        "INSERT INTO raw_payload_index (hash, url, captured_at) VALUES (?, ?, ?)",
+        (payload_hash, url, captured_at)
+    )
+    return payload_hash, not exists
+
+
+def load_blobs(conn, hashes):
+    """按哈希批量读取blobs表中的图片字节，返回 {哈希: 字节}"""
+    hashes = [blob_hash for blob_hash in set(hashes) if blob_hash]
+    result = {}
+    # 分批查询，避免超过SQLite的参数数量上限
+    for start in range(0, len(hashes), 500):
+        chunk = hashes[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        for blob_hash, data in conn.execute(
+            f"SELECT hash, bytes FROM blobs WHERE hash IN ({placeholders})", chunk
+        ):
+            result[blob_hash] = data
+    return result
+
+
+def load_qr_codes(conn, hashes):
+    """按哈希批量读取二维码，返回 {哈希: PNG data URI}"""
+    return {
+        blob_hash: PNG_DATA_URI_PREFIX + base64.b64encode(data).decode('ascii')
+        for blob_hash, data in load_blobs(conn, hashes).items()
+    }
+
+
+def connect(db_path=DB_PATH):
+    """打开数据库连接并确保表结构为最新版本"""
+    conn = sqlite3.connect(db_path)
+    ensure_schema(conn)
+    return conn
+
+
+if __name__ == '__main__':
+    # 单独运行时执行数据库迁移
+    print(f"🔄 正在迁移数据库: {DB_PATH}")
+    connect().close()
+    print("✅ 数据库迁移完成")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTML报告的外部图片资源
+
+报告默认不再内联base64二维码：二维码PNG按内容sha256（即blobs表的哈希）写入资源目录，
+每张图片只写一次，之后的报告直接引用已有文件，只为目录中还没有的哈希读取blobs表。
+可选地把产品主图下载并缩小为缩略图（需要Pillow），同样按原图内容的sha256命名，不同
+CDN地址指向同一张图片时只保存一份；thumbs/index.json 记录 原图地址 -> 文件名，
+已下载过的地址不再重复下载。报告中的图片统一使用 loading="lazy"，页面大小和打开速度
+与产品数量基本无关。
+
+目录结构：
+    report_assets/qr/<sha256>.png
+    report_assets/thumbs/<sha256>.jpg
+    report_assets/thumbs/index.json
+"""
+
+import hashlib
+import io
+import json
+import os
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+ASSETS_DIRNAME = 'report_assets'
+# 报告中以100x100显示，缩略图按2倍尺寸保存以适配高分屏
+THUMBNAIL_SIZE = (200, 200)
+THUMBNAIL_QUALITY = 85
+THUMBNAIL_FETCH_TIMEOUT = 10
+THUMBNAIL_WORKERS = 8
+
+THUMBNAILS_AVAILABLE = Image is not None
+
+
+def make_thumbnail(data):
+    """把图片字节缩小为JPEG缩略图，无法解析时返回None"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = image.convert('RGB')
+            image.thumbnail(THUMBNAIL_SIZE)
+            output = io.BytesIO()
+            image.save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+            return output.getvalue()
+    except Exception:
+        return None
+
+
+def download(url, timeout=THUMBNAIL_FETCH_TIMEOUT):
+    """下载图片，失败时返回None"""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.read()
+    except Exception:
+        return None
+
+
+def write_atomic(path, data):
+    """先写入带进程号的临时文件再改名，多个进程同时写同一文件时互不干扰"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class ReportAssets:
+    """报告资源目录：按内容哈希写入二维码和缩略图，返回页面中引用它们的相对地址
+
+    root_dir为资源目录，url_prefix为页面引用资源时使用的相对路径前缀
+    （报告与资源目录的相对位置不同时传入，如 '../report_assets'）。
+    """
+
+    def __init__(self, root_dir, url_prefix=ASSETS_DIRNAME, thumbnails=False):
+        self.root_dir = root_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.thumbnails = thumbnails and THUMBNAILS_AVAILABLE
+        self._thumbnail_index = None
+        # 本次运行新写入的文件数
+        self.written = 0
+
+    def _path(self, subdir, name):
+        return os.path.join(self.root_dir, subdir, name)
+
+    def _url(self, subdir, name):
+        return f"{self.url_prefix}/{subdir}/{name}"
+
+    def _write_once(self, subdir, name, data):
+        """文件不存在时写入（先写临时文件再改名，并发生成报告时不会读到写了一半的图片）"""
+        path = self._path(subdir, name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, data)
+            self.written += 1
+        return self._url(subdir, name)
+
+    # ---------------- 二维码 ----------------
+
+    def has_qr_code(self, qr_code_hash):
+        return os.path.exists(self._path('qr', f"{qr_code_hash}.png"))
+
+    def qr_code_url(self, qr_code_hash):
+        return self._url('qr', f"{qr_code_hash}.png")
+
+    def add_qr_code(self, qr_code_hash, data):
+        return self._write_once('qr', f"{qr_code_hash}.png", data)
+
+    # ---------------- 缩略图 ----------------
+
+    def _index_path(self):
+        return self._path('thumbs', 'index.json')
+
+    def _load_thumbnail_index(self):
+        if self._thumbnail_index is None:
+            try:
+                with open(self._index_path(), encoding='utf-8') as f:
+                    self._thumbnail_index = json.load(f)
+            except (OSError, ValueError):
+                self._thumbnail_index = {}
+        return self._thumbnail_index
+
+    def _fetch_thumbnail(self, url):
+        """下载原图并生成缩略图，返回 (文件名, 缩略图字节)，失败时返回None"""
+        data = download(url)
+        thumbnail = make_thumbnail(data) if data else None
+        if thumbnail is None:
+            return None
+        return f"{hashlib.sha256(data).hexdigest()}.jpg", thumbnail
+
+    def thumbnail_urls(self, urls):
+        """返回 {原图地址: 缩略图相对地址}，未启用缩略图或下载失败的地址不在结果中"""
+        if not self.thumbnails:
+            return {}
+        index = self._load_thumbnail_index()
+        urls = {url for url in urls if url and url.startswith(('http://', 'https://'))}
+        missing = [
+            url for url in urls
+            if url not in index or not os.path.exists(self._path('thumbs', index[url]))
+        ]
+        if missing:
+            with ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS) as executor:
+                for url, result in zip(missing, executor.map(self._fetch_thumbnail, missing)):
+                    if result:
+                        name, thumbnail = result
+                        self._write_once('thumbs', name, thumbnail)
+                        index[url] = name
+            os.makedirs(os.path.dirname(self._index_path()), exist_ok=True)
+            write_atomic(self._index_path(), json.dumps(index, ensure_ascii=False).encode('utf-8'))
+        return {url: self._url('thumbs', index[url]) for url in urls if url in index}
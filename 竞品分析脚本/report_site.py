@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多日静态报告站点
+
+在 report_site 目录下生成可以互相跳转的静态页面：
+    index.html              所有日报和店铺页的入口
+    days/<YYYY-MM-DD>.html  当天有效快照的平台增长率TOP N和各店铺TOP N
+    shops/<shop_id>.html    店铺在时间窗口内每天的增长率TOP N
+    report_assets/          页面共用的二维码图片（见 report_assets.py）
+    manifest.json           每个页面的输入指纹和索引页需要的摘要
+
+增量生成：先用一次覆盖索引扫描算出每天、每个店铺的输入指纹（快照行数、最大id、
+截断到当天结束时间的最大last_seen_at），与 manifest.json 中记录的指纹相同且页面文件
+存在时跳过。已经过去的日期没有新数据时指纹不变，每晚通常只需要重新生成当天、前一天
+和数据有变化的店铺页。需要生成的页面分发到进程池中并行渲染，每个进程持有自己的只读连接。
+超出时间窗口的日报保留在站点中，索引页继续列出。
+
+只统计主查询维度的快照（见 analyze_data.primary_query_dims），与排名、趋势和同款聚类的口径一致。
+"""
+
+import datetime
+import hashlib
+import heapq
+import html
+import json
+import os
+import re
+import string
+from concurrent.futures import ProcessPoolExecutor
+
+import analyze_data
+from generate_html_report import (
+    PARAGRAPH, REPORT_CSS, SECTION_END, SECTION_START, SHOP_PRODUCT_HEADERS, SUBSECTION_TITLE, TOP_PRODUCT_HEADERS,
+    escape, image_html, write_table
+)
+from report_assets import ASSETS_DIRNAME, ReportAssets, write_atomic
+
+SITE_DIR = os.path.join(analyze_data.SCRIPT_DIR, 'report_site')
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_DAYS = analyze_data.SITE_DEFAULT_DAYS
+DEFAULT_TOP_N = analyze_data.SITE_DEFAULT_TOP_N
+# 页面模板或渲染逻辑变化时递增，所有页面的指纹随之变化、全部重新生成
+SITE_VERSION = 1
+
+SITE_CSS = """
+        .nav {
+            margin-bottom: 20px;
+        }
+
+        .nav a {
+            margin-right: 16px;
+            color: #3498db;
+            text-decoration: none;
+        }
+
+        td a, h3 a {
+            color: inherit;
+        }
+"""
+
+SITE_PAGE_HEAD = string.Template('''<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>$title</title>
+    <style>$css$site_css    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="nav">$nav</div>
+        <div class="header">
+            <h1>$heading</h1>
+            <p>$subtitle</p>
+        </div>''')
+
+SITE_PAGE_TAIL = string.Template('''
+
+        <div class="footer">
+            <p>报告生成工具: 产品数据分析助手 v1.0 | 页面生成时间: $generated_at</p>
+        </div>
+    </div>
+</body>
+</html>
+''')
+
+LINK = string.Template('<a href="$href">$text</a>')
+
+# 当天有效的快照：采集时间早于次日零点，且最后出现时间不早于当天零点；每个产品取其中最新的一条，
+# 只返回各店铺的TOP N，平台TOP N必然在其中
+DAY_TOP_PRODUCTS_SQL = """
+WITH day_rows AS MATERIALIZED (
+    SELECT MAX(id) AS id FROM products
+    WHERE query_dims = :query_dims AND last_seen_at >= :day_start AND captured_at < :day_end
+    GROUP BY product_id
+),
+ranked AS (
+    SELECT p.id, p.shop_id, p.product_id, p.product_name, p.product_pic, p.pay_amount_growth_rate,
+           p.growth_score, p.growth_value, p.qr_code, p.qr_code_hash,
+           ROW_NUMBER() OVER (
+               PARTITION BY p.shop_id ORDER BY p.growth_score DESC, p.growth_value DESC, p.id DESC
+           ) AS shop_rank
+    FROM day_rows d JOIN products p ON p.id = d.id
+    WHERE p.growth_score >= 0
+)
+SELECT id, shop_id, product_id, product_name, product_pic, pay_amount_growth_rate,
+       growth_score, growth_value, qr_code, qr_code_hash
+FROM ranked
+WHERE shop_rank <= :top_n
+ORDER BY shop_id, shop_rank
+"""
+
+# last_seen_at 前的 + 让SQLite按店铺索引查找，而不是在 idx_products_trend 中扫描所有店铺的时间范围
+SHOP_SNAPSHOTS_SQL = """
+SELECT id, product_id, product_name, product_pic, pay_amount_growth_rate, growth_score, growth_value,
+       qr_code, qr_code_hash, substr(captured_at, 1, 10), substr(last_seen_at, 1, 10)
+FROM products
+WHERE shop_id = :shop_id AND query_dims = :query_dims AND +last_seen_at >= :window_start AND captured_at < :window_end
+"""
+
+
+# ---------------- 页面路径和链接 ----------------
+
+def day_page(day):
+    return f"days/{day}.html"
+
+
+def shop_page(shop_id):
+    # 店铺ID通常为数字，其它字符替换为下划线，保证是合法的文件名
+    return f"shops/{re.sub(r'[^0-9A-Za-z_-]', '_', str(shop_id))}.html"
+
+
+def link_html(href, text):
+    return LINK.substitute(href=html.escape(href), text=escape(text))
+
+
+def fingerprint(*inputs):
+    return hashlib.sha1(json.dumps([SITE_VERSION, *inputs], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def day_range(start_day, end_day):
+    start = datetime.date.fromisoformat(start_day)
+    return [
+        (start + datetime.timedelta(days=offset)).isoformat()
+        for offset in range((datetime.date.fromisoformat(end_day) - start).days + 1)
+    ]
+
+
+# ---------------- 输入指纹 ----------------
+
+def scan_inputs(conn, days, query_dims):
+    """汇总窗口内的快照，返回 (每天的摘要, 每个店铺的摘要)
+
+    SQL只读 idx_products_trend 覆盖索引，按 (店铺, 采集日期, 最后出现日期) 分组后通常只有
+    快照行数的十分之一以下，再在Python中展开到快照有效的每一天。
+    每天的摘要为 [快照数, 最大id, 截断到当天结束的最大last_seen_at, 店铺ID集合]，截断后
+    同一快照在之后的采集中更新last_seen_at不会改变过去日期的指纹；
+    每个店铺的摘要为 [快照数, 最大id, 最大last_seen_at, 第一个有数据的天序号, 最后一个有数据的天序号]。
+    """
+    day_index = {day: index for index, day in enumerate(days)}
+    day_stats = [[0, 0, '', set()] for _ in days]
+    shop_stats = {}
+    window_end = (datetime.date.fromisoformat(days[-1]) + datetime.timedelta(days=1)).isoformat()
+    groups = conn.execute(
+        """
+        SELECT shop_id, substr(captured_at, 1, 10), substr(last_seen_at, 1, 10),
+               COUNT(*), MAX(id), MAX(last_seen_at)
+        FROM products
+        WHERE query_dims = :query_dims AND last_seen_at >= :window_start AND captured_at < :window_end
+        GROUP BY 1, 2, 3
+        """,
+        {'query_dims': query_dims, 'window_start': days[0], 'window_end': window_end}
+    )
+    for shop_id, captured_day, seen_day, count, max_id, max_seen in groups:
+        stats = shop_stats.get(shop_id)
+        first = day_index[captured_day] if captured_day >= days[0] else 0
+        last = day_index.get(seen_day, len(days) - 1)
+        if stats is None:
+            stats = shop_stats[shop_id] = [0, 0, '', first, last]
+        stats[0] += count
+        stats[1] = max(stats[1], max_id)
+        stats[2] = max(stats[2], max_seen)
+        stats[3] = min(stats[3], first)
+        stats[4] = max(stats[4], last)
+
+        for index in range(first, last + 1):
+            day = day_stats[index]
+            day[0] += count
+            day[1] = max(day[1], max_id)
+            day[2] = max(day[2], min(max_seen, f"{days[index]} 23:59:59"))
+            day[3].add(shop_id)
+    return {day: stats for day, stats in zip(days, day_stats) if stats[0]}, shop_stats
+
+
+# ---------------- 页面渲染（在进程池中执行） ----------------
+
+_worker = {}
+
+
+def _init_worker(db_path, site_dir):
+    _worker['conn'] = analyze_data.open_read_only(db_path)
+    _worker['site_dir'] = site_dir
+    _worker['assets'] = ReportAssets(os.path.join(site_dir, ASSETS_DIRNAME), url_prefix=f"../{ASSETS_DIRNAME}")
+
+
+def write_page_head(out, title, heading, subtitle, nav_links):
+    out.write(SITE_PAGE_HEAD.substitute(
+        title=escape(title), css=REPORT_CSS, site_css=SITE_CSS,
+        nav=''.join(link_html(href, text) for href, text in nav_links),
+        heading=escape(heading), subtitle=escape(subtitle),
+    ))
+
+
+def write_page_tail(out):
+    out.write(SITE_PAGE_TAIL.substitute(generated_at=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def rank_products(products, top_n):
+    products.sort(key=lambda product: (-product['growth_score'], -product['growth_value'], -product['row_id']))
+    return products[:top_n]
+
+
+def product_from_row(row):
+    row_id, product_id, name, pic, growth_rate, score, growth_value, qr_code, qr_code_hash = row
+    return {
+        'row_id': row_id, 'id': product_id, 'name': name, 'pic': pic, 'growth_rate': growth_rate,
+        'growth_score': score, 'growth_value': growth_value, 'qr_code': qr_code or '', 'qr_code_hash': qr_code_hash,
+    }
+
+
+def product_cells(product, rank, shop_link=None):
+    cells = [str(rank)]
+    if shop_link is not None:
+        cells.append(shop_link)
+    return cells + [
+        escape(product['name'], 50),
+        escape(product['growth_rate']),
+        image_html(product['pic']),
+        image_html(product['qr_code']),
+        escape(product['id']),
+    ]
+
+
+def render_day_page(path, params):
+    """日报：当天平台增长率TOP N和各店铺TOP N"""
+    conn, assets = _worker['conn'], _worker['assets']
+    day, top_n, shop_names = params['day'], params['top_n'], params['shop_names']
+    day_end = (datetime.date.fromisoformat(day) + datetime.timedelta(days=1)).isoformat()
+
+    shop_tops = {}
+    for row in conn.execute(DAY_TOP_PRODUCTS_SQL, {
+        'query_dims': params['query_dims'], 'day_start': day, 'day_end': day_end, 'top_n': top_n
+    }):
+        product = product_from_row(row[:1] + row[2:])
+        product['shop_id'] = row[1]
+        shop_tops.setdefault(row[1], []).append(product)
+    platform_top = rank_products([product for products in shop_tops.values() for product in products], top_n)
+    displayed = platform_top + [product for products in shop_tops.values() for product in products]
+    analyze_data.export_qr_codes(conn, displayed, assets)
+
+    def shop_link(shop_id):
+        return link_html(f"../{shop_page(shop_id)}", shop_names.get(shop_id) or shop_id)
+
+    nav = [('../index.html', '首页')]
+    if params['previous_day']:
+        nav.append((f"../{day_page(params['previous_day'])}", f"← {params['previous_day']}"))
+    if params['next_day']:
+        nav.append((f"../{day_page(params['next_day'])}", f"{params['next_day']} →"))
+
+    with open(path, 'w', encoding='utf-8') as out:
+        write_page_head(out, f"产品数据日报 - {day}", f"产品数据日报 {day}",
+                        f"当天有效快照 {params['snapshots']} 条，{len(shop_names)} 个店铺", nav)
+        out.write(SECTION_START.substitute(title=f"1. 平台增长率TOP{top_n}产品"))
+        write_table(out, TOP_PRODUCT_HEADERS, (
+            product_cells(product, rank, shop_link(product['shop_id']))
+            for rank, product in enumerate(platform_top, 1)
+        ))
+        out.write(SECTION_END)
+
+        out.write(SECTION_START.substitute(title=f"2. 各店铺增长率TOP{top_n}产品"))
+        if not shop_tops:
+            out.write(PARAGRAPH.substitute(text='暂无店铺数据'))
+        for index, (shop_id, products) in enumerate(shop_tops.items(), 1):
+            out.write(SUBSECTION_TITLE.substitute(title=f"2.{index} {shop_link(shop_id)}"))
+            write_table(out, SHOP_PRODUCT_HEADERS, (
+                product_cells(product, rank) for rank, product in enumerate(products, 1)
+            ))
+        out.write(SECTION_END)
+        write_page_tail(out)
+
+
+def render_shop_page(path, params):
+    """店铺页：窗口内店铺有数据的每天的增长率TOP N，日期倒序"""
+    conn, assets = _worker['conn'], _worker['assets']
+    shop_id, shop_name, top_n, days = params['shop_id'], params['shop_name'], params['top_n'], params['days']
+
+    # 每天每个产品取当天有效的最新快照
+    day_index = {day: index for index, day in enumerate(days)}
+    window_end = (datetime.date.fromisoformat(days[-1]) + datetime.timedelta(days=1)).isoformat()
+    latest = [{} for _ in days]
+    rows = conn.execute(SHOP_SNAPSHOTS_SQL, {
+        'shop_id': shop_id, 'query_dims': params['query_dims'], 'window_start': days[0], 'window_end': window_end
+    })
+    for row in rows:
+        captured_day, seen_day = row[9], row[10]
+        first = day_index[captured_day] if captured_day >= days[0] else 0
+        last = day_index.get(seen_day, len(days) - 1)
+        for index in range(first, last + 1):
+            current = latest[index].get(row[1])
+            if current is None or current[0] < row[0]:
+                latest[index][row[1]] = row
+    day_tops = [
+        (day, [product_from_row(row[:9]) for row in heapq.nsmallest(
+            top_n, (row for row in rows.values() if row[5] >= 0), key=lambda row: (-row[5], -row[6], -row[0])
+        )])
+        for day, rows in zip(days, latest) if rows
+    ]
+    day_tops.reverse()
+    analyze_data.export_qr_codes(conn, [product for _, products in day_tops for product in products], assets)
+
+    with open(path, 'w', encoding='utf-8') as out:
+        write_page_head(out, f"店铺报告 - {shop_name or shop_id}", f"🏪 {shop_name or shop_id}",
+                        f"店铺ID {shop_id} | {days[0]} 至 {days[-1]} 每天增长率TOP{top_n}产品",
+                        [('../index.html', '首页')])
+        out.write(SECTION_START.substitute(title=f"每日增长率TOP{top_n}产品"))
+        if not day_tops:
+            out.write(PARAGRAPH.substitute(text='时间窗口内暂无增长产品'))
+        for day, products in day_tops:
+            out.write(SUBSECTION_TITLE.substitute(title=link_html(f"../{day_page(day)}", day)))
+            write_table(out, SHOP_PRODUCT_HEADERS, (
+                product_cells(product, rank) for rank, product in enumerate(products, 1)
+            ))
+        out.write(SECTION_END)
+        write_page_tail(out)
+
+
+def _render_page(task):
+    """渲染一个页面，先写临时文件再替换，返回 (页面路径, 新写入的图片数)"""
+    page, kind, params = task
+    path = os.path.join(_worker['site_dir'], page)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    assets = _worker['assets']
+    written = assets.written
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    (render_day_page if kind == 'day' else render_shop_page)(temp_path, params)
+    os.replace(temp_path, path)
+    return page, assets.written - written
+
+
+# ---------------- 索引页和站点生成 ----------------
+
+def render_index(site_dir, day_entries, shop_entries, window):
+    rows_by_day = (
+        [link_html(day_page(day), day), escape(meta['snapshots']), escape(meta['shops'])]
+        for day, meta in day_entries
+    )
+    rows_by_shop = (
+        [link_html(shop_page(shop_id), meta['name'] or shop_id), escape(shop_id), escape(meta['snapshots']),
+         escape(meta['last_seen_at'])]
+        for shop_id, meta in shop_entries
+    )
+    path = os.path.join(site_dir, 'index.html')
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as out:
+        write_page_head(out, "竞品分析报告站点", "竞品分析报告",
+                        f"时间窗口 {window[0]} 至 {window[1]} | {len(day_entries)} 份日报，{len(shop_entries)} 个店铺", [])
+        out.write(SECTION_START.substitute(title="每日报告"))
+        write_table(out, ['日期', '快照数', '店铺数'], rows_by_day)
+        out.write(SECTION_END)
+        out.write(SECTION_START.substitute(title="店铺报告"))
+        write_table(out, ['店铺名称', '店铺ID', '窗口内快照数', '最后采集时间'], rows_by_shop)
+        out.write(SECTION_END)
+        write_page_tail(out)
+    os.replace(temp_path, path)
+
+
+def load_manifest(site_dir):
+    try:
+        with open(os.path.join(site_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'pages': {}}
+    return manifest if isinstance(manifest.get('pages'), dict) else {'pages': {}}
+
+
+def build_site(db_path=analyze_data.DB_PATH, site_dir=SITE_DIR, days=DEFAULT_DAYS, top_n=DEFAULT_TOP_N,
+               workers=None, force=False, end_day=None, query_dims=analyze_data.PRIMARY_QUERY_DIMS):
+    """生成或增量更新报告站点，返回 (重新生成的页面数, 跳过的页面数)"""
+    conn = analyze_data.connect_to_database(db_path)
+    if conn is None:
+        return 0, 0
+    try:
+        end_day = end_day or datetime.date.today().isoformat()
+        window = day_range((datetime.date.fromisoformat(end_day) - datetime.timedelta(days=days - 1)).isoformat(),
+                           end_day)
+        shop_names = dict(conn.execute("SELECT shop_id, shop_name FROM shops"))
+        query_dims = analyze_data.primary_query_dims(conn, query_dims)
+        day_stats, shop_stats = scan_inputs(conn, window, query_dims)
+    finally:
+        conn.close()
+
+    manifest = load_manifest(site_dir)
+    pages = manifest['pages']
+    tasks = []
+    skipped = 0
+
+    def schedule(page, kind, params, inputs, meta):
+        nonlocal skipped
+        page_fingerprint = fingerprint(kind, params, inputs)
+        entry = pages.get(page)
+        if (not force and entry and entry.get('fingerprint') == page_fingerprint
+                and os.path.exists(os.path.join(site_dir, page))):
+            entry['meta'] = meta
+            skipped += 1
+            return
+        tasks.append(((page, kind, params), page_fingerprint, meta))
+
+    data_days = [day for day in window if day in day_stats]
+    for index, day in enumerate(data_days):
+        stats = day_stats[day]
+        params = {
+            'day': day, 'top_n': top_n, 'query_dims': query_dims, 'snapshots': stats[0],
+            'shop_names': {shop_id: shop_names.get(shop_id) for shop_id in sorted(stats[3])},
+            'previous_day': data_days[index - 1] if index else None,
+            'next_day': data_days[index + 1] if index + 1 < len(data_days) else None,
+        }
+        meta = {'kind': 'day', 'snapshots': stats[0], 'shops': len(stats[3])}
+        schedule(day_page(day), 'day', params, stats[:3], meta)
+    for shop_id, stats in sorted(shop_stats.items()):
+        # 店铺页只渲染店铺有数据的日子，窗口向后移动而店铺数据未变化时指纹不变，不必重新生成
+        params = {
+            'shop_id': shop_id, 'shop_name': shop_names.get(shop_id), 'top_n': top_n, 'query_dims': query_dims,
+            'days': window[stats[3]:stats[4] + 1],
+        }
+        meta = {'kind': 'shop', 'name': shop_names.get(shop_id), 'snapshots': stats[0], 'last_seen_at': stats[2]}
+        schedule(shop_page(shop_id), 'shop', params, stats[:3], meta)
+
+    print(f"📊 时间窗口 {window[0]} 至 {window[-1]}：{len(data_days)} 份日报，{len(shop_stats)} 个店铺页，"
+          f"需要生成 {len(tasks)} 个，未变化跳过 {skipped} 个")
+
+    os.makedirs(site_dir, exist_ok=True)
+    written = 0
+    if tasks:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_init_worker,
+                                 initargs=(db_path, site_dir)) as executor:
+            results = executor.map(_render_page, [task for task, _, _ in tasks],
+                                   chunksize=max(1, len(tasks) // (workers * 4)))
+            for (task, page_fingerprint, meta), (page, page_written) in zip(tasks, results):
+                pages[page] = {'fingerprint': page_fingerprint, 'meta': meta}
+                written += page_written
+
+    # 超出窗口的日报保留，索引页照常列出；店铺页只列出窗口内有数据的店铺
+    day_entries = sorted(
+        ((page[len('days/'):-len('.html')], entry['meta']) for page, entry in pages.items()
+         if entry.get('meta', {}).get('kind') == 'day'),
+        reverse=True
+    )
+    shop_entries = sorted(
+        ((shop_id, pages[shop_page(shop_id)]['meta']) for shop_id in shop_stats if shop_page(shop_id) in pages),
+        key=lambda entry: entry[1]['last_seen_at'], reverse=True
+    )
+    render_index(site_dir, day_entries, shop_entries, (window[0], window[-1]))
+    write_atomic(os.path.join(site_dir, MANIFEST_NAME),
+                 json.dumps({'version': SITE_VERSION, 'pages': pages}, ensure_ascii=False).encode('utf-8'))
+    print(f"✅ 报告站点已更新: {os.path.join(site_dir, 'index.html')}（重新生成 {len(tasks)} 个页面，"
+          f"新写入 {written} 张图片）")
+    return len(tasks), skipped
+
+
+if __name__ == '__main__':
+    import sys
+    import analysis_cli
+    sys.exit(analysis_cli.main(['site'] + sys.argv[1:]))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+jp.py 的响应路由表
+
+页面加载的每个请求/响应（图片、JS、CSS等）都会触发监听器。路由表在模块加载时
+一次性编译为一个带命名分组的正则，监听器先用 match_route(url) 做一次匹配，
+不匹配的URL直接丢弃，不创建任何异步任务；匹配到的响应统一交给 extract_records
+按路由声明的JSON路径顺序提取数据，再交给路由指定的处理方法。
+
+单独运行本模块时对旧的子串判断+分支提取逻辑和路由表做基准对比：
+    python response_routes.py
+"""
+
+import asyncio
+import re
+import time
+import timeit
+from dataclasses import dataclass
+
+SHOP_LIST = 'shop_list'
+PRODUCTS = 'products'
+
+
+@dataclass(frozen=True)
+class Route:
+    """一条响应路由：锚点之后的URL正则、按优先级排列的JSON路径、ProductAnalyzer上的处理方法名"""
+    name: str
+    label: str
+    pattern: str
+    paths: tuple
+    handler: str
+
+
+# 所有目标接口名都包含的公共字面量。合并后的正则以它开头，re模块会先做快速的字面量扫描，
+# 绝大多数静态资源URL在扫描阶段就被排除，匹配开销与原来的子串判断相当
+ROUTE_ANCHOR = 'peer_shop'
+
+# 路由按优先级排列，同一URL匹配多条时取第一条；pattern匹配紧跟在锚点之后的部分
+ROUTES = (
+    Route(
+        name=SHOP_LIST,
+        label='店铺列表',
+        # get_sub_peer_shop_list 及其它 peer_shop..._list 形式的店铺列表接口
+        pattern=r'\w*list',
+        paths=(
+            ('peer_shop_list',),
+            ('data', 'peer_shop_list'),
+            ('data', 'list'),
+        ),
+        handler='on_shop_list',
+    ),
+    Route(
+        name=PRODUCTS,
+        label='产品信息',
+        # business_chance_center/peer_shop_top_sale_goods_info
+        pattern=r'(?<=business_chance_center/peer_shop)_top_sale_goods_info',
+        paths=(
+            ('data', 'list'),
+            ('data', 'data'),
+            ('data', 'peer_shop_top_sale_goods_info_list'),
+            ('data', 'product_list'),
+            ('data',),
+            ('list',),
+            ('peer_shop_top_sale_goods_info_list',),
+            ('product_list',),
+        ),
+        handler='on_products',
+    ),
+)
+
+ROUTES_BY_NAME = {route.name: route for route in ROUTES}
+# 所有路由合并为一个正则，一次search即可判断URL是否需要处理以及属于哪条路由
+_ROUTE_PATTERN = re.compile(
+    re.escape(ROUTE_ANCHOR) + '(?:' + '|'.join(f'(?P<{route.name}>{route.pattern})' for route in ROUTES) + ')'
+)
+
+
+def match_route(url):
+    """返回URL对应的路由，不需要处理时返回None"""
+    match = _ROUTE_PATTERN.search(url)
+    return ROUTES_BY_NAME[match.lastgroup] if match else None
+
+
+def extract_records(data, paths):
+    """按顺序尝试各JSON路径，返回第一个非空且元素为字典的列表，都不满足时返回None"""
+    for path in paths:
+        value = data
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            if isinstance(value, list) and value and isinstance(value[0], dict):
+                return value
+    return None
+
+
+# ---------------- 基准测试 ----------------
+
+def _legacy_capture(url, data):
+    """重构前 handle_response 的匹配和提取逻辑，仅用于基准对比"""
+    if "get_sub_peer_shop_list" in url or ("peer_shop" in url and "list" in url):
+        if isinstance(data, dict):
+            if 'peer_shop_list' in data:
+                return data['peer_shop_list']
+            elif 'data' in data and isinstance(data['data'], dict) and 'peer_shop_list' in data['data']:
+                return data['data']['peer_shop_list']
+            elif 'data' in data and isinstance(data['data'], dict) and 'list' in data['data']:
+                candidate = data['data']['list']
+                if isinstance(candidate, list) and len(candidate) > 0 and isinstance(candidate[0], dict):
+                    return candidate
+    elif "business_chance_center" in url and "peer_shop_top_sale_goods_info" in url:
+        if isinstance(data, dict) and 'data' in data:
+            inner_data = data['data']
+            if isinstance(inner_data, dict):
+                for key in ('list', 'data', 'peer_shop_top_sale_goods_info_list', 'product_list'):
+                    if key in inner_data:
+                        return inner_data[key]
+            elif isinstance(inner_data, list):
+                return inner_data
+        elif isinstance(data, dict):
+            for key in ('list', 'peer_shop_top_sale_goods_info_list', 'product_list'):
+                if key in data:
+                    return data[key]
+    return None
+
+
+def _route_capture(url, data):
+    route = match_route(url)
+    return extract_records(data, route.paths) if route else None
+
+
+def benchmark_samples():
+    """模拟的页面流量 [(url, 响应数据)]，大部分为静态资源"""
+    base = 'https://fxg.jinritemai.com'
+    products = [{'product_id': str(i), 'product_name': f'商品{i}'} for i in range(20)]
+    return [
+        (f'{base}/ffa/static/js/chunk-{i}.js', None) for i in range(12)
+    ] + [
+        (f'https://p3-aio.ecombdimg.com/obj/ecom-shop-material/img_{i}.png?x-expires=1700000000', None)
+        for i in range(12)
+    ] + [
+        (f'{base}/ffa/mshop/get_sub_peer_shop_list?_lid=123', {'data': {'peer_shop_list': [{'shop_id': '1'}]}}),
+        (f'{base}/business_chance_center/peer_shop_top_sale_goods_info?shop_id=1', {'data': {'list': products}}),
+        (f'{base}/business_chance_center/peer_shop_top_sale_goods_info?shop_id=2',
+         {'data': {'peer_shop_top_sale_goods_info_list': products}}),
+    ]
+
+
+def benchmark(number=20000):
+    """用模拟的页面流量对比两种实现的耗时"""
+    samples = benchmark_samples()
+    for name, fn in (('旧的子串判断+分支提取', _legacy_capture), ('预编译路由表', _route_capture)):
+        seconds = timeit.timeit(lambda: [fn(url, data) for url, data in samples], number=number)
+        per_call = seconds / (number * len(samples)) * 1e9
+        print(f"{name:<16} 总耗时 {seconds:.3f}s，每个响应 {per_call:.0f}ns")
+
+    rejected = sum(1 for url, _ in samples if match_route(url) is None)
+    print(f"📊 {len(samples)} 个模拟响应中有 {rejected} 个在一次匹配后直接丢弃，不再创建异步任务")
+
+    # 监听器层面：旧实现为每个响应创建一个任务，新实现只为匹配的响应创建任务
+    async def handle(url, data):
+        _legacy_capture(url, data)
+
+    async def dispatch(gated, rounds):
+        started_at = time.perf_counter()
+        for _ in range(rounds):
+            tasks = [
+                asyncio.create_task(handle(url, data))
+                for url, data in samples if not gated or match_route(url)
+            ]
+            await asyncio.gather(*tasks)
+        return time.perf_counter() - started_at
+
+    rounds = number // 10
+    for name, gated in (('每个响应都创建任务', False), ('先匹配再创建任务', True)):
+        seconds = asyncio.run(dispatch(gated, rounds))
+        per_call = seconds / (rounds * len(samples)) * 1e9
+        print(f"{name:<16} 总耗时 {seconds:.3f}s，每个响应 {per_call:.0f}ns")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+竞品多日趋势分析
+
+analyze_data.py 只看最近1天的数据，本模块把 products 表中累积的快照展开为每个产品
+最近N天的日序列（支付金额、增长率、曝光人数的区间中值），一次向量化计算得到：
+    速度     回看窗口内每天的平均变化量
+    加速度   本回看窗口与上一个回看窗口的速度之差（每天）
+    排名变化 按排名指标在店铺内和全市场的名次变化，正数表示名次上升
+并按店铺和全市场给出上升最快、下降最快的产品。
+
+快照只在指标变化时插入，未变化的日子只更新 last_seen_at，因此一条快照的值从
+采集当天一直有效到下一条快照；同一天有多条快照时取最新的一条。产品最后出现之后、
+店铺仍被采集到的日子视为产品已从榜单消失，各指标按0计，这类产品会出现在下降最快的列表中。
+
+依赖 pandas 和 numpy。单独运行时打印趋势报告：
+    python trend_analysis.py --days 90 --lookback 7 --metric pay_amount --top 10
+"""
+
+import argparse
+import datetime
+import gc
+
+import numpy as np
+import pandas as pd
+
+# product_db 会把项目根目录加入模块搜索路径
+import product_db
+from analyze_data import PRIMARY_QUERY_DIMS, TREND_DEFAULT_DAYS, TREND_DEFAULT_LOOKBACK, TREND_DEFAULT_TOP_N, \
+    TREND_METRICS, primary_query_dims
+
+# 指标名 -> products 表中的数值列
+METRICS = TREND_METRICS
+METRIC_LABELS = {
+    'pay_amount': '支付金额',
+    'growth': '增长率',
+    'impressions': '曝光人数',
+}
+
+DEFAULT_DAYS = TREND_DEFAULT_DAYS
+DEFAULT_LOOKBACK = TREND_DEFAULT_LOOKBACK
+DEFAULT_TOP_N = TREND_DEFAULT_TOP_N
+
+
+def window_start_day(days, end_day=None):
+    """返回N天窗口的第一天（包含结束日当天）"""
+    end_day = end_day or datetime.date.today()
+    return end_day - datetime.timedelta(days=days - 1)
+
+
+def load_snapshots(conn, days, end_day=None, query_dims=PRIMARY_QUERY_DIMS, shop_ids=None):
+    """读取窗口内有效的快照，只取计算趋势需要的列，按id升序返回
+
+    query_dims为None时使用主查询维度（见 analyze_data.primary_query_dims）。
+
+    按 (query_dims, last_seen_at) 范围扫描 idx_products_trend 覆盖索引，不回表读取名称、图片、
+    二维码等宽字段；排序在NumPy中完成，避免SQLite为 ORDER BY id 放弃覆盖索引。
+    """
+    start = window_start_day(days, end_day).strftime('%Y-%m-%d 00:00:00')
+    sql = (
+        "SELECT id, shop_id, product_id, substr(captured_at, 1, 10), substr(last_seen_at, 1, 10), "
+        + ', '.join(METRICS.values())
+        + " FROM products WHERE query_dims = ? AND last_seen_at >= ?"
+    )
+    params = [primary_query_dims(conn, query_dims), start]
+    if shop_ids:
+        sql += f" AND shop_id IN ({','.join('?' * len(shop_ids))})"
+        params.extend(shop_ids)
+
+    columns = ['id', 'shop_id', 'product_id', 'captured_day', 'seen_day'] + list(METRICS.values())
+    # 读取和转置几十万行时会创建大量元组，反复触发的循环垃圾回收占了大半耗时，期间暂时关闭
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+        # 按列构造比按行构造DataFrame快得多
+        values = dict(zip(columns, zip(*rows)))
+        del rows
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if not values:
+        return pd.DataFrame(columns=columns)
+
+    # 窗口内不同的日期只有N个，只解析去重后的日期字符串
+    day_codes, day_strings = pd.factorize(np.array(values['captured_day'], dtype=object))
+    seen_codes, seen_strings = pd.factorize(np.array(values['seen_day'], dtype=object))
+    snapshots = pd.DataFrame({
+        'id': np.array(values['id'], dtype=np.int64),
+        'shop_id': np.array(values['shop_id'], dtype=object),
+        'product_id': np.array(values['product_id'], dtype=object),
+        'captured_day': pd.to_datetime(day_strings, format='%Y-%m-%d')[day_codes],
+        'seen_day': pd.to_datetime(seen_strings, format='%Y-%m-%d')[seen_codes],
+        **{column: np.array(values[column], dtype=float) for column in METRICS.values()},
+    })
+    # 展开为日序列后同一天的多条快照中最新的一条排在最后
+    order = np.argsort(snapshots['id'].to_numpy(), kind='stable')
+    return snapshots.take(order).reset_index(drop=True)
+
+
+def build_daily_series(snapshots, days, end_day=None):
+    """把快照展开为日序列
+
+    返回 (keys, latest_ids, values)：keys 为每个产品的 (shop_id, product_id)，latest_ids 为每个产品
+    最新快照的id，values 形状为 (指标数, 产品数, 天数)。每条快照的值从采集当天开始生效，
+    直到下一条快照为止（未变化的日子只更新了 last_seen_at，没有采集到的日子沿用之前的值），
+    窗口开始前已有的快照从第一天开始生效，首次采集之前的日子为NaN。
+    产品最后出现(last_seen_at)之后到所在店铺最后一次被采集之间的日子为0：店铺仍在采集而
+    产品不再出现，说明产品已从榜单消失；店铺最后一次采集之后的日子尚无数据，沿用之前的值。
+    """
+    start_day = pd.Timestamp(window_start_day(days, end_day))
+    # 先分别编码店铺和产品，再对组合后的整数编码，比直接对字符串二元组编码快
+    shop_codes, shops = pd.factorize(snapshots['shop_id'])
+    product_codes, products = pd.factorize(snapshots['product_id'])
+    codes, combined = pd.factorize(shop_codes.astype(np.int64) * len(products) + product_codes)
+    keys = pd.MultiIndex.from_arrays([shops[combined // len(products)], products[combined % len(products)]])
+    product_count = len(keys)
+
+    day = np.clip((snapshots['captured_day'] - start_day).dt.days.to_numpy(), 0, days - 1)
+    cell = codes.astype(np.int64) * days + day
+
+    # 同一 (产品, 天) 有多条快照时保留最新的一条：倒序后取每个单元格第一次出现的位置
+    cells, first_pos = np.unique(cell[::-1], return_index=True)
+    source_rows = (len(cell) - 1) - first_pos
+
+    values = np.full((len(METRICS), product_count * days), np.nan)
+    for index, column in enumerate(METRICS.values()):
+        values[index, cells] = snapshots[column].to_numpy(dtype=float)[source_rows]
+    values = forward_fill(values.reshape(len(METRICS), product_count, days))
+
+    # 每个产品和每个店铺最后出现的日期（窗口内的天序号）
+    seen = np.clip((snapshots['seen_day'] - start_day).dt.days.to_numpy(), -1, days - 1)
+    product_seen = np.full(product_count, -1, dtype=np.int64)
+    np.maximum.at(product_seen, codes, seen)
+    product_shops = combined // len(products)
+    shop_seen = np.full(len(shops), -1, dtype=np.int64)
+    np.maximum.at(shop_seen, product_shops, product_seen)
+    day_numbers = np.arange(days)
+    gone = (day_numbers > product_seen[:, None]) & (day_numbers <= shop_seen[product_shops][:, None])
+    values[:, gone] = 0
+
+    # snapshots已按id升序，每个产品最后出现的行就是最新快照
+    latest_rows = np.full(product_count, -1, dtype=np.int64)
+    latest_rows[codes] = np.arange(len(codes))
+    latest_ids = snapshots['id'].to_numpy()[latest_rows]
+    return keys, latest_ids, values
+
+
+def forward_fill(values):
+    """沿最后一维（日期）用前一个有效值填充NaN"""
+    positions = np.where(np.isnan(values), 0, np.arange(values.shape[-1]))
+    np.maximum.accumulate(positions, axis=-1, out=positions)
+    return np.take_along_axis(values, positions, axis=-1)
+
+
+def compute_trends(conn, days=DEFAULT_DAYS, lookback=DEFAULT_LOOKBACK, rank_metric='pay_amount',
+                   end_day=None, query_dims=PRIMARY_QUERY_DIMS, shop_ids=None):
+    """计算窗口内每个产品的趋势指标，返回每个产品一行的DataFrame
+
+    列：shop_id, product_id, latest_id, 各指标的当前值/速度/加速度，
+    以及按 rank_metric 计算的 market_rank/market_rank_change/shop_rank/shop_rank_change。
+    """
+    if days < 2:
+        raise ValueError("趋势分析至少需要2天的窗口")
+    if rank_metric not in METRICS:
+        raise ValueError(f"不支持的排名指标: {rank_metric}，可选: {', '.join(METRICS)}")
+    # 回看窗口最多为窗口的一半，保证能计算加速度
+    lookback = max(1, min(lookback, (days - 1) // 2))
+
+    snapshots = load_snapshots(conn, days, end_day, query_dims, shop_ids)
+    if snapshots.empty:
+        return pd.DataFrame()
+    keys, latest_ids, values = build_daily_series(snapshots, days, end_day)
+
+    current = values[:, :, -1]
+    previous = values[:, :, -1 - lookback]
+    earlier = values[:, :, -1 - 2 * lookback]
+    velocity = (current - previous) / lookback
+    acceleration = (velocity - (previous - earlier) / lookback) / lookback
+
+    trends = pd.DataFrame({
+        'shop_id': keys.get_level_values(0),
+        'product_id': keys.get_level_values(1),
+        'latest_id': latest_ids,
+    })
+    for index, metric in enumerate(METRICS):
+        trends[metric] = current[index]
+        trends[f'{metric}_velocity'] = velocity[index]
+        trends[f'{metric}_acceleration'] = acceleration[index]
+
+    # 排名：1为最高，窗口开始时尚无数据的产品没有前一个名次
+    rank_index = list(METRICS).index(rank_metric)
+    trends['_previous'] = previous[rank_index]
+    by_shop = trends.groupby('shop_id')
+    trends['market_rank'] = trends[rank_metric].rank(ascending=False, method='min')
+    trends['market_rank_change'] = trends['_previous'].rank(ascending=False, method='min') - trends['market_rank']
+    trends['shop_rank'] = by_shop[rank_metric].rank(ascending=False, method='min')
+    trends['shop_rank_change'] = by_shop['_previous'].rank(ascending=False, method='min') - trends['shop_rank']
+    return trends.drop(columns='_previous')
+
+
+def top_movers(trends, metric='pay_amount', top_n=DEFAULT_TOP_N):
+    """按指标速度返回上升最快和下降最快的产品
+
+    返回 {'market': {'risers', 'fallers'}, 'shops': {shop_id: {'risers', 'fallers'}}}，
+    每项为按速度排序的DataFrame。
+    """
+    column = f'{metric}_velocity'
+    risers = trends[trends[column] > 0].sort_values(column, ascending=False, kind='stable')
+    fallers = trends[trends[column] < 0].sort_values(column, kind='stable')
+
+    shops = {}
+    for name, movers in (('risers', risers), ('fallers', fallers)):
+        for shop_id, group in movers.groupby('shop_id', sort=False).head(top_n).groupby('shop_id', sort=True):
+            shops.setdefault(shop_id, {'risers': movers.iloc[:0], 'fallers': movers.iloc[:0]})[name] = group
+    return {
+        'market': {'risers': risers.head(top_n), 'fallers': fallers.head(top_n)},
+        'shops': shops,
+    }
+
+
+def load_shop_names(conn):
+    return dict(conn.execute("SELECT shop_id, shop_name FROM shops"))
+
+
+def attach_names(conn, frame, shop_names=None):
+    """为要展示的产品补充名称和店铺名，只按最新快照id回表读取这些行"""
+    if frame.empty:
+        return frame.assign(product_name=pd.Series(dtype=object), shop_name=pd.Series(dtype=object))
+    ids = [int(latest_id) for latest_id in frame['latest_id']]
+    names = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        names.update(conn.execute(
+            f"SELECT id, product_name FROM products WHERE id IN ({','.join('?' * len(chunk))})", chunk
+        ))
+    shop_names = load_shop_names(conn) if shop_names is None else shop_names
+    return frame.assign(
+        product_name=[names.get(latest_id, '') for latest_id in ids],
+        shop_name=[shop_names.get(shop_id) or "未知店铺" for shop_id in frame['shop_id']],
+    )
+
+
+def print_movers(title, frame, metric, rank_column='market_rank_change'):
+    label = METRIC_LABELS[metric]
+    print(f"\n{title}")
+    print("-" * 120)
+    if frame.empty:
+        print("暂无数据")
+        return
+    print(f"{'序号':<4} {'店铺名称':<20} {'产品名称':<40} {label:>12} {'速度/天':>12} {'加速度':>10} {'排名变化':>8}")
+    for i, row in enumerate(frame.itertuples(index=False), 1):
+        rank_change = getattr(row, rank_column)
+        rank_change = '-' if pd.isna(rank_change) else f"{rank_change:+.0f}"
+        print(f"{i:<4} {row.shop_name[:20]:<22} {row.product_name[:40]:<42} {getattr(row, metric):>12.1f} "
+              f"{getattr(row, f'{metric}_velocity'):>+12.1f} {getattr(row, f'{metric}_acceleration'):>+10.2f} {rank_change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="竞品多日趋势分析")
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help="分析窗口天数")
+    parser.add_argument('--lookback', type=int, default=DEFAULT_LOOKBACK, help="计算速度的回看天数")
+    parser.add_argument('--metric', choices=list(METRICS), default='pay_amount', help="排序和排名使用的指标")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_N, help="每个列表展示的产品数")
+    parser.add_argument('--shop', action='append', dest='shop_ids', help="只分析指定店铺ID，可重复")
+    args = parser.parse_args()
+
+    # 只读连接，与采集脚本同时运行时不争用写锁
+    from analyze_data import connect_to_database
+    conn = connect_to_database()
+    if not conn:
+        return
+    try:
+        started_at = datetime.datetime.now()
+        trends = compute_trends(conn, args.days, args.lookback, args.metric, shop_ids=args.shop_ids)
+        if trends.empty:
+            print(f"❌ 最近{args.days}天没有产品数据")
+            return
+        movers = top_movers(trends, args.metric, args.top)
+        elapsed = (datetime.datetime.now() - started_at).total_seconds() * 1000
+        print(f"📈 最近{args.days}天 {len(trends)} 个产品的趋势计算完成，耗时 {elapsed:.0f}ms")
+
+        label = METRIC_LABELS[args.metric]
+        shop_names = load_shop_names(conn)
+        for title, frame in ((f"🚀 全市场{label}上升最快", movers['market']['risers']),
+                             (f"📉 全市场{label}下降最快", movers['market']['fallers'])):
+            print_movers(title, attach_names(conn, frame, shop_names), args.metric)
+        for shop_id, shop_movers in movers['shops'].items():
+            print(f"\n🏪 店铺: {shop_names.get(shop_id) or '未知店铺'} (ID: {shop_id})")
+            print("=" * 120)
+            for title, frame in ((f"🚀 {label}上升最快", shop_movers['risers']),
+                                 (f"📉 {label}下降最快", shop_movers['fallers'])):
+                print_movers(title, attach_names(conn, frame, shop_names), args.metric, 'shop_rank_change')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+千川素材数据库(material_stats.db)的表结构和写入
+
+roi_sucai.py 每次捕获到计划的素材列表（/uni-promotion/material/list-required）时，
+把 statsData.rows 中每个素材的维度和指标作为一条时间序列记录批量写入 material_stats：
+    (plan_ad_id, material_key, ts) 唯一，同一次捕获重复写入时覆盖
+    material_key 优先取维度中的素材ID；没有ID时取素材名称，名称也没有时取维度JSON的哈希，
+    同名的不同视频、没有名称的素材不会互相覆盖
+    stat_date 为数据所属日期，接口返回的是当天截至 ts 的累计值
+    dimensions/metrics 保存原始JSON，新增的维度和指标不需要改表也不会丢失
+跨天的ROI问题直接查询本表，不需要重新抓取，参数可以是素材ID、素材名称或素材键，
+同名的不同素材分别列出：
+    python material_db.py "素材ID或名称" [计划ID]
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+# 获取脚本所在目录的绝对路径
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(SCRIPT_DIR, 'material_stats.db')
+
+# 当前表结构版本，记录在 PRAGMA user_version 中
+SCHEMA_VERSION = 3
+
+# 表中的数值列 -> (statsData 中对应的指标, 列类型)
+METRIC_COLUMNS = [
+    ('cost', 'statCostForRoi2', 'REAL'),
+    ('gmv', 'totalPayOrderGmvForRoi2', 'REAL'),
+    ('orders', 'totalPayOrderCountForRoi2', 'INTEGER'),
+    ('roi', 'totalPrepayAndPayOrderRoi2', 'REAL'),
+    ('show', 'productShowCountForRoi2', 'INTEGER'),
+    ('click', 'productClickCountForRoi2', 'INTEGER'),
+    ('ctr', 'productCvrRateForRoi2', 'REAL'),
+    ('convert_rate', 'productConvertRateForRoi2', 'REAL'),
+]
+MATERIAL_NAME_DIMENSION = 'roi2MaterialVideoName'
+# 维度中可能表示素材ID的字段，按优先级排列
+MATERIAL_ID_DIMENSIONS = ('roi2MaterialId', 'roi2MaterialVideoId', 'materialId', 'material_id', 'videoId')
+
+INSERT_SQL = f"""
+INSERT OR REPLACE INTO material_stats (
+    plan_ad_id, material_key, material_id, material_name, ts, stat_date,
+    {', '.join(f'"{column}"' for column, _, _ in METRIC_COLUMNS)}, dimensions, metrics
+) VALUES ({', '.join('?' * (len(METRIC_COLUMNS) + 8))})
+"""
+
+# 某个素材的历史ROI，按时间排序，只读按素材键的覆盖索引
+ROI_HISTORY_SQL = """
+SELECT plan_ad_id, ts, stat_date, roi, cost, gmv, orders
+FROM material_stats
+WHERE material_key = :material_key AND (:plan_ad_id IS NULL OR plan_ad_id = :plan_ad_id)
+ORDER BY ts
+"""
+
+# 素材ID、素材名称或素材键对应的全部素材键
+MATERIAL_KEYS_SQL = """
+SELECT material_key FROM material_stats WHERE material_name = :text
+UNION
+SELECT material_key FROM material_stats WHERE material_key IN (:text, 'id:' || :text)
+ORDER BY material_key
+"""
+
+
+def create_tables(conn):
+    """创建素材统计表和索引"""
+    metric_definitions = ''.join(f'\n        "{column}" {column_type},' for column, _, column_type in METRIC_COLUMNS)
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS material_stats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        plan_ad_id TEXT NOT NULL,
+        material_key TEXT NOT NULL,
+        material_id TEXT,
+        material_name TEXT NOT NULL,
+        ts TIMESTAMP NOT NULL,
+        stat_date TEXT,{metric_definitions}
+        dimensions TEXT,
+        metrics TEXT
+    )
+    ''')
+    # 跨计划查询某个素材的历史ROI时只读索引，不回表读取原始JSON
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_material_stats_key_ts '
+        'ON material_stats(material_key, ts, plan_ad_id, stat_date, roi, cost, gmv, orders)'
+    )
+    # 按素材名称查找对应的素材键
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_material_stats_name_key ON material_stats(material_name, material_key)'
+    )
+
+
+def ensure_schema(conn):
+    """创建表结构并执行尚未应用的迁移"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(material_stats)")}
+    if existing and version < 2:
+        # v1 以素材名称为唯一键，旧记录没有素材ID，以名称作为素材键
+        for name in ('material_key', 'material_id'):
+            if name not in existing:
+                conn.execute(f"ALTER TABLE material_stats ADD COLUMN {name} TEXT")
+        conn.execute("UPDATE material_stats SET material_key = 'name:' || material_name WHERE material_key IS NULL")
+        conn.execute('DROP INDEX IF EXISTS idx_material_stats_plan_material_ts')
+    if version < 3:
+        # v2 的历史ROI按素材名称查询，同名的不同素材会被合并
+        conn.execute('DROP INDEX IF EXISTS idx_material_stats_material_ts')
+    create_tables(conn)
+    # 同一计划同一素材的时间序列，同一次捕获重复写入时覆盖
+    conn.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_material_stats_plan_key_ts '
+        'ON material_stats(plan_ad_id, material_key, ts)'
+    )
+    if version < SCHEMA_VERSION:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+
+def connect(db_path=DB_PATH):
+    """打开数据库连接并确保表结构为最新版本"""
+    conn = sqlite3.connect(db_path)
+    ensure_schema(conn)
+    return conn
+
+
+def metric_value(metrics, key):
+    """取指标的数值，缺失或不是数字时返回None"""
+    value = (metrics.get(key) or {}).get('value')
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def dimension_value(dimensions, name):
+    """取维度的值，缺失或为空时返回None"""
+    item = dimensions.get(name) or {}
+    value = item.get('value', item.get('valueStr')) if isinstance(item, dict) else item
+    return None if value in (None, '') else str(value)
+
+
+def material_key(dimensions, material_id, material_name):
+    """素材的唯一键：素材ID > 素材名称 > 维度JSON的哈希"""
+    if material_id:
+        return f"id:{material_id}"
+    if material_name:
+        return f"name:{material_name}"
+    text = json.dumps(dimensions, ensure_ascii=False, sort_keys=True)
+    return f"dims:{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+
+def material_rows(plan_ad_id, rows, ts, stat_date):
+    """把 statsData.rows 转为 material_stats 的参数元组，同一素材键出现多次时保留最后一条"""
+    records = {}
+    for row in rows:
+        dimensions = row.get('dimensions', {})
+        metrics = row.get('metrics', {})
+        material_id = next(
+            (value for value in (dimension_value(dimensions, name) for name in MATERIAL_ID_DIMENSIONS) if value),
+            None
+        )
+        material_name = dimension_value(dimensions, MATERIAL_NAME_DIMENSION)
+        key = material_key(dimensions, material_id, material_name)
+        records[key] = (
+            str(plan_ad_id), key, material_id, material_name or 'Unknown', ts, stat_date,
+            *(metric_value(metrics, metric_key) for _, metric_key, _ in METRIC_COLUMNS),
+            json.dumps(dimensions, ensure_ascii=False, separators=(',', ':')),
+            json.dumps(metrics, ensure_ascii=False, separators=(',', ':')),
+        )
+    return list(records.values())
+
+
+def save_material_stats(conn, plan_ad_id, rows, ts, stat_date):
+    """在一个事务中批量写入一次捕获的全部素材，返回保存的素材数"""
+    records = material_rows(plan_ad_id, rows, ts, stat_date)
+    with conn:
+        conn.executemany(INSERT_SQL, records)
+    return len(records)
+
+
+def find_material_keys(conn, text):
+    """返回素材ID、素材名称或素材键对应的素材键列表，同名的不同素材各有一个键"""
+    return [row[0] for row in conn.execute(MATERIAL_KEYS_SQL, {'text': text})]
+
+
+def roi_history(conn, material_key, plan_ad_id=None):
+    """返回素材键的历史ROI [(计划ID, 时间, 日期, ROI, 花费, GMV, 订单)]，按时间排序"""
+    return conn.execute(
+        ROI_HISTORY_SQL, {'material_key': material_key, 'plan_ad_id': plan_ad_id}
+    ).fetchall()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("用法: python material_db.py 素材ID或名称 [计划ID]")
+        sys.exit(1)
+    conn = connect()
+    plan_ad_id = sys.argv[2] if len(sys.argv) > 2 else None
+    histories = [(key, roi_history(conn, key, plan_ad_id)) for key in find_material_keys(conn, sys.argv[1])]
+    conn.close()
+    histories = [(key, history) for key, history in histories if history]
+    if not histories:
+        print(f"❌ 未找到素材 {sys.argv[1]} 的历史数据")
+    for key, history in histories:
+        print(f"🎬 素材 {key}")
+        for plan_ad_id, ts, stat_date, roi, cost, gmv, orders in history:
+            print(f"{ts}  计划 {plan_ad_id}  ROI: {roi if roi is not None else '-'}  花费: {cost if cost is not None else '-'}  "
+                  f"GMV: {gmv if gmv is not None else '-'}  订单: {orders if orders is not None else '-'}")
@@ -1,7 +1,22 @@
 import asyncio
 import json
-from playwright.async_api import async_playwright
+import math
+import os
+import sys
 from datetime import datetime
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlsplit, urlunsplit
+
+# 将项目根目录加入模块搜索路径，以便复用common下的公共模块
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.append(PROJECT_DIR)
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from common.browser_launcher import open_browser, timed_goto
+from common.http_client import replayable_headers
+from common.rate_limiter import AdaptiveBackoff, TokenBucket
+import material_db
 
 # 动态获取今天的日期
 today = datetime.now().strftime('%Y-%m-%d')
@@ -24,60 +39,305 @@ def generate_today_urls():
         today_urls.append(today_url)
     return today_urls
 
+# 从计划URL中取出计划ID(adId)
+def plan_ad_id(url):
+    return parse_qs(urlsplit(url).query).get('adId', [''])[0]
+
 # 定义要抓取的URL列表
 DEFAULT_URLS = generate_today_urls()  # 使用动态生成的今天URL列表
-# 用于存储每个计划的报告数据
-reports_data = []
-report_counter = 0
-
-# 处理响应的函数
-async def handle_response(response):
-    global report_counter
-    url = response.url
-    # URL条件判断
-    if "/uni-promotion/material/list-required" in url:
+# 素材列表接口
+MATERIAL_LIST_URL_PATTERN = "/uni-promotion/material/list-required"
+# 同时打开的计划页面数，以及等待单个计划素材列表响应的超时（秒），可通过环境变量调整
+DEFAULT_CONCURRENCY = int(os.environ.get('ROI_CONCURRENCY', '4'))
+RESPONSE_TIMEOUT = float(os.environ.get('ROI_RESPONSE_TIMEOUT', '60'))
+# 请求中可能表示计划ID的参数名
+AD_ID_FIELDS = ('adId', 'ad_id', 'adIds', 'ad_ids')
+
+# 计划页面只加载第一页素材（每页10条），捕获到的素材列表请求作为模板回放，取回全部素材：
+# 先以 REPLAY_PAGE_SIZE 重新请求第一页，响应带总数时并发请求其余各页，否则逐页请求直到取完。
+# 所有计划的回放请求共用一个令牌桶限速，遇到限流时自适应退避
+REPLAY_PAGE_SIZE = int(os.environ.get('ROI_REPLAY_PAGE_SIZE', '100'))
+REPLAY_MAX_PAGES = int(os.environ.get('ROI_REPLAY_MAX_PAGES', '50'))
+REPLAY_REQUESTS_PER_SECOND = float(os.environ.get('ROI_REQUESTS_PER_SECOND', '2'))
+REPLAY_MAX_ATTEMPTS = 3
+# 请求中可能表示页码、每页条数的参数名，以及响应中可能表示素材总数的字段名。
+# 请求体中只在顶层和 PAGER_CONTAINERS 分页对象中查找页码参数，不会改写其它嵌套对象中的同名字段
+PAGE_FIELDS = ('page', 'pageNo', 'page_no', 'pageNum', 'page_num')
+PAGE_SIZE_FIELDS = ('pageSize', 'page_size')
+PAGER_CONTAINERS = ('page_info', 'pageInfo', 'pagination', 'pager', 'paging')
+TOTAL_FIELDS = ('total', 'totalCount', 'total_count', 'totalNum')
+
+# 收集请求中的计划ID：URL查询参数和JSON请求体（含嵌套对象）中的 adId/adIds 等字段
+def request_ad_ids(request):
+    ad_ids = set()
+    for name, values in parse_qs(urlsplit(request.url).query).items():
+        if name in AD_ID_FIELDS:
+            ad_ids.update(value for value in values if value)
+    try:
+        body = json.loads(request.post_data or '')
+    except ValueError:
+        body = None
+    pending = [body]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, dict):
+            for name, value in item.items():
+                if name in AD_ID_FIELDS:
+                    values = value if isinstance(value, list) else [value]
+                    ad_ids.update(str(value) for value in values if value not in (None, ''))
+                else:
+                    pending.append(value)
+        elif isinstance(item, list):
+            pending.extend(item)
+    return ad_ids
+
+# 判断响应是否为指定计划的素材列表：请求中带有计划ID时必须一致；
+# 请求中没有计划ID时，每个页面只打开一个计划，页面内的素材列表即属于该计划
+def is_plan_response(response, ad_id):
+    if MATERIAL_LIST_URL_PATTERN not in response.url:
+        return False
+    ad_ids = request_ad_ids(response.request)
+    return not ad_ids or ad_id in ad_ids
+
+# 在嵌套的JSON对象中查找第一个名为names之一的字段，返回键路径，找不到返回None
+def find_path(item, names):
+    if not isinstance(item, dict):
+        return None
+    for name in names:
+        if name in item:
+            return [name]
+    for key, value in item.items():
+        path = find_path(value, names)
+        if path:
+            return [key] + path
+    return None
+
+# 在请求体的顶层和分页对象中查找第一个名为names之一的数值字段，返回键路径，找不到返回None
+def find_pager_path(body, names):
+    if not isinstance(body, dict):
+        return None
+    for container in [None] + [key for key in PAGER_CONTAINERS if isinstance(body.get(key), dict)]:
+        item = body if container is None else body[container]
+        for name in names:
+            if name in item and not isinstance(item[name], (dict, list)):
+                return [name] if container is None else [container, name]
+    return None
+
+def get_path(item, path):
+    for key in path:
+        item = item[key]
+    return item
+
+# 返回把路径上的字段替换为value后的副本，原值为字符串时保持字符串
+def set_path(item, path, value):
+    if len(path) == 1:
+        return {**item, path[0]: str(value) if isinstance(item[path[0]], str) else value}
+    return {**item, path[0]: set_path(item[path[0]], path[1:], value)}
+
+# 记录素材列表请求，作为回放模板
+def request_template(request):
+    try:
+        body = json.loads(request.post_data or '')
+    except ValueError:
+        body = None
+    return {
+        'url': request.url,
+        'method': request.method,
+        'headers': replayable_headers(request.headers),
+        'body': body if isinstance(body, dict) else None,
+        'post_data': request.post_data,
+    }
+
+# 读取模板中的页码和每页条数 (页码, 每页条数)，页码参数可能在URL查询串或JSON请求体中，没有时为None
+def template_pagination(template):
+    values = {}
+    for name, value in parse_qsl(urlsplit(template['url']).query, keep_blank_values=True):
+        for key, fields in (('page', PAGE_FIELDS), ('size', PAGE_SIZE_FIELDS)):
+            if name in fields and str(value).isdigit():
+                values.setdefault(key, int(value))
+    for key, fields in (('page', PAGE_FIELDS), ('size', PAGE_SIZE_FIELDS)):
+        path = find_pager_path(template['body'], fields)
+        if key not in values and path and str(get_path(template['body'], path)).isdigit():
+            values[key] = int(get_path(template['body'], path))
+    return values.get('page'), values.get('size')
+
+# 生成指定页码和每页条数的请求URL和请求体
+def build_page_request(template, page_no, page_size):
+    parts = urlsplit(template['url'])
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    for i, (name, value) in enumerate(query):
+        if name in PAGE_FIELDS:
+            query[i] = (name, str(page_no))
+        elif name in PAGE_SIZE_FIELDS:
+            query[i] = (name, str(page_size))
+    url = urlunsplit(parts._replace(query=urlencode(query)))
+    body = template['body']
+    if body is None:
+        return url, template['post_data']
+    for fields, value in ((PAGE_FIELDS, page_no), (PAGE_SIZE_FIELDS, page_size)):
+        path = find_pager_path(body, fields)
+        if path:
+            body = set_path(body, path, value)
+    return url, json.dumps(body, ensure_ascii=False)
+
+def stats_rows(data):
+    return (((data or {}).get('data') or {}).get('statsData') or {}).get('rows') or []
+
+# 响应中的素材总数，没有时返回None
+def stats_total(data):
+    inner = (data or {}).get('data')
+    path = find_path(inner, TOTAL_FIELDS)
+    total = get_path(inner, path) if path else None
+    return int(total) if str(total).isdigit() else None
+
+# 回放一页素材列表，返回响应数据，多次失败后返回None
+async def fetch_material_page(requester, template, page_no, page_size, bucket, backoff):
+    url, body = build_page_request(template, page_no, page_size)
+    for attempt in range(1, REPLAY_MAX_ATTEMPTS + 1):
         try:
-            # 尝试获取JSON响应
+            # 等待退避期结束并获取令牌
+            await backoff.wait()
+            await bucket.acquire()
+            if template['method'] == 'GET':
+                response = await requester.get(url, headers=template['headers'])
+            else:
+                response = await requester.post(url, data=body, headers=template['headers'])
+            # 限流或服务端错误：降低速率并退避后重试
+            if response.status == 429 or response.status >= 500:
+                delay = backoff.on_throttle()
+                print(f"⚠️  第 {page_no} 页素材请求被限流/服务端错误 (HTTP {response.status})，"
+                      f"速率降至 {bucket.rate:.2f}/秒，退避 {delay:.1f} 秒")
+                continue
+            if response.status != 200:
+                print(f"⚠️  第 {page_no} 页素材请求失败，状态码: {response.status}")
+                return None
             data = await response.json()
-            report_counter += 1
-            print(f"✅ 成功捕获计划 {report_counter} 响应数据 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            # 保存报告数据，稍后为每个计划生成独立报告
-            reports_data.append((report_counter, data))
+            backoff.on_success()
+            return data
         except Exception as e:
-            print(f"❌ 处理响应时出错: {e}")
+            print(f"❌ 第 {page_no} 页素材请求出错 (第 {attempt} 次): {e}")
+            backoff.on_throttle()
+    return None
 
-# 主运行函数
-async def run(urls):
-    # 清空报告数据列表
-    global reports_data, report_counter
-    reports_data = []
-    report_counter = 0
-    
-    async with async_playwright() as p:
-        # 启动浏览器（使用Chrome配置）
-        browser = await p.chromium.launch_persistent_context(
-            user_data_dir="/Users/bairdweng/Library/Application Support/Google/Chrome/Default",
-            channel="chrome",
-            headless=False
-        )
-        page = await browser.new_page()
-
-        # 绑定response事件
-        page.on("response", lambda response: asyncio.create_task(handle_response(response)))
-
-        for i, url in enumerate(urls):
-            # 验证URL有效性
-            if not url.startswith(('http://', 'https://')):
-                print(f"❌ 计划 {i+1} URL无效: {url}")
-                continue
-            
-            print(f"🔹 开始访问计划 {i+1} - {url}")
-            await page.goto(url)
-            await asyncio.sleep(15)  # 等待网络请求触发
-            print(f"🔹 计划 {i+1} 访问完成")
+# 以捕获到的请求为模板取回计划的全部素材，返回去重后的素材列表（无法翻页时返回首屏的素材）
+async def fetch_all_rows(requester, template, data, bucket, backoff):
+    rows = stats_rows(data)
+    first_page, page_size = template_pagination(template)
+    if first_page is None or (page_size and len(rows) < page_size):
+        # 请求中没有页码参数，或首屏已经是全部素材
+        return rows
+    
+    # 先以较大的每页条数重新请求第一页；接口不接受时退回首屏的每页条数
+    pages = [data]
+    if page_size and REPLAY_PAGE_SIZE > page_size:
+        first = await fetch_material_page(requester, template, first_page, REPLAY_PAGE_SIZE, bucket, backoff)
+        if first is not None and len(stats_rows(first)) >= len(rows):
+            pages = [first]
+            page_size = REPLAY_PAGE_SIZE
+    # 接口可能把每页条数限制在比请求更小的值，按实际返回的条数计算页数
+    effective_size = len(stats_rows(pages[0])) or 1
+    if page_size and effective_size < page_size:
+        page_size = effective_size
+    total = stats_total(pages[0])
+    
+    if total is not None:
+        # 已知总数：其余各页并发请求，由令牌桶控制速率
+        page_count = min(REPLAY_MAX_PAGES, math.ceil(total / effective_size))
+        results = await asyncio.gather(*(
+            fetch_material_page(requester, template, page_no, page_size, bucket, backoff)
+            for page_no in range(first_page + 1, first_page + page_count)
+        ))
+        failed = sum(1 for result in results if result is None)
+        if failed:
+            print(f"⚠️  {failed} 页素材回放失败，素材列表可能不完整")
+        pages.extend(result for result in results if result is not None)
+    else:
+        # 未知总数：逐页请求，遇到空页、不足一页或与上一页相同时停止
+        previous = stats_rows(pages[0])
+        for page_no in range(first_page + 1, first_page + REPLAY_MAX_PAGES):
+            if len(previous) < effective_size:
+                break
+            result = await fetch_material_page(requester, template, page_no, page_size, bucket, backoff)
+            page_rows = stats_rows(result)
+            if not page_rows or page_rows == previous:
+                break
+            pages.append(result)
+            previous = page_rows
+    
+    # 相邻页之间可能因数据更新出现重复素材，按维度去重
+    all_rows = {}
+    for page in pages:
+        for row in stats_rows(page):
+            all_rows.setdefault(json.dumps(row.get('dimensions', {}), sort_keys=True), row)
+    return list(all_rows.values())
 
+# 打开一个计划页面并等待该计划的素材列表响应，返回 (计划序号, 计划ID, 响应数据, 捕获时间)，失败返回None
+async def fetch_plan(page, plan_num, url, bucket, backoff):
+    ad_id = plan_ad_id(url)
+    print(f"🔹 开始访问计划 {plan_num} (ID: {ad_id}) - {url}")
+    try:
+        # 先注册等待再导航，页面加载过程中发出的请求也能匹配到
+        async with page.expect_response(
+            lambda response: is_plan_response(response, ad_id), timeout=RESPONSE_TIMEOUT * 1000
+        ) as response_info:
+            await timed_goto(page, url)
+        response = await response_info.value
+        data = await response.json()
+        # 首屏只有第一页素材，回放请求取回其余素材后替换
+        first_rows = len(stats_rows(data))
+        rows = await fetch_all_rows(page.request, request_template(response.request), data, bucket, backoff)
+        data.setdefault('data', {}).setdefault('statsData', {})['rows'] = rows
+        if len(rows) > first_rows:
+            print(f"📄 计划 {plan_num} 首屏 {first_rows} 个素材，分页回放后共 {len(rows)} 个")
+    except PlaywrightTimeoutError:
+        print(f"❌ 计划 {plan_num} 在 {RESPONSE_TIMEOUT:.0f} 秒内未返回素材列表")
+        return None
+    except Exception as e:
+        print(f"❌ 处理计划 {plan_num} 响应时出错: {e}")
+        return None
+    captured_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    print(f"✅ 成功捕获计划 {plan_num} 响应数据 - {captured_at}")
+    # 只有请求中明确带有该计划ID的响应才能确定所属计划，否则只生成报告，不以计划ID入库
+    if ad_id not in request_ad_ids(response.request):
+        print(f"⚠️  计划 {plan_num} 的素材列表请求中没有计划ID，无法确认所属计划，不写入数据库")
+        ad_id = None
+    return plan_num, ad_id, data, captured_at
+
+# 主运行函数：用 concurrency 个页面并行访问计划，每个页面依次处理队列中的计划
+async def run(urls, concurrency=DEFAULT_CONCURRENCY):
+    plans = asyncio.Queue()
+    for i, url in enumerate(urls, 1):
+        # 验证URL有效性
+        if not url.startswith(('http://', 'https://')):
+            print(f"❌ 计划 {i} URL无效: {url}")
+            continue
+        plans.put_nowait((i, url))
+    
+    reports_data = []
+    bucket = TokenBucket(REPLAY_REQUESTS_PER_SECOND)
+    backoff = AdaptiveBackoff(bucket)
+    
+    async def worker(context):
+        page = await context.new_page()
+        try:
+            while not plans.empty():
+                plan_num, url = plans.get_nowait()
+                result = await fetch_plan(page, plan_num, url, bucket, backoff)
+                if result:
+                    reports_data.append(result)
+        finally:
+            await page.close()
+    
+    # 使用共用启动器：默认无头模式并导入已导出的登录态
+    async with open_browser() as context:
+        workers = min(concurrency, plans.qsize())
+        print(f"⚙️  并行页面数: {workers}，单个计划等待响应最多 {RESPONSE_TIMEOUT:.0f} 秒")
+        await asyncio.gather(*(worker(context) for _ in range(workers)))
         print("✅ 所有计划访问完成")
-        await browser.close()
+    
+    # 按计划序号输出报告
+    reports_data.sort(key=lambda report: report[0])
+    save_reports_to_db([(ad_id, data, captured_at) for _, ad_id, data, captured_at in reports_data if ad_id])
     
     # 为每个计划生成报告并合并到一个文件
     print(f"\n📊 开始生成 {len(reports_data)} 个计划的报告...")
@@ -91,7 +351,7 @@ async def run(urls):
     all_reports.append("\n")
     
     # 生成并收集每个计划的报告
-    for plan_num, data in reports_data:
+    for plan_num, _, data, _ in reports_data:
         print(f"\n\n===========================================")
         print(f"📋 计划 {plan_num} 报告")
         print("===========================================")
@@ -112,6 +372,25 @@ async def run(urls):
     if not reports_data:
         print("❌ 未捕获到任何计划的响应数据")
 
+# 把每个计划捕获到的素材数据批量写入 material_stats.db，跨天的ROI可以直接查询
+def save_reports_to_db(reports):
+    if not reports:
+        return
+    try:
+        conn = material_db.connect()
+    except Exception as e:
+        print(f"❌ 打开素材数据库失败: {e}")
+        return
+    try:
+        saved = 0
+        for ad_id, data, captured_at in reports:
+            saved += material_db.save_material_stats(conn, ad_id, stats_rows(data), captured_at, today)
+        print(f"💾 已将 {len(reports)} 个计划的 {saved} 个素材数据写入数据库: {material_db.DB_PATH}")
+    except Exception as e:
+        print(f"❌ 写入素材数据库失败: {e}")
+    finally:
+        conn.close()
+
 # 简单运行函数（无需定时任务）
 async def main():
     global DEFAULT_URLS
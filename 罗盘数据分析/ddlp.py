@@ -45,7 +45,8 @@
     对有销量的产品额外给予0.1分的加分，确保推荐结果更具实用性。
 
 注意事项：
-    1. 脚本默认使用Chrome浏览器和用户数据目录，可能需要根据实际情况修改user_data_dir路径
+    1. 脚本通过 common/browser_launcher 以无头模式启动浏览器，首次运行前需执行
+       python -m common.browser_launcher login 导出登录态（设置 DOUDIAN_HEADLESS=0 可切换到有界面模式）
     2. 首次运行时会自动创建数据库表结构
     3. 如需清除测试数据，可执行以下SQL命令：
        sqlite3 ddlp.db "DELETE FROM products; VACUUM;"
@@ -54,12 +55,34 @@
 import asyncio
 import aiosqlite
 import json
+import os
+import sys
 from datetime import datetime, timedelta
-from playwright.async_api import async_playwright
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# 将项目根目录加入模块搜索路径，以便复用common下的公共模块
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.append(PROJECT_DIR)
+
+from common.browser_launcher import open_browser, timed_goto
+from common.http_client import HTTP_CLIENT_AVAILABLE, ApiClient
 
 DB_FILE = "ddlp.db"
 OUTPUT_FILE = "ddlp.txt"
 
+# 罗盘商品卡片列表接口
+CARD_LIST_URL_PATTERN = "shop/product_card/channel_product/channel_product_card_list"
+# 页面首屏只加载第一页，捕获到的请求通过直连HTTP客户端回放后续分页，最多回放的页数
+REPLAY_MAX_PAGES = int(os.environ.get('DDLP_REPLAY_MAX_PAGES', '10'))
+# 请求中可能表示页码的参数名
+PAGE_PARAMS = ('page_no', 'page', 'page_num', 'pageNo')
+
+# 捕获到的商品卡片列表请求模板
+card_list_template = None
+# 本次运行提取到的全部商品（首屏和回放的各页），回放结束后一次写入 OUTPUT_FILE
+captured_products = []
+
 # 初始化数据库
 async def init_db():
     async with aiosqlite.connect(DB_FILE) as db:
@@ -186,7 +209,7 @@ async def handle_response(response, db):
         url = response.url
         
         # 只处理包含目标URL模式的响应，其他所有URL都跳过
-        TARGET_URL_PATTERN = "shop/product_card/channel_product/channel_product_card_list"
+        TARGET_URL_PATTERN = CARD_LIST_URL_PATTERN
         if TARGET_URL_PATTERN not in url:
             return
         
@@ -248,62 +271,7 @@ async def handle_response(response, db):
         
         # 提取商品列表数据 (只有获取到data后才执行)
         if data is not None:
-            products_data = []
-            
-            # 更通用的数据提取逻辑
-            if isinstance(data, dict):
-                print(f"🔍 检查JSON结构，寻找商品数据")
-                
-                # 方式1: 检查data中是否有直接的商品列表
-                if 'cell_info' in data:
-                    products_data = [{'cell_info': data['cell_info']}]
-                    print(f"✅ 找到直接的cell_info数据")
-                
-                # 方式2: 检查常见的列表字段
-                list_fields = ['items', 'list', 'product_list', 'data', 'products', 'result', 'contents']
-                for field in list_fields:
-                    if field in data:
-                        field_data = data[field]
-                        print(f"🔍 检查字段: {field}, 类型: {type(field_data).__name__}")
-                        if isinstance(field_data, list):
-                            print(f"🔍 {field} 包含 {len(field_data)} 个元素")
-                            for i, item in enumerate(field_data):
-                                if isinstance(item, dict):
-                                    if 'cell_info' in item:
-                                        products_data.append(item)
-                                        print(f"✅ 从{field}[{i}]中提取到cell_info")
-                                    else:
-                                        # 尝试从item构建cell_info
-                                        cell_info = await build_cell_info_from_api(item)
-                                        if cell_info:
-                                            products_data.append({'cell_info': cell_info})
-                                            print(f"✅ 从{field}[{i}]项构建cell_info")
-                                # 每10个元素打印一次进度
-                                elif i % 10 == 0 and len(field_data) > 20:
-                                    print(f"🔍 处理 {field} 中的元素 {i}/{len(field_data)}")
-                        elif isinstance(field_data, dict) and 'cell_info' in field_data:
-                            products_data.append(field_data)
-                            print(f"✅ 从{field}字典中提取到cell_info")
-                
-                # 方式3: 深度搜索JSON中所有可能的cell_info
-                if not products_data:
-                    print("🔍 执行深度搜索寻找cell_info")
-                    products_data = await deep_search_cell_info(data)
-            
-            # 只处理实际提取到的数据
-                if products_data:
-                    print(f"✅ 成功提取到 {len(products_data)} 个商品数据")
-                else:
-                    print("⚠️  未从API响应中提取到商品数据，跳过数据处理")
-                    return
-            
-            # 保存商品数据到数据库
-            await save_products_to_db(products_data)
-            print(f"✅ 商品数据已保存到数据库")
-            
-            # 保存商品数据到文件
-            await save_products_to_file(products_data)
-            print(f"✅ 商品数据已保存到文件")
+            await process_product_card_data(data)
     except Exception as e:
         print(f"❌ handle_response函数执行出错: {str(e)}")
         # 记录详细的错误信息，便于调试
@@ -312,6 +280,151 @@ async def handle_response(response, db):
         # 出错时确保函数正常返回，不影响后续执行
         return
 
+# 从商品卡片接口的JSON数据中提取商品并保存，返回提取到的商品数
+# 商品卡片中的商品ID，结构不符时返回None
+def card_product_id(product):
+    try:
+        return product['cell_info']['product']['product_id_value']['value']['value_str']
+    except (KeyError, TypeError):
+        return None
+
+# 从API响应中提取商品卡片列表
+async def extract_product_card_data(data):
+    products_data = []
+    
+    # 更通用的数据提取逻辑
+    if isinstance(data, dict):
+        print(f"🔍 检查JSON结构，寻找商品数据")
+        
+        # 方式1: 检查data中是否有直接的商品列表
+        if 'cell_info' in data:
+            products_data = [{'cell_info': data['cell_info']}]
+            print(f"✅ 找到直接的cell_info数据")
+        
+        # 方式2: 检查常见的列表字段
+        list_fields = ['items', 'list', 'product_list', 'data', 'products', 'result', 'contents']
+        for field in list_fields:
+            if field in data:
+                field_data = data[field]
+                print(f"🔍 检查字段: {field}, 类型: {type(field_data).__name__}")
+                if isinstance(field_data, list):
+                    print(f"🔍 {field} 包含 {len(field_data)} 个元素")
+                    for i, item in enumerate(field_data):
+                        if isinstance(item, dict):
+                            if 'cell_info' in item:
+                                products_data.append(item)
+                                print(f"✅ 从{field}[{i}]中提取到cell_info")
+                            else:
+                                # 尝试从item构建cell_info
+                                cell_info = await build_cell_info_from_api(item)
+                                if cell_info:
+                                    products_data.append({'cell_info': cell_info})
+                                    print(f"✅ 从{field}[{i}]项构建cell_info")
+                        # 每10个元素打印一次进度
+                        elif i % 10 == 0 and len(field_data) > 20:
+                            print(f"🔍 处理 {field} 中的元素 {i}/{len(field_data)}")
+                elif isinstance(field_data, dict) and 'cell_info' in field_data:
+                    products_data.append(field_data)
+                    print(f"✅ 从{field}字典中提取到cell_info")
+        
+        # 方式3: 深度搜索JSON中所有可能的cell_info
+        if not products_data:
+            print("🔍 执行深度搜索寻找cell_info")
+            products_data = await deep_search_cell_info(data)
+    
+    # 只处理实际提取到的数据
+        if products_data:
+            print(f"✅ 成功提取到 {len(products_data)} 个商品数据")
+        else:
+            print("⚠️  未从API响应中提取到商品数据，跳过数据处理")
+    return products_data
+
+# 保存一页商品数据到数据库，并加入本次运行的商品列表，返回商品数
+async def store_products(products_data):
+    if not products_data:
+        return 0
+    await save_products_to_db(products_data)
+    print(f"✅ 商品数据已保存到数据库")
+    captured_products.extend(products_data)
+    return len(products_data)
+
+async def process_product_card_data(data):
+    return await store_products(await extract_product_card_data(data))
+
+# 记录第一个商品卡片列表请求，作为直连回放的模板
+def capture_card_list_request(request):
+    global card_list_template
+    if card_list_template is None and CARD_LIST_URL_PATTERN in request.url:
+        card_list_template = {
+            'url': request.url,
+            'method': request.method,
+            'headers': dict(request.headers),
+            'post_data': request.post_data,
+        }
+
+# 生成指定页码的请求URL和请求体，页码参数可能在URL查询串或JSON请求体中
+def build_page_request(template, page_no):
+    parts = urlsplit(template['url'])
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    for i, (name, value) in enumerate(query):
+        if name in PAGE_PARAMS:
+            query[i] = (name, str(page_no))
+            return urlunsplit(parts._replace(query=urlencode(query))), template['post_data']
+    try:
+        body = json.loads(template['post_data'] or '')
+    except ValueError:
+        return None
+    if isinstance(body, dict):
+        for name in PAGE_PARAMS:
+            if name in body:
+                return template['url'], json.dumps({**body, name: page_no}, ensure_ascii=False)
+    return None
+
+# 通过直连HTTP客户端回放商品卡片列表的后续分页，返回回放得到的商品数
+async def replay_card_list_pages(context, template):
+    if not HTTP_CLIENT_AVAILABLE:
+        print("💡 未安装httpx，跳过分页回放（pip install httpx h2 可启用直连HTTP模式）")
+        return 0
+    if build_page_request(template, 2) is None:
+        print("⚠️  商品卡片列表请求中没有页码参数，跳过分页回放")
+        return 0
+    
+    total = 0
+    # 接口忽略页码参数时每页都相同，与上一页的商品ID一致即停止，避免重复入库
+    previous_ids = [card_product_id(product) for product in captured_products]
+    async with await ApiClient.from_context(context, headers=template['headers']) as client:
+        for page_no in range(2, REPLAY_MAX_PAGES + 1):
+            url, body = build_page_request(template, page_no)
+            try:
+                response = await client.request(template['method'], url, data=body, headers=template['headers'])
+                if response.status != 200:
+                    print(f"⚠️  回放第 {page_no} 页失败，状态码: {response.status}")
+                    break
+                products_data = await extract_product_card_data(await response.json())
+                page_ids = [card_product_id(product) for product in products_data]
+                if products_data and page_ids == previous_ids:
+                    print(f"🔁 回放第 {page_no} 页与上一页相同，停止分页回放")
+                    break
+                count = await store_products(products_data)
+            except Exception as e:
+                # 请求失败、响应不是JSON或数据格式不符时停止回放，已入库的前几页照常参与分析
+                print(f"⚠️  回放第 {page_no} 页出错，停止分页回放: {e}")
+                break
+            print(f"🔁 回放第 {page_no} 页，提取到 {count} 个商品")
+            if not count:
+                break
+            previous_ids = page_ids
+            total += count
+    return total
+
+# 回放商品卡片列表的后续分页，再把首屏和回放得到的全部商品一次写入文件，返回回放得到的商品数
+async def collect_card_list(context):
+    replayed = await replay_card_list_pages(context, card_list_template) if card_list_template else 0
+    if captured_products:
+        await save_products_to_file(captured_products)
+        print(f"✅ {len(captured_products)} 个商品数据已保存到文件")
+    return replayed
+
 # 从API数据构建cell_info结构（需要根据实际API格式调整）
 async def build_cell_info_from_api(product_data):
     """将API返回的商品数据转换为ddlp.txt格式的cell_info结构"""
@@ -380,29 +493,30 @@ async def analyze_products():
     
     await init_db()
     async with aiosqlite.connect(DB_FILE) as db:
-        async with async_playwright() as p:
+        # 使用共用启动器：默认无头模式并导入已导出的登录态，退出时自动关闭浏览器
+        async with open_browser() as context:
             try:
-                # 启动浏览器
-                browser = await p.chromium.launch_persistent_context(
-                    user_data_dir="/Users/bairdweng/Library/Application Support/Google/Chrome/Default",
-                    channel="chrome",
-                    headless=False
-                )
-                page = await browser.new_page()
+                page = await context.new_page()
                 
-                # 绑定响应事件处理器
+                # 绑定请求和响应事件处理器
+                page.on("request", capture_card_list_request)
                 page.on("response", lambda response: asyncio.create_task(
                     handle_response(response, response.url)))
                 
                 # 访问商品数据页面
                 target_url = "https://compass.jinritemai.com/shop/merchandise-traffic?from_page=%2Fshop%2Ftraffic-analysis&btm_ppre=a6187.b7716.c0.d0&btm_pre=a6187.b1854.c0.d0&btm_show_id=df90e96a-1e32-424b-9e9a-84a28feddaaf"
                 print(f"🌐 访问目标页面: {target_url}")
-                await page.goto(target_url)
+                await timed_goto(page, target_url)
                 
                 # 等待网络请求完成
                 print("⏳ 等待商品数据加载完成...")
                 await asyncio.sleep(30)  # 给足够时间加载数据
                 
+                # 首屏只有第一页数据，直接用HTTP客户端回放后续分页，不再经过浏览器
+                replayed = await collect_card_list(context)
+                if card_list_template:
+                    print(f"✅ 分页回放完成，共补充 {replayed} 个商品")
+                
                 # 检查是否已获取数据
                 print("🔄 检查是否已获取数据")
                 async with db.execute("SELECT COUNT(*) FROM products") as cursor:
@@ -411,9 +525,7 @@ async def analyze_products():
                         print("⚠️  未获取到实际数据，跳过数据分析")
                     else:
                         await perform_data_analysis()
-                
-                print("✅ 关闭浏览器")
-                await browser.close()
+
                 
                 # 只有在成功获取数据后才执行数据分析
                 # 已在前面的检查中调用perform_data_analysis()